@@ -1,5 +1,5 @@
 # coding: utf8
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import os
@@ -8,9 +8,12 @@ from django.utils.encoding import iri_to_uri
 from string import replace
 import sys
 from django.utils.deconstruct import deconstructible
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
-from django.db.models import Avg, Sum
+from django.db.models import Avg, Sum, Q
+from ipt_connect.scoring import trimmed_means, trimmed_mean, fight_standings, podium_bonus, standing_values, FPT_RULE
+from django.core.cache import cache
+from ipt_connect import api
 
 # Parameters
 npf = 3					# Number of Physics fights
@@ -18,12 +21,30 @@ with_final_pf = False	# Is there a Final Fight ?
 reject_malus = 0.4		# Malus for too many rejections
 npfreject_max = 1		# Maximum number of tactical rejection (per fight)
 netreject_max = 1		# Maximum number of eternal rejection
+grade_rejection_rule = FPT_RULE	# Number of extreme jury grades discarded, see ipt_connect.scoring
 
 # Useful static variables
 pfs = [i+1 for i in range(npf)]
 npf_tot = npf + int(with_final_pf)
 grade_choices = [(ind, ind) for ind in range(10+1)]
 
+# the coefficients are keyed on the tournament data version: those of a team deleted, or of a database flushed or imported, are left behind with their version
+def prescoeffs_cache_key(team_pk, version=None):
+	return "FPT2017:prescoeffs:%s:%s" % (version or api.data_version('FPT2017'), team_pk)
+
+def invalidate_presentation_coefficients(teams):
+	"""
+	Remove the cached presentation coefficients of some teams, see Team.presentation_coefficients.
+
+	They are removed right away, for the current transaction to see the new coefficients. Once the transaction is committed, the new data version leaves the coefficients other requests cached in the meantime behind.
+
+	:param teams: list of Team primary keys, possibly None
+	"""
+	version = api.data_version('FPT2017')
+	keys = [prescoeffs_cache_key(team, version) for team in set(teams) if team is not None]
+	if keys:
+		cache.delete_many(keys)
+
 def mean(vec):
 	return float(sum(vec)) / max(len(vec),1)
 
@@ -169,20 +190,12 @@ class Participant(models.Model):
 				print "In %s, I was the %s" % (myround, role)
 
 			####### For FPT 2017 #######
-			# print roundgrades
-			ngrades = len(roundgrades)
+			# Remove lowest grade, and the highest grade too if there are 7 or more jury members
+			value = trimmed_mean(roundgrades, grade_rejection_rule)
 
-			# Remove lowest grade
-			roundgrades.pop(0)
-
-			# If there are 7 or more jury members, remove highest grade too
-			if ngrades >= 7 :
-				roundgrades.pop(-1)
-
-
-			average_grades.append({"value": mean(roundgrades), "round":myround, "role":role})
+			average_grades.append({"value": value, "round":myround, "role":role})
 			if verbose:
-				print '\tI scored %.2f points' % mean(roundgrades)
+				print '\tI scored %.2f points' % value
 
 		# return the average grade for all physics fight
 		return average_grades
@@ -397,10 +410,17 @@ class Team(models.Model):
 
 		The coefficient loses 0.2 points for every additional rejection. This penality is carried over all the subsequents rounds, but disappear for the Final
 
+		The coefficients are cached until the tournament data changes, and dropped right away when a rejection of the team is created, changed or deleted.
+
 		:param verbose: Verbosity flag
 		:return: Return a list with the coefficient for every round
 		"""
 
+		if not verbose:
+			prescoeffs = cache.get(prescoeffs_cache_key(self.pk))
+			if prescoeffs is not None:
+				return prescoeffs
+
 		eternalrejections = EternalRejection.objects.filter(round__reporter_team=self)
 
 		beforetactical = []
@@ -433,6 +453,8 @@ class Team(models.Model):
 		if with_final_pf:
 			prescoeffs.append(3.0)
 
+		cache.set(prescoeffs_cache_key(self.pk), prescoeffs, None)
+
 		return prescoeffs
 
 	# functions
@@ -440,89 +462,24 @@ class Team(models.Model):
 		"""
 		Check if the pfs where I played are complete, and return the according number of bonus points (2 if first, 1 if second, split equally if ex-aequo)
 
+		The points and ranks of the teams in every physics fight are kept in the fight standings, see FightStanding.
+
 		:param verbose: verbosity of the function
 		:param maxpf: maximum number of physics fight per round
 		:return: Return the number of bonus points
 		"""
 
-		# get all the rounds where my participants are involved in
-		rounds = Round.objects.filter(reporter_team=self) | Round.objects.filter(opponent_team=self) | Round.objects.filter(reviewer_team=self)
-		# mypfnumbers = [1, 2, 3]
+		standings = dict((standing.pf_number, standing) for standing in FightStanding.objects.filter(team=self, complete=True))
 
 		bonuspoints = []
 		for mypfnumber in pfs:
-			pfrounds = rounds.filter(pf_number=mypfnumber) # for a given round, I am always in the same room
-
-			# refine to match user params
-			if rounds != None:
-				pfrounds = [round for round in pfrounds if round in rounds]
-			elif roundnumber != None:
-				pfrounds = [round for round in rounds if round.pf_number == pfnumber]
-			else:
-				pass
-
-			assert len(pfrounds) <= maxround, "Team %s played %s rounds in Physics Fight %s. Check your database!" % (self.name, str(len(pfrounds)), str(mypfnumber))
-			if len(pfrounds) == maxround: # then all the fights are played
-				teams = [pfrounds[0].reporter.team, pfrounds[0].opponent.team, pfrounds[0].reviewer.team]
+			if mypfnumber in standings: # then all the fights are played
+				standing = standings[mypfnumber]
 				if verbose:
 					print "="*20, "Bonus Points", "="*20
-					print "PF %i opposes teams from %s, %s and %s" % (int(mypfnumber), teams[0].name, teams[1].name, teams[2].name)
-				results = []
-				for team in teams:
-					prescoeff = team.presentation_coefficients(verbose=False)
-					teampfpoints = 0
-					for participant in Participant.objects.filter(team=team):
-						average_grades = participant.compute_average_grades(pfnumber=mypfnumber, rounds=pfrounds, verbose=False)
-						for grade in average_grades:
-							if grade["role"] == "reporter":
-								teampfpoints += grade["value"] * prescoeff[grade["round"].pf_number - 1]
-							elif grade["role"] == "opponent":
-								teampfpoints += grade["value"] * 2.0
-							elif grade["role"] == "reviewer":
-								teampfpoints += grade["value"]
-							else:
-								print "Role undefined : %s" % grade["role"]
-								sys.exit()
-					if verbose:
-						print "Team %s gathered %.2f points in Physics Fight %i" % (team.name, teampfpoints, int(mypfnumber))
-					results.append({"name": team.name, "points": teampfpoints})
-
-				results = sorted(results, key=lambda x: x["points"])[::-1]
-
-				# Now finally give the bonus point
-				if verbose:
-					print "PF %i ranking:" % mypfnumber
-				for ind, result in enumerate(results):
-					if result["name"] == self.name:
-						# If everyone is ex-aequo
-						if results[0]["points"] == results[1]["points"] and results[1]["points"] == results[2]["points"]:
-							bonuspoint=1.0
-						# If 1 and 2 are ex-aequo
-						elif ind in [0,1] and results[0]["points"] == results[1]["points"]:
-							bonuspoint=1.5
-						# If I win the pf
-						elif ind==0 and results[1]["points"] < results[0]["points"]:
-							bonuspoint=2.0
-						# If 2 and 3 are ex-aequo
-						elif ind in [1,2] and results[1]["points"] == results[2]["points"]:
-							bonuspoint=0.5
-						# If I am second
-						elif ind==1 and results[1]["points"] > results[2]["points"]:
-							bonuspoint=1.0
-						# all the rest got nothing
-						else:
-							bonuspoint=0.0
-
-					if verbose:
-						msg = "\t%i) Team %s -- %.2f points" % (ind+1, result["name"], result["points"])
-						if result["name"] == self.name:
-							print '\x1b[32m%s\x1b[0m' % msg
-
-						else:
-							print msg
-				if verbose:
-					print "On top of that, team %s wins %.1f additional bonus point(s)" % (self.name, bonuspoint)
-				bonuspoints.append(bonuspoint)
+					print "In PF %i, team %s gathered %.2f points and is ranked %i in its room" % (mypfnumber, self.name, standing.points, standing.rank)
+					print "On top of that, team %s wins %.1f additional bonus point(s)" % (self.name, standing.bonus_points)
+				bonuspoints.append(standing.bonus_points)
 
 			else:  # Not all the rounds are played, I skip
 				if verbose:
@@ -531,7 +488,6 @@ class Team(models.Model):
 
 		return bonuspoints
 
-
 	def points(self, pfnumber=None, rounds=None, verbose=False, bonuspoints=False):
 		"""
 		I get all the participants that are in my team and sum their average grades, multiplied by their roles.
@@ -777,29 +733,14 @@ class Round(models.Model):
 		jurygrades = JuryGrade.objects.filter(round=self)
 		print "Update scores for", self
 
-		reporter_grades = list(sorted([jurygrade.grade_reporter for jurygrade in jurygrades]))
-		opponent_grades = list(sorted([jurygrade.grade_opponent for jurygrade in jurygrades]))
-		reviewer_grades = list(sorted([jurygrade.grade_reviewer for jurygrade in jurygrades]))
+		grades = [(jurygrade.grade_reporter, jurygrade.grade_opponent, jurygrade.grade_reviewer) for jurygrade in jurygrades]
 
 		####### For FPT 2017 #######
-		# print roundgrades
-		ngrades = len(reporter_grades)
+		ngrades = len(grades)
 
 		if ngrades > 1 :
-			# Remove lowest grade
-			reporter_grades.pop(0)
-			opponent_grades.pop(0)
-			reviewer_grades.pop(0)
-
-			# If there are 7 or more jury members, remove highest grade too
-			if ngrades >= 7 :
-				reporter_grades.pop(-1)
-				opponent_grades.pop(-1)
-				reviewer_grades.pop(-1)
-
-			self.score_reporter = mean(reporter_grades)
-			self.score_opponent = mean(opponent_grades)
-			self.score_reviewer = mean(reviewer_grades)
+			# Remove lowest grade, and the highest grade too if there are 7 or more jury members
+			(self.score_reporter, self.score_opponent, self.score_reviewer) = trimmed_means(grades, grade_rejection_rule)
 
 			prescoeff = self.reporter_team.presentation_coefficients()[self.pf_number-1]
 			# print prescoeff
@@ -963,6 +904,43 @@ class EternalRejection(models.Model):
 	def __unicode__(self):
 		return "Problem rejected : %s" % self.problem
 
+class FightStanding(models.Model):
+	"""
+	Points, rank and bonus points of a team in a Physics Fight, kept up to date whenever a round is saved or deleted (see update_standings)
+	"""
+
+	team = models.ForeignKey(Team)
+	pf_number = models.IntegerField()
+	room = models.ForeignKey(Room)
+	points = models.FloatField(default=0.0)
+	rank = models.IntegerField(default=1)
+	bonus_points = models.FloatField(default=0.0)
+	complete = models.BooleanField(default=False)	# are all the rounds of the fight played ?
+
+	class Meta:
+		ordering = ['pf_number', 'room', 'rank']
+
+	def __unicode__(self):
+		return "%s in Fight %i" % (self.team, self.pf_number)
+
+
+def update_standings(fights):
+	"""
+	Recompute and store the standings of some Physics Fights from their rounds, see scoring.fight_standings. The podium of every fight gets bonus points once all its rounds are played.
+
+	:param fights: list of (pf_number, room pk)
+	"""
+	fights = set(fights)
+	if not fights:
+		return
+	where = reduce(lambda q1, q2: q1 | q2, [Q(pf_number=pf, room=room) for pf, room in fights])
+
+	standings = [FightStanding(**standing) for standing in fight_standings(Round.objects.filter(where).values(*standing_values), podium_bonus)]
+
+	with transaction.atomic():
+		FightStanding.objects.filter(where).delete()
+		FightStanding.objects.bulk_create(standings)
+
 
 # method for updating Teams and Participants when rounds are saved
 # @receiver(pre_save, sender=Round, dispatch_uid="update_participant_team_points")
@@ -975,10 +953,38 @@ class EternalRejection(models.Model):
 # 		# In all cases, compute the round player's scores and total points
 # 		instance.update_scores()
 
+# the rejections of a round count for another team or physics fight when these are changed
+@receiver(pre_save, sender=Round, dispatch_uid="move_round")
+def move_round(sender, instance, raw=False, **kwargs):
+	if instance.pk is not None:
+		stored = Round.objects.filter(pk=instance.pk).values_list('reporter_team', 'pf_number', 'room').first()
+		if stored is not None and stored[:2] != (instance.reporter_team_id, instance.pf_number):
+			invalidate_presentation_coefficients([stored[0], instance.reporter_team_id])
+		# the standings of the fight the round leaves must be updated too
+		if stored is not None:
+			instance._stored_fight = stored[1:]
+
+# method for invalidating the presentation coefficients when rejections are changed
+@receiver(pre_save, sender=TacticalRejection, dispatch_uid="move_rejection")
+@receiver(pre_save, sender=EternalRejection, dispatch_uid="move_rejection")
+def move_rejection(sender, instance, raw=False, **kwargs):
+	if instance.pk is not None:
+		invalidate_presentation_coefficients(sender.objects.filter(pk=instance.pk).values_list('round__reporter_team', flat=True))
+
+@receiver(post_save, sender=TacticalRejection, dispatch_uid="update_rejection")
+@receiver(post_save, sender=EternalRejection, dispatch_uid="update_rejection")
+@receiver(post_delete, sender=TacticalRejection, dispatch_uid="update_rejection")
+@receiver(post_delete, sender=EternalRejection, dispatch_uid="update_rejection")
+def update_rejection(sender, instance, **kwargs):
+	invalidate_presentation_coefficients(Round.objects.filter(pk=instance.round_id).values_list('reporter_team', flat=True))
+
 # method for updating Teams and Participants when rounds are saved
 @receiver(post_save, sender=Round, dispatch_uid="update_participant_team_points")
-def update_points(sender, instance, **kwargs):
+def update_points(sender, instance, raw=False, **kwargs):
 	print "YOLOOOO !!!"
+	if raw:
+		# loaded from a fixture (see import_sqlite), with its scores
+		return
 	if (instance.reporter_team is None) or (instance.opponent_team is None) or (instance.reviewer_team is None) or instance.problem_presented is None :
 		# then all teams aren't yet defined, there is no need to compute scores
 		pass
@@ -992,8 +998,17 @@ def update_points(sender, instance, **kwargs):
 		# and the problem mean scores
 		instance.problem_presented.update_scores()
 
+	# and the standings of the fights the round was and is in
+	update_standings([(instance.pf_number, instance.room_id), getattr(instance, '_stored_fight', (instance.pf_number, instance.room_id))])
+
+@receiver(post_delete, sender=Round, dispatch_uid="remove_standings")
+def remove_standings(sender, instance, **kwargs):
+	update_standings([(instance.pf_number, instance.room_id)])
+
 def update_all():
 	for team in Team.objects.all():
 		team.update_scores()
 	for pb in Problem.objects.all():
 		pb.update_scores()
+	FightStanding.objects.all().delete()
+	update_standings(Round.objects.values_list('pf_number', 'room').distinct())
@@ -8,6 +8,9 @@ from django.utils.encoding import iri_to_uri
 from string import replace
 import sys
 from django.utils.deconstruct import deconstructible
+from ipt_connect.scoring import trimmed_mean, discarded, IPT_RULE
+
+grade_rejection_rule = IPT_RULE	# Number of extreme jury grades discarded, see ipt_connect.scoring
 
 
 def mean(vec):
@@ -161,37 +164,16 @@ class Participant(models.Model):
 			# Example : 7 jury members --> /4 = 1.75 --> round = 2 --> reject 1 highest and 1 lowest marks
 
 
-			if len(roundgrades) in [5, 6]:
-				nreject = 1
-			elif len(roundgrades) in [7, 8]:
-				nreject = 2
-			else:
-				nreject = round(len(roundgrades) / 4.0)
-
-			if round(nreject / 2.0) == nreject / 2.0:
-				nlow = int(nreject / 2.0)
-				nhigh = int(nlow)
-			else:
-				nlow = int(nreject / 2.0 + 0.5)
-				nhigh = int(nreject / 2.0 - 0.5)
-
 			if verbose:
+				nlow, nhigh = discarded(grade_rejection_rule, len(roundgrades))
 				print "\t%i Jury Members graded me" % len(roundgrades)
 				print "\t%i lowest mark(s) and %i highest mark(s) are discarded"  % (nlow, nhigh)
 
-			i = 0
-			while i < nhigh:
-				roundgrades.pop(-1)
-				i += 1
-
-			i = 0
-			while i < nlow:
-				roundgrades.pop(0)
-				i += 1
+			value = trimmed_mean(roundgrades, grade_rejection_rule)
 
-			average_grades.append({"value": mean(roundgrades), "round":myround, "role":role})
+			average_grades.append({"value": value, "round":myround, "role":role})
 			if verbose:
-				print '\tI scored %.2f points' % mean(roundgrades)
+				print '\tI scored %.2f points' % value
 
 		# return the average grade for all physics fight
 		return average_grades
@@ -1,9 +1,11 @@
 # coding: utf8
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
 from models import *
 from django import forms
 from django.forms import widgets
+from ipt_connect.adminlists import ListAdmin, owned_team, watch_ownership
 
 
 class JuryGradeInline(admin.TabularInline):
@@ -21,10 +23,12 @@ class EternalRejectionInline(admin.TabularInline):
 	extra = 0
 
 
-class Roundadmin(admin.ModelAdmin):
+class Roundadmin(ListAdmin):
 
 	list_display = ('pf_number', 'round_number', 'room')
 	list_filter = ('pf_number', 'round_number', 'room')
+	list_select_related = ('room',)
+	list_only = ('pf_number', 'round_number', 'room', 'room__name')
 	fieldsets = [
 	('General Information', {'fields': [
 	 ('pf_number', "round_number", "room"), ("reporter_team", "opponent_team", "reviewer_team")]}),
@@ -61,39 +65,51 @@ class Roundadmin(admin.ModelAdmin):
 	# TODO: Display the full name+surname of the reporter, opponent and reviewer in the admin view
 
 
-class TeamAdmin(admin.ModelAdmin):
+class TeamAdmin(ListAdmin):
 
 	list_display = ('name','surname','IOC')
+	list_select_related = ('IOC',)
+	list_only = ('name','surname','IOC','IOC__username')
 	search_fields = ('name','IOC')
 
 
-class ParticipantAdmin(admin.ModelAdmin):
+class ParticipantAdmin(ListAdmin):
 
 	list_display = ('surname','name','team','affiliation','email','phone_number','role','gender','birthdate','veteran','diet','shirt_size','mixed_gender_accommodation','remark')
+	list_select_related = ('team',)
+	list_only = ('surname','name','team','affiliation','email','phone_number','role','gender','birthdate','veteran','diet','shirt_size','mixed_gender_accommodation','remark','team__name')
 	search_fields = ('surname','name')
 	list_filter = ('team','gender','role','veteran','diet','shirt_size','mixed_gender_accommodation')
 
 	def save_model(self, request, obj, form, change):
 		if not(request.user.is_superuser) and not(request.user.username == 'magnusson'):
-			u = User.objects.get(username = request.user.username)
-			obj.team = u.Team_IPT2017
+			obj.team_id = owned_team(request, Team)
+			if obj.team_id is None:
+				# a Team Leader managing no team has no participants to save
+				raise PermissionDenied("You do not manage any team.")
 			obj.save()
 		obj.save()
 
 	def get_queryset(self,request):
 		qs = super(ParticipantAdmin,self).get_queryset(request)
-		u = User.objects.get(username = request.user.username)
 		if request.user.is_superuser or request.user.username == 'magnusson':
 			return qs
-		return qs.filter(team = u.Team_IPT2017)
+		# the team managed by the user, resolved once per session
+		team = owned_team(request, Team)
+		if team is None:
+			return qs.none()
+		return qs.filter(team = team)
 
-class JuryAdmin(admin.ModelAdmin):
+class JuryAdmin(ListAdmin):
 
 	list_display = ('surname','name','team','affiliation','pf1','pf2','pf3','pf4','final','email','remark',)
+	list_select_related = ('team',)
+	list_only = ('surname','name','team','affiliation','pf1','pf2','pf3','pf4','final','email','remark','team__name')
 	list_filter = ('team','pf1','pf2','pf3','pf4','final',)
 	search_fields = ('surname','name','affiliation',)
 
 # Register your models here.
+watch_ownership(Team)
 admin.site.register(Team,TeamAdmin)
 admin.site.register(Participant,ParticipantAdmin)
 admin.site.register(Round, Roundadmin)
@@ -12,6 +12,7 @@ from django.dispatch import receiver
 from django.db.models import Avg, Sum
 from django.core.validators import RegexValidator
 from django.dispatch import Signal
+from ipt_connect.scoring import trimmed_means, IPT_RULE
 
 
 # Parameters
@@ -20,6 +21,7 @@ with_final_pf = True	# Is there a Final Fight ?
 reject_malus = 0.2		# Malus for too many rejections
 npfreject_max = 3		# Maximum number of tactical rejection (per fight)
 netreject_max = 1		# Maximum number of eternal rejection
+grade_rejection_rule = IPT_RULE	# Number of extreme jury grades discarded, see ipt_connect.scoring
 
 # Useful static variables
 pfs = [i+1 for i in range(npf)]
@@ -464,40 +466,11 @@ class Round(models.Model):
 		jurygrades = JuryGrade.objects.filter(round=self)
 		print "Update scores for", self
 
-		reporter_grades = list(sorted([jurygrade.grade_reporter for jurygrade in jurygrades]))
-		opponent_grades = list(sorted([jurygrade.grade_opponent for jurygrade in jurygrades]))
-		reviewer_grades = list(sorted([jurygrade.grade_reviewer for jurygrade in jurygrades]))
+		grades = [(jurygrade.grade_reporter, jurygrade.grade_opponent, jurygrade.grade_reviewer) for jurygrade in jurygrades]
 
-		ngrades = min(len(reporter_grades), len(opponent_grades), len(reviewer_grades))
+		ngrades = len(grades)
 		if ngrades > 1 :
-			for grades in [reporter_grades, opponent_grades, reviewer_grades]:
-				if len(grades) in [5, 6]:
-					nreject = 1
-				elif len(grades) in [7, 8]:
-					nreject = 2
-				else:
-					nreject = round(len(grades) / 4.0)
-
-				if round(nreject / 2.0) == nreject / 2.0:
-				   nlow = int(nreject / 2.0)
-				   nhigh = int(nlow)
-				else:
-				   nlow = int(nreject / 2.0 + 0.5)
-				   nhigh = int(nreject / 2.0 - 0.5)
-
-				i = 0
-				while i < nhigh:
-				   grades.pop(-1)
-				   i += 1
-
-				i = 0
-				while i < nlow:
-				   grades.pop(0)
-				   i += 1
-
-			self.score_reporter = mean(reporter_grades)
-			self.score_opponent = mean(opponent_grades)
-			self.score_reviewer = mean(reviewer_grades)
+			(self.score_reporter, self.score_opponent, self.score_reviewer) = trimmed_means(grades, grade_rejection_rule)
 
 			prescoeff = self.reporter_team.presentation_coefficients()[self.pf_number-1]
 
@@ -624,8 +597,11 @@ class EternalRejection(models.Model):
 
 # method for updating Teams and Participants when rounds are saved
 @receiver(post_save, sender=Round, dispatch_uid="update_participant_team_points")
-def update_points(sender, instance, **kwargs):
+def update_points(sender, instance, raw=False, **kwargs):
 	print "Updating Round %s" % instance
+	if raw:
+		# loaded from a fixture (see import_sqlite), with its scores
+		return
 	if (instance.reporter_team is None) or (instance.opponent_team is None) or (instance.reviewer_team is None) or instance.problem_presented is None :
 		# then all teams aren't yet defined, there is no need to compute scores
 		pass
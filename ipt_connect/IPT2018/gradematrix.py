@@ -0,0 +1,69 @@
+# coding: utf8
+"""
+Grades of a Physics Fight arranged in a matrix: for every room, one row per jury member and one column per round, and in every cell the three grades of the jury member for the reporter, the opponent and the reviewer of the round.
+
+The matrix is built from two values() queries, the rounds of the fight and their grades, with the names of the teams, problems, rooms and jury members joined in, and a third one for the rooms. It feeds the physics fight page and its CSV export.
+"""
+import csv
+from models import Round, Room, JuryGrade
+
+
+roles = ['reporter', 'opponent', 'reviewer']
+
+csv_header = ['Room', 'Round', 'Problem', 'Reporter team', 'Opponent team', 'Reviewer team', 'Jury member', 'Reporter grade', 'Opponent grade', 'Reviewer grade']
+
+
+def grade_matrix(pf_number):
+	"""
+	:param pf_number: number of the Physics Fight
+	:return: list of the rooms, ordered by name, as dictionaries with:
+		"name": the name of the room,
+		"rounds": the graded rounds of the room, ordered by round number, as dictionaries with the pk, round_number, problem (pk), problem_name and team names of the round,
+		"jurys": the jury members who graded a round of the room, ordered by surname and name, as dictionaries with the pk, name and grades, a list with the (grade_reporter, grade_opponent, grade_reviewer) of every round, None for the rounds the jury member did not grade,
+		"means": the list of the (score_reporter, score_opponent, score_reviewer) of every round
+	"""
+	rooms = [{"pk": pk, "name": name, "rounds": [], "jurys": [], "means": []} for pk, name in Room.objects.order_by('name').values_list('pk', 'name')]
+	byroom = dict((room["pk"], room) for room in rooms)
+
+	rounds = Round.objects.filter(pf_number=pf_number, jurygrade__isnull=False).distinct().order_by('round_number', 'pk')
+	columns = {}
+	for round in rounds.values('pk', 'room', 'round_number', 'problem_presented', 'problem_presented__name', 'reporter_team__name', 'opponent_team__name', 'reviewer_team__name', 'score_reporter', 'score_opponent', 'score_reviewer'):
+		room = byroom[round['room']]
+		columns[round['pk']] = (room, len(room["rounds"]))
+		room["rounds"].append({"pk": round['pk'], "round_number": round['round_number'], "problem": round['problem_presented'], "problem_name": round['problem_presented__name'],
+			"reporter_team": round['reporter_team__name'], "opponent_team": round['opponent_team__name'], "reviewer_team": round['reviewer_team__name']})
+		room["means"].append(tuple(round['score_' + role] for role in roles))
+
+	rows = {}
+	grades = JuryGrade.objects.filter(round__pf_number=pf_number).order_by('jury__surname', 'jury__name', 'jury')
+	for round, jury, name, surname, reporter, opponent, reviewer in grades.values_list('round', 'jury', 'jury__name', 'jury__surname', 'grade_reporter', 'grade_opponent', 'grade_reviewer'):
+		room, ind = columns[round]
+		if (room["pk"], jury) not in rows:
+			rows[room["pk"], jury] = {"pk": jury, "name": "%s %s" % (name, surname), "grades": [None] * len(room["rounds"])}
+			room["jurys"].append(rows[room["pk"], jury])
+		rows[room["pk"], jury]["grades"][ind] = (reporter, opponent, reviewer)
+
+	return rooms
+
+
+def encoded(row):
+	# the csv module of Python 2 only writes bytes
+	return [value.encode('utf8') if isinstance(value, unicode) else value for value in row]
+
+
+def write_csv(rooms, output):
+	"""
+	Write a grade matrix as CSV, one line per round and jury member, followed by the mean grades of the round.
+
+	:param rooms: the matrix, as returned by grade_matrix
+	:param output: file-like object
+	"""
+	writer = csv.writer(output)
+	writer.writerow(csv_header)
+	for room in rooms:
+		for ind, round in enumerate(room["rounds"]):
+			start = [room["name"], round["round_number"], round["problem_name"], round["reporter_team"], round["opponent_team"], round["reviewer_team"]]
+			for jury in room["jurys"]:
+				if jury["grades"][ind] is not None:
+					writer.writerow(encoded(start + [jury["name"]] + list(jury["grades"][ind])))
+			writer.writerow(encoded(start + ['Mean'] + ["%.2f" % mean for mean in room["means"][ind]]))
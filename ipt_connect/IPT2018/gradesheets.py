@@ -0,0 +1,92 @@
+# coding: utf8
+"""
+Grade sheets: all the grades of a round, sent at once by the jury secretary of the room.
+
+A sheet is a dictionary {"round": round pk, "grades": [{"jury": jury pk, "reporter": grade, "opponent": grade, "reviewer": grade}, ...]}, and a submission either a single sheet or {"rounds": [sheet, ...]}.
+
+The sheets of a submission are checked, then stored in a single transaction: the grades of every round are replaced by those of its sheet, and the scores of the rounds computed. The aggregates of the teams, participants, problems and fights involved are left to the background queue (see tasks.py), so that the secretaries of the different rooms do not wait on each other.
+"""
+from django.db import transaction
+from models import Round, Jury, JuryGrade, grade_choices
+import propagation
+import tasks
+import problemstats
+from rendercache import bump_version
+
+
+roles = ['reporter', 'opponent', 'reviewer']
+grades = set(value for value, label in grade_choices)
+
+
+def parse(data):
+	"""
+	Check a submission.
+
+	:param data: the submission, decoded from JSON
+	:return: a tuple (sheets, errors), sheets being a dictionary {round pk: [(jury pk, grade_reporter, grade_opponent, grade_reviewer)]} and errors a list of messages, empty if the submission is valid
+	"""
+	if isinstance(data, dict) and 'round' in data:
+		data = {"rounds": [data]}
+	if not isinstance(data, dict) or not isinstance(data.get('rounds'), list):
+		return {}, ['Expected a sheet {"round": ..., "grades": [...]}, or {"rounds": [sheet, ...]}']
+
+	sheets = {}
+	errors = []
+	for ind, sheet in enumerate(data['rounds']):
+		where = "Sheet %i" % (ind+1)
+		if not isinstance(sheet, dict) or not isinstance(sheet.get('round'), int) or not isinstance(sheet.get('grades'), list):
+			errors.append('%s: expected {"round": round pk, "grades": [...]}' % where)
+			continue
+		if sheet['round'] in sheets:
+			errors.append("%s: round %i has several sheets" % (where, sheet['round']))
+			continue
+		rows = []
+		for grade in sheet['grades']:
+			if not isinstance(grade, dict) or not isinstance(grade.get('jury'), int):
+				errors.append('%s: expected {"jury": jury pk, "reporter": grade, "opponent": grade, "reviewer": grade}' % where)
+				continue
+			for role in roles:
+				value = grade.get(role)
+				if isinstance(value, bool) or not isinstance(value, int) or value not in grades:
+					errors.append("%s: the %s grade of jury member %i must be an integer between %i and %i" % (where, role, grade['jury'], min(grades), max(grades)))
+			rows.append((grade['jury'],) + tuple(grade.get(role) for role in roles))
+		juries = [row[0] for row in rows]
+		if len(set(juries)) != len(juries):
+			errors.append("%s: a jury member is graded several times" % where)
+		sheets[sheet['round']] = rows
+
+	# the rounds and the jury members must exist, and the rounds be started
+	rounds = dict(Round.objects.filter(pk__in=sheets.keys()).values_list('pk', 'reporter_team'))
+	for pk in sorted(sheets):
+		if pk not in rounds:
+			errors.append("Round %i does not exist" % pk)
+		elif rounds[pk] is None:
+			errors.append("Round %i has no reporter team yet" % pk)
+	juries = set(row[0] for rows in sheets.values() for row in rows)
+	for pk in sorted(juries - set(Jury.objects.filter(pk__in=juries).values_list('pk', flat=True))):
+		errors.append("Jury member %i does not exist" % pk)
+
+	return sheets, errors
+
+
+def store(sheets):
+	"""
+	Replace the grades of some rounds, compute their scores, and queue the recomputation of everything they count for.
+
+	:param sheets: dictionary {round pk: [(jury pk, grade_reporter, grade_opponent, grade_reviewer)]}, as returned by parse
+	:return: the primary keys of the rounds whose scores changed
+	"""
+	with transaction.atomic():
+		JuryGrade.objects.filter(round__in=sheets.keys()).delete()
+		JuryGrade.objects.bulk_create([JuryGrade(round_id=round, jury_id=jury, grade_reporter=rep, grade_opponent=opp, grade_reviewer=rev) for round, rows in sorted(sheets.items()) for jury, rep, opp, rev in rows])
+
+		rounds = propagation.round_scores(sheets.keys())
+		propagation.bulk_update(Round, rounds)
+		snapshots = list(Round.objects.filter(pk__in=sheets.keys()).values(*propagation.snapshot_fields))
+		tasks.enqueue(tasks.round_keys(snapshots))
+		problemstats.invalidate([snapshot['problem_presented_id'] for snapshot in snapshots])
+
+		# the bulk writes do not send any signal
+		transaction.on_commit(bump_version)
+
+	return sorted(rounds)
@@ -0,0 +1,34 @@
+# coding: utf8
+"""
+Rounds of the tournament arranged in a grid: one row per room, one column per Physics Fight, and in every cell the rounds of that fight in that room, ordered by round number.
+
+The grid is built from two queries, one for the rooms and one for the rounds. Every round is given its room from the first one: the pages read nothing else of a round than its own fields and its room, so no other relation is loaded.
+"""
+from models import Round, Room, pfs
+
+
+def rounds_grid(pf_numbers=pfs):
+	"""
+	:param pf_numbers: list of the Physics Fights, one column each
+	:return: a tuple (rooms, grid), the rooms ordered by name and grid[i][j] being the list of the rounds of the j-th fight of pf_numbers in the i-th room
+	"""
+	rooms = list(Room.objects.order_by('name'))
+	roomsbypk = dict((room.pk, room) for room in rooms)
+	columns = dict((pf, ind) for ind, pf in enumerate(pf_numbers))
+	cells = dict((room.pk, [[] for pf in pf_numbers]) for room in rooms)
+
+	rounds = Round.objects.filter(pf_number__in=pf_numbers).order_by('round_number', 'pk')
+	for round in rounds:
+		round.room = roomsbypk[round.room_id]
+		cells[round.room_id][columns[round.pf_number]].append(round)
+
+	return rooms, [cells[room.pk] for room in rooms]
+
+
+def column(grid, ind):
+	"""
+	:param grid: a grid returned by rounds_grid
+	:param ind: index of the column
+	:return: list of the rounds of the column, room after room
+	"""
+	return [round for row in grid for round in row[ind]]
@@ -0,0 +1,107 @@
+# coding: utf8
+"""
+Statistics of the jury members, to spot the harsh and the lenient ones when the jury panels are made.
+
+For every jury member:
+
+* the mean grade given to the reporters, opponents and reviewers, in one grouped query;
+* the deviation from the score of the round, the trimmed mean of all the grades (see Round.save), role by role and on average, in a second grouped query. Only the rounds with a score, i.e. more than one grade, count;
+* how often the grade of the jury member was among the extreme ones discarded by the rejection rule, lowest or highest. Exactly as many grades as the rule discards are counted per round and role: with ties at the cut-off, the discarded grades left are shared between the jury members who gave the tied value, e.g. one grade discarded among five equal ones counts for 0.2 each. The grades are read in one values() query and checked round by round with the rule;
+* the harshness index: the z-score of the mean deviation of the jury member among all the jury members. Negative for the harsh ones, positive for the lenient ones.
+"""
+import math
+from django.db.models import Avg, Count, F, FloatField, ExpressionWrapper
+from models import Round, JuryGrade, grade_rejection_rule
+from ipt_connect.scoring import discarded
+
+
+roles = ['reporter', 'opponent', 'reviewer']
+
+
+def scored_rounds():
+	"""
+	:return: the rounds whose score is computed from their grades, see Round.save
+	"""
+	return Round.objects.order_by().annotate(ngrades=Count('jurygrade')).filter(ngrades__gt=1).values('pk')
+
+
+def mean_grades():
+	"""
+	:return: dictionary {jury pk: (number of grades given, (mean reporter grade, mean opponent grade, mean reviewer grade))}
+	"""
+	means = dict(('mean_' + role, Avg('grade_' + role)) for role in roles)
+	rows = JuryGrade.objects.order_by().values('jury').annotate(ngrades=Count('pk'), **means)
+	return dict((row['jury'], (row['ngrades'], tuple(row['mean_' + role] for role in roles))) for row in rows)
+
+
+def drop_shares(values, ndropped):
+	"""
+	:param values: the grades given to a role in a round, one per jury member
+	:param ndropped: number of the lowest grades discarded
+	:return: the share of a discarded grade of every grade, in the order of values: 1 below the cut-off value, the discarded grades left split between the grades equal to the cut-off, 0 above
+	"""
+	if ndropped <= 0:
+		return [0.0] * len(values)
+	cutoff = sorted(values)[ndropped-1]
+	below = sum(1 for value in values if value < cutoff)
+	share = float(ndropped - below) / sum(1 for value in values if value == cutoff)
+	return [1.0 if value < cutoff else share if value == cutoff else 0.0 for value in values]
+
+
+def dropped_counts(rule=grade_rejection_rule):
+	"""
+	:param rule: the rejection rule of the tournament
+	:return: dictionary {jury pk: [number of grades discarded as the lowest, number of grades discarded as the highest]}, fractional with ties, see drop_shares
+	"""
+	rounds = {}
+	for round, jury, rep, opp, rev in JuryGrade.objects.filter(round__isnull=False).values_list('round', 'jury', 'grade_reporter', 'grade_opponent', 'grade_reviewer'):
+		rounds.setdefault(round, []).append((jury, (rep, opp, rev)))
+
+	counts = {}
+	for grades in rounds.values():
+		nlow, nhigh = discarded(rule, len(grades))
+		if len(grades) < 2 or nlow + nhigh >= len(grades):
+			continue
+		for ind in range(len(roles)):
+			values = [row[ind] for jury, row in grades]
+			low, high = drop_shares(values, nlow), drop_shares([-value for value in values], nhigh)
+			for (jury, row), lowshare, highshare in zip(grades, low, high):
+				count = counts.setdefault(jury, [0.0, 0.0])
+				count[0] += lowshare
+				count[1] += highshare
+	return counts
+
+
+def jury_statistics():
+	"""
+	:return: dictionary {jury pk: statistics} of the jury members who gave grades, the statistics being a dictionary with:
+		"ngrades": the number of grades (reporter, opponent, reviewer) given,
+		"means": their mean (reporter, opponent, reviewer) grades,
+		"nscored": the number of grades given in rounds with a score,
+		"deviations": their mean deviation from the scores of the rounds, (reporter, opponent, reviewer),
+		"deviation": the mean of the three deviations,
+		"dropped_low", "dropped_high": the number of grades discarded as the lowest and the highest ones,
+		"harshness": the z-score of the deviation among the jury members, None if it cannot be computed
+	"""
+	stats = {}
+	for jury, (ngrades, means) in mean_grades().items():
+		stats[jury] = {"ngrades": ngrades, "means": means, "nscored": 0, "deviations": (0.0, 0.0, 0.0), "deviation": 0.0, "dropped_low": 0.0, "dropped_high": 0.0, "harshness": None}
+
+	deviations = dict(('deviation_' + role, Avg(ExpressionWrapper(F('grade_' + role) - F('round__score_' + role), output_field=FloatField()))) for role in roles)
+	for row in JuryGrade.objects.filter(round__in=scored_rounds()).order_by().values('jury').annotate(nscored=Count('pk'), **deviations):
+		values = tuple(row['deviation_' + role] for role in roles)
+		stats[row['jury']].update({"nscored": row['nscored'], "deviations": values, "deviation": sum(values) / len(values)})
+
+	for jury, (low, high) in dropped_counts().items():
+		stats[jury].update({"dropped_low": low, "dropped_high": high})
+
+	# harshness: how far from the other jury members the deviation of a jury member is
+	scored = [stat for stat in stats.values() if stat["nscored"]]
+	if len(scored) > 1:
+		average = sum(stat["deviation"] for stat in scored) / len(scored)
+		std = math.sqrt(sum((stat["deviation"] - average) ** 2 for stat in scored) / len(scored))
+		if std > 0:
+			for stat in scored:
+				stat["harshness"] = (stat["deviation"] - average) / std
+
+	return stats
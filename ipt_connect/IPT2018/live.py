@@ -0,0 +1,136 @@
+# coding: utf8
+"""
+Live updates of the ranking and round pages, by long polling with a bounded wait.
+
+A page gives the data version it was rendered at (see rendercache). Its script then asks for the changes since that version: while the data version does not move, the request waits for it, at most IPT_LIVE_WAIT seconds, and gets 304 Not Modified at the end. Once it moves, the request returns the rows of the page that changed as a small JSON document. The script patches the tables in place, and asks again from the new version, at most once every `interval` seconds.
+
+A waiting request holds a worker. At most IPT_LIVE_WAITING requests of a process wait at once: the others are answered right away, and their clients ask again `interval` seconds later, as in short polling. The grade entry and the admin keep the other workers, however many spectators there are.
+
+The state of a page is computed once per data version and kept in the cache for a while, so that all the spectators of a page share it, and the changes are the difference between the state at the version of the client and the current one. If the former is not in the cache, or the version of the client is unknown, the whole state is sent right away.
+
+Nothing else than the cache shared by the worker processes is needed: no broker, no extra process.
+
+Settings:
+	IPT_LIVE_WAIT: longest wait of a request for a change, in seconds. Default 20.
+	IPT_LIVE_WAITING: number of requests of a process waiting at once. Default 4.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from models import Team, Round, JuryGrade
+from rendercache import data_version
+
+
+# least number of seconds between two requests of a client, and how long the state of a page is kept in the cache after its version
+interval = 2
+state_timeout = 3600
+# seconds between two looks at the data version, while waiting for a change
+check_interval = 0.5
+
+waiting = [0]
+waiting_lock = threading.Lock()
+
+
+def setting(name, default):
+	return getattr(settings, 'IPT_LIVE_' + name, default)
+
+
+def ranking_state():
+	"""
+	:return: dictionary {table: {team pk: [rank, points]}} of the qualifying and semi-final rankings, as on the ranking page
+	"""
+	res = {"qualifying": {}, "semi": {}}
+	for ind, (pk, points) in enumerate(Team.objects.order_by('-total_points').values_list('pk', 'total_points')):
+		res["qualifying"][str(pk)] = [ind+1, points]
+	for ind, (pk, points) in enumerate(Team.objects.filter(is_in_semi=True).order_by('-semi_points').values_list('pk', 'semi_points')):
+		res["semi"][str(pk)] = [ind+1, points]
+	return res
+
+
+def round_state(pk):
+	"""
+	:param pk: primary key of a Round
+	:return: dictionary {table: {row: values}} with the grades of every jury member and the mean grades, as on the round page
+	"""
+	grades = dict((str(jury), [rep, opp, rev]) for jury, rep, opp, rev in JuryGrade.objects.filter(round=pk).values_list('jury', 'grade_reporter', 'grade_opponent', 'grade_reviewer'))
+	means = Round.objects.filter(pk=pk).values_list('score_reporter', 'score_opponent', 'score_reviewer').first()
+	return {"grades": grades, "means": {"mean": list(means)} if means and grades else {}}
+
+
+def state(name, compute, version):
+	"""
+	:param name: name of the page, in the cache keys
+	:param compute: function returning the state of the page
+	:param version: the current data version
+	:return: the state of the page at the current version, from the cache if possible
+	"""
+	key = "IPT2018:live:%s:%s" % (name, version)
+	res = cache.get(key)
+	if res is None:
+		res = compute()
+		cache.set(key, res, state_timeout)
+	return res
+
+
+def changes(old, new):
+	"""
+	:param old: a state, None if unknown
+	:param new: the current state
+	:return: dictionary {table: {row: values}} with the rows that were changed or added, and the removed rows set to None
+	"""
+	if old is None:
+		return new
+	res = {}
+	for table, rows in new.items():
+		oldrows = old.get(table, {})
+		diff = dict((row, values) for row, values in rows.items() if oldrows.get(row) != values)
+		diff.update((row, None) for row in oldrows if row not in rows)
+		if diff:
+			res[table] = diff
+	return res
+
+
+def wait_for_change(since):
+	"""
+	Wait for the data version to move, unless too many requests of the process are waiting already.
+
+	:param since: data version known by the client
+	:return: the current data version, once it differs from since or the wait is over
+	"""
+	with waiting_lock:
+		if waiting[0] >= setting('WAITING', 4):
+			return data_version()
+		waiting[0] += 1
+	try:
+		deadline = time.time() + setting('WAIT', 20)
+		version = data_version()
+		while version == since and time.time() < deadline:
+			time.sleep(min(check_interval, max(deadline - time.time(), 0)))
+			version = data_version()
+		return version
+	finally:
+		with waiting_lock:
+			waiting[0] -= 1
+
+
+def poll(name, compute, since):
+	"""
+	Answer a client of a live page, once the data changed or the wait is over.
+
+	:param name: name of the page, in the cache keys
+	:param compute: function returning the state of the page
+	:param since: data version known by the client, 0 if none
+	:return: dictionary {"version": current data version, "changes": changed rows, "full": are all the rows sent ?, "interval": least seconds before asking again}, None if nothing changed since the version of the client
+	"""
+	version = data_version()
+	if since == version:
+		# keep the state the client knows, to send it only the changes
+		state(name, compute, since)
+		version = wait_for_change(since)
+		if version == since:
+			return None
+
+	# a version from the future is not one we know
+	old = cache.get("IPT2018:live:%s:%s" % (name, since)) if 0 < since < version else None
+	return {"version": version, "changes": changes(old, state(name, compute, version)), "full": old is None, "interval": interval}
@@ -0,0 +1,46 @@
+# coding: utf8
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+
+class Command(BaseCommand):
+	help = "Add the indexes and unique constraints declared in the Meta of the IPT2018 models to an existing database (the apps have no migrations, syncdb only creates them with the tables)"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--dry-run', action='store_true', help="Only tell what is missing")
+
+	def handle(self, *args, **options):
+		nadded = 0
+		for model in apps.get_app_config('IPT2018').get_models():
+			with connection.cursor() as cursor:
+				constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+			unique_columns = set(tuple(constraint['columns']) for constraint in constraints.values() if constraint['unique'])
+
+			for index in model._meta.indexes:
+				if index.name in constraints:
+					continue
+				self.stdout.write("%s: index %s on %s" % (model.__name__, index.name, ", ".join(index.fields)))
+				if not options['dry_run']:
+					with connection.schema_editor() as editor:
+						editor.add_index(model, index)
+				nadded += 1
+
+			for fields in model._meta.unique_together:
+				if tuple(model._meta.get_field(field).column for field in fields) in unique_columns:
+					continue
+				self.stdout.write("%s: unique constraint on %s" % (model.__name__, ", ".join(fields)))
+				# the duplicates have to be sorted out by hand first
+				duplicates = model.objects.order_by().values(*fields).annotate(count=Count('pk')).filter(count__gt=1)
+				if duplicates:
+					for duplicate in duplicates:
+						self.stdout.write("  %i duplicates of %s" % (duplicate.pop('count'), duplicate))
+					self.stdout.write("  not added, remove the duplicates first")
+					continue
+				if not options['dry_run']:
+					with connection.schema_editor() as editor:
+						editor.alter_unique_together(model, [], [fields])
+				nadded += 1
+
+		self.stdout.write("%i indexes and constraints %s" % (nadded, "missing" if options['dry_run'] else "added"))
@@ -0,0 +1,33 @@
+# coding: utf8
+import time
+from django.core.management.base import BaseCommand
+
+from IPT2018 import panels
+from IPT2018.models import Jury, Room, npf_tot
+
+
+class Command(BaseCommand):
+	help = "Assign the jury members to the rooms of the Physics Fights, see IPT2018/panels.py"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--pf', type=int, action='append', help="Physics Fight to assign, may be repeated (default all of them)")
+		parser.add_argument('--seed', type=int, default=2018, help="Seed of the random moves")
+		parser.add_argument('--iterations', type=int, default=panels.iterations, help="Number of moves tried per fight")
+		parser.add_argument('--no-harshness', action='store_true', help="Do not mix the harsh and the lenient jury members")
+		parser.add_argument('--dry-run', action='store_true', help="Print the panels without storing them")
+
+	def handle(self, *args, **options):
+		pf_numbers = options['pf'] or range(1, npf_tot+1)
+		start = time.time()
+		res = panels.assign(pf_numbers, seed=options['seed'], iterations=options['iterations'], use_harshness=not options['no_harshness'], save=not options['dry_run'])
+		duration = time.time() - start
+
+		jurys = Jury.objects.in_bulk()
+		rooms = Room.objects.in_bulk()
+		for pf, (fight, reserves, cost) in sorted(res.items()):
+			self.stdout.write("Fight %i (cost %.1f)" % (pf, cost))
+			for room, members in sorted(fight.items()):
+				self.stdout.write("  %s: %s" % (rooms[room].name, ", ".join(unicode(jurys[jury]) for jury in members)))
+			if reserves:
+				self.stdout.write("  Reserves: %s" % ", ".join(unicode(jurys[jury]) for jury in reserves))
+		self.stdout.write("%i fights assigned in %.2f s%s" % (len(res), duration, " (not stored)" if options['dry_run'] else ""))
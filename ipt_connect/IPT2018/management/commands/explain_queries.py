@@ -0,0 +1,42 @@
+# coding: utf8
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from IPT2018.models import Round, JuryGrade, Room, Team, Jury, pfs, npf
+
+
+def hot_queries():
+	"""
+	:return: list of (name, queryset) of the queries the busiest pages and recomputations run, on the first objects of the database
+	"""
+	room = Room.objects.order_by('pk').first()
+	team = Team.objects.order_by('pk').first()
+	jury = Jury.objects.order_by('pk').first()
+	round = Round.objects.order_by('pk').first()
+	return [
+		("physics_fight_detail: graded rounds of a fight", Round.objects.filter(pf_number=1, jurygrade__isnull=False).distinct().order_by('round_number', 'pk')),
+		("physics_fight_detail: grades of a fight", JuryGrade.objects.filter(round__pf_number=1).order_by('jury__surname', 'jury__name', 'jury')),
+		("rounds: rounds of the fights", Round.objects.filter(pf_number__in=pfs[:4] + [npf+1]).order_by('round_number', 'pk')),
+		("round_detail: rounds of a room in a fight", Round.objects.filter(pf_number=1, room=room, round_number__lt=3)),
+		("team: rounds as reporter in the qualifying fights", Round.objects.filter(reporter_team=team, pf_number__in=pfs[:4])),
+		("team: rounds as opponent in the qualifying fights", Round.objects.filter(opponent_team=team, pf_number__in=pfs[:4])),
+		("team: rounds as reviewer in the qualifying fights", Round.objects.filter(reviewer_team=team, pf_number__in=pfs[:4])),
+		("round: grades of a round", JuryGrade.objects.filter(round=round)),
+		("gradesheet: grade of a jury member in a round", JuryGrade.objects.filter(round=round, jury=jury)),
+		("jury_detail: grades of a jury member", JuryGrade.objects.filter(jury=jury).order_by('round')),
+	]
+
+
+class Command(BaseCommand):
+	help = "Print the query plans of the hot queries of IPT2018, to check they use the indexes (see add_indexes)"
+
+	def handle(self, *args, **options):
+		explain = "EXPLAIN QUERY PLAN " if connection.vendor == 'sqlite' else "EXPLAIN "
+		for name, queryset in hot_queries():
+			sql, params = queryset.query.sql_with_params()
+			with connection.cursor() as cursor:
+				cursor.execute(explain + sql, params)
+				plan = cursor.fetchall()
+			self.stdout.write(name)
+			for row in plan:
+				self.stdout.write("    " + " ".join(unicode(value) for value in row))
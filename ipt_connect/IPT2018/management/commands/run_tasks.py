@@ -0,0 +1,29 @@
+# coding: utf8
+import time
+from django.core.management.base import BaseCommand
+
+from IPT2018 import tasks
+
+
+class Command(BaseCommand):
+	help = "Run the background queue of the score recomputations in this process, see IPT2018/tasks.py"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--workers', type=int, default=None, help="Number of worker threads (default IPT_TASKS_WORKERS, or 2)")
+		parser.add_argument('--once', action='store_true', help="Run the due tasks, then stop")
+
+	def handle(self, *args, **options):
+		if options['once']:
+			ntasks = 0
+			while True:
+				ndone = tasks.run_pending()
+				if not ndone:
+					break
+				ntasks += ndone
+			self.stdout.write("%i tasks run" % ntasks)
+			return
+
+		workers = tasks.start_workers(options['workers'])
+		self.stdout.write("%i workers started" % len(workers))
+		while True:
+			time.sleep(60)
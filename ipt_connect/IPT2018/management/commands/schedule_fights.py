@@ -0,0 +1,40 @@
+# coding: utf8
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from IPT2018 import schedule
+from IPT2018.models import Team, pfs
+
+
+class Command(BaseCommand):
+	help = "Schedule the Physics Fights and create their rounds, see IPT2018/schedule.py"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--pf', type=int, action='append', help="Physics Fight to schedule, may be repeated (default the qualifying fights)")
+		parser.add_argument('--team', action='append', help="Name of a team playing the fights, may be repeated (default all the teams in the qualifying fights, the teams in the semi-final in the semi-final)")
+		parser.add_argument('--seed', type=int, default=2018, help="Seed of the random swaps")
+		parser.add_argument('--iterations', type=int, default=schedule.iterations, help="Number of swaps tried per fight")
+		parser.add_argument('--replace', action='store_true', help="Delete the rounds of the fights first, unless they have grades")
+		parser.add_argument('--dry-run', action='store_true', help="Print the schedule without creating the rounds")
+
+	def handle(self, *args, **options):
+		pf_numbers = options['pf'] or pfs[:4]
+		teams = None
+		if options['team']:
+			teams = list(Team.objects.filter(name__in=options['team']).values_list('pk', flat=True))
+			if len(teams) != len(set(options['team'])):
+				raise CommandError("Unknown team among %s" % ", ".join(options['team']))
+
+		start = time.time()
+		try:
+			res = schedule.generate(pf_numbers, teams, seed=options['seed'], iterations=options['iterations'], replace=options['replace'], save=not options['dry_run'])
+		except ValueError as error:
+			raise CommandError(str(error))
+		duration = time.time() - start
+
+		names = dict(Team.objects.values_list('pk', 'name'))
+		for pf, (rooms, cost) in sorted(res.items()):
+			self.stdout.write("Fight %i (cost %.1f)" % (pf, cost))
+			for room, roomteams in rooms:
+				self.stdout.write("  %s: %s" % (room.name, ", ".join(names[team] for team in roomteams)))
+		self.stdout.write("%i fights scheduled in %.2f s%s" % (len(res), duration, " (not created)" if options['dry_run'] else ""))
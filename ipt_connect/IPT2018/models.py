@@ -1,5 +1,5 @@
 # coding: utf8
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import os, sys
@@ -7,11 +7,14 @@ from uuid import uuid4
 from django.utils.encoding import iri_to_uri
 from string import replace
 from django.utils.deconstruct import deconstructible
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
-from django.db.models import Avg, Sum
+from django.db.models import Avg, Sum, Count
 from django.core.validators import RegexValidator
 from django.dispatch import Signal
+from django.core.cache import cache
+from ipt_connect.scoring import trimmed_means, IPT_RULE
+from rendercache import bump_version, data_version
 
 
 # Parameters
@@ -20,6 +23,7 @@ with_final_pf = True	# Is there a Final Fight ?
 reject_malus = 0.2		# Malus for too many rejections
 npfreject_max = 3		# Maximum number of tactical rejection (per fight)
 netreject_max = 1		# Maximum number of eternal rejection
+grade_rejection_rule = IPT_RULE	# Number of extreme jury grades discarded, see ipt_connect.scoring
 
 # Useful static variables
 pfs = [i+1 for i in range(npf)]
@@ -32,6 +36,46 @@ def mean(vec):
 	else:
 		return 0
 
+def coefficients_from_rejections(eternal, tactical):
+	"""
+	Compute the presentation coefficients of a team from its rejections, see Team.presentation_coefficients
+
+	:param eternal: dictionary {pf_number: number of eternal rejections}
+	:param tactical: dictionary {pf_number: number of tactical rejections}
+	:return: Return a list with the coefficient for every round
+	"""
+	prescoeffs = []
+	netrej = 0
+	npenalities = 0
+	for pf in pfs:
+		netrej += eternal.get(pf, 0)
+		if tactical.get(pf, 0) > npfreject_max:
+			npenalities += tactical.get(pf, 0) - npfreject_max
+		prescoeffs.append(3.0 - reject_malus*max(0, (netrej-netreject_max)) - reject_malus * npenalities)
+
+	# add the coeff for the final, 3.0 by default
+	if with_final_pf:
+		prescoeffs.append(3.0)
+
+	return prescoeffs
+
+# the coefficients are keyed on the tournament data version: those of a team deleted, or of a database flushed or imported, are left behind with their version
+def prescoeffs_cache_key(team_pk, version=None):
+	return "IPT2018:prescoeffs:%s:%s" % (version or data_version(), team_pk)
+
+def invalidate_presentation_coefficients(teams):
+	"""
+	Remove the cached presentation coefficients of some teams, see Team.presentation_coefficients.
+
+	They are removed right away, for the current transaction to see the new coefficients. Once the transaction is committed, the new data version leaves the coefficients other requests cached in the meantime behind.
+
+	:param teams: list of Team primary keys, possibly None
+	"""
+	version = data_version()
+	keys = [prescoeffs_cache_key(team, version) for team in set(teams) if team is not None]
+	if keys:
+		cache.delete_many(keys)
+
 
 @deconstructible
 class UploadToPathAndRename(object):
@@ -105,6 +149,9 @@ class Participant(models.Model):
 	tot_score_as_reporter = models.FloatField(default=0.0, editable=False)
 	tot_score_as_opponent = models.FloatField(default=0.0, editable=False)
 	tot_score_as_reviewer = models.FloatField(default=0.0, editable=False)
+	nrounds_as_rep = models.IntegerField(default=0, editable=False)
+	nrounds_as_opp = models.IntegerField(default=0, editable=False)
+	nrounds_as_rev = models.IntegerField(default=0, editable=False)
 
 	# functions
 	def fullname(self):
@@ -129,9 +176,13 @@ class Participant(models.Model):
 		self.tot_score_as_opponent = sum([round.score_opponent for round in rounds_as_opponent])
 		self.tot_score_as_reviewer = sum([round.score_reviewer for round in rounds_as_reviewer])
 
-		self.mean_score_as_reporter = self.tot_score_as_reporter / max(len(rounds_as_reporter), 1)
-		self.mean_score_as_opponent = self.tot_score_as_opponent / max(len(rounds_as_opponent), 1)
-		self.mean_score_as_reviewer = self.tot_score_as_reviewer / max(len(rounds_as_reviewer), 1)
+		self.nrounds_as_rep = len(rounds_as_reporter)
+		self.nrounds_as_opp = len(rounds_as_opponent)
+		self.nrounds_as_rev = len(rounds_as_reviewer)
+
+		self.mean_score_as_reporter = self.tot_score_as_reporter / max(self.nrounds_as_rep, 1)
+		self.mean_score_as_opponent = self.tot_score_as_opponent / max(self.nrounds_as_opp, 1)
+		self.mean_score_as_reviewer = self.tot_score_as_reviewer / max(self.nrounds_as_rev, 1)
 
 		res = 0.0
 		res += sum([round.points_reporter for round in rounds_as_reporter])
@@ -166,75 +217,26 @@ class Problem(models.Model):
 
 	def status(self, verbose=True, meangradesonly=False):
 		"""
-		Compute mean grades of the problem
+		Compute mean grades of the problem, from the graded rounds, see problemstats
 
-		:return:
+		:return: the mean grades {"report": ..., "opposition": ..., "review": ...}, and unless meangradesonly the results of every team on the problem, see problemstats.team_results
 		"""
-
-		# first, get a list of who presented what
-		rounds = Round.objects.filter(problem_presented=self)
-		reporters = []
-		opponents = []
-		reviewers = []
-		for round in rounds:
-			if len(JuryGrade.objects.filter(round=round)) > 0:
-				reporters.append({"name": round.reporter_team.name, "round": round, "value": round.score_reporter})
-				opponents.append({"name": round.opponent_team.name, "round": round, "value": round.score_opponent})
-				reviewers.append({"name": round.reviewer_team.name, "round": round, "value": round.score_reviewer})
-
-		# use this to compute the mean grades
-                if 0 in [len(reporters), len(opponents), len(reviewers)]:
-                        meangrades = {"report": 0, "opposition": 0, "review": 0}
-                else:
-                        meangrades = {"report": mean([reporter["value"] for reporter in reporters]), "opposition": mean([opponent["value"] for opponent in opponents]), "review": mean([reviewer["value"] for reviewer in reviewers])}
-
+		import problemstats
+		stats = problemstats.statistics([self.pk])[self.pk]
+		meangrades = dict(zip(["report", "opposition", "review"], stats["means"]))
 
 		if meangradesonly==False:
-			# then, reorder that list per teams
-			myteamsnames = list(sorted([elt["name"] for elt in reporters+opponents+reviewers]))
-
-			teamresults = []
-			for name in myteamsnames:
-				if not name in [teamresult["name"] for teamresult in teamresults]:
-					teamresult = {}
-					teamresult["name"] = name
-
-					# They can be multiple report/oppos/review on the same problem by the same team !!!
-					reports=[]
-					oppositions=[]
-					reviews=[]
-					# get the scores from presentations
-					for reporter in reporters:
-						if reporter["name"] == name:
-							reports.append({"round": reporter["round"], "value": reporter["value"]})
-					# get the scores from oppositions
-					for opponent in opponents:
-						if opponent["name"] == name:
-							oppositions.append({"round": opponent["round"], "value": opponent["value"]})
-					# get the scores from reviews
-					for reviewer in reviewers:
-						if reviewer["name"] == name:
-							reviews.append({"round": reviewer["round"], "value": reviewer["value"]})
-
-					teamresult["reports"] = reports
-					teamresult["oppositions"] = oppositions
-					teamresult["reviews"] = reviews
-
-					teamresults.append(teamresult)
-				else:
-					pass
-
-			return (meangrades, teamresults)
+			return (meangrades, problemstats.team_results(stats))
 		else:
 			return meangrades
 
 	def update_scores(self):
 		#print "Updating scores for", self
-		rounds = Round.objects.filter(problem_presented=self)
+		means = Round.objects.filter(problem_presented=self).aggregate(rep=Avg('score_reporter'), opp=Avg('score_opponent'), rev=Avg('score_reviewer'))
 
-		self.mean_score_of_reporters = mean([round.score_reporter for round in rounds])
-		self.mean_score_of_opponents = mean([round.score_opponent for round in rounds])
-		self.mean_score_of_reviewers = mean([round.score_reviewer for round in rounds])
+		self.mean_score_of_reporters = means['rep'] or 0.0
+		self.mean_score_of_opponents = means['opp'] or 0.0
+		self.mean_score_of_reviewers = means['rev'] or 0.0
 
 		self.save()
 
@@ -271,41 +273,33 @@ class Team(models.Model):
 
 		The coefficient loses 0.2 points for every additional rejection. This penality is carried over all the subsequents rounds, but disappear for the Final
 
+		The coefficients are cached until the tournament data changes, and dropped right away when a rejection of the team is created, changed or deleted.
+
 		:param verbose: Verbosity flag
 		:return: Return a list with the coefficient for every round
 		"""
 
-		eternalrejections = EternalRejection.objects.filter(round__reporter_team=self)
+		if not verbose:
+			prescoeffs = cache.get(prescoeffs_cache_key(self.pk))
+			if prescoeffs is not None:
+				return prescoeffs
 
-		beforetactical = []
-		netrej = 0
-		for pf in pfs:
-			netrej += len(eternalrejections.filter(round__pf_number=pf))
-			beforetactical.append(3.0 - reject_malus*max(0, (netrej-netreject_max)))
+		# number of eternal and tactical rejections per physics fight
+		eternal = dict(EternalRejection.objects.filter(round__reporter_team=self).values_list('round__pf_number').annotate(Count('pk')))
+		tactical = dict(TacticalRejection.objects.filter(round__reporter_team=self).values_list('round__pf_number').annotate(Count('pk')))
 
-		# get all the tactical rejections
-		rejections = TacticalRejection.objects.filter(round__reporter_team=self)
+		prescoeffs = coefficients_from_rejections(eternal, tactical)
 
-		prescoeffs = []
-		npenalities = 0
 		if verbose:
 			print "="*20, "Tactical Rejection Penalites for Team %s" % self.name, "="*20
-		for ind, pf in enumerate(pfs):
-			pfrejections = [rejection for rejection in rejections if rejection.round.pf_number == pf]
-			if verbose:
-				print "%i tactical rejections by Team %s in Physics Fight %i" % (len(pfrejections), self, pf)
-			if len(pfrejections) > npfreject_max:
-				npenalities += len(pfrejections) - npfreject_max
-			if verbose:
-				if npenalities > 0:
-					print "Penality of %.1f points on the Reporter Coefficient" %  float(reject_malus*npenalities)
+			for ind, pf in enumerate(pfs):
+				print "%i tactical rejections by Team %s in Physics Fight %i" % (tactical.get(pf, 0), self, pf)
+				if prescoeffs[ind] < 3.0:
+					print "Penality of %.1f points on the Reporter Coefficient" %  float(3.0 - prescoeffs[ind])
 				else:
 					print "No penality"
-			prescoeffs.append(beforetactical[ind] - reject_malus * npenalities)
 
-		# add the coeff for the final, 3.0 by default
-		if with_final_pf:
-			prescoeffs.append(3.0)
+		cache.set(prescoeffs_cache_key(self.pk), prescoeffs, None)
 
 		return prescoeffs
 
@@ -329,6 +323,9 @@ class Team(models.Model):
 		res += sum([round.points_opponent for round in rounds_as_opponent])
 		res += sum([round.points_reviewer for round in rounds_as_reviewer])
 
+		# the bonus points are given by hand in the admin panel
+		res += self.bonus_points
+
 		self.total_points = res
 
 
@@ -368,50 +365,29 @@ class Team(models.Model):
 		Get all the problems that I cannot present(already presented or eternal rejection) and cannot oppose(already opposed)
 
 		:param verbose: verbosity Flag
-		:param currentround: A Round instance. Return all the unpresentable problems before the current round. If none, return on all the round. This sentence is terribly unclear. Rephrase.
+		:param currentround: A Round instance. Only the Physics Fights before the one of the round count; if None, all of them count.
 
 		:return: tuple of three lists. each list contains the problems that are eternally rejected, already presented and already opposed
 		"""
 
+		import problemindex
 		if verbose:
 			print "="*20, "Problems of Team %s" % self.name, "="*20
-		noproblems=[]
-
-		if currentround !=None:
-			pf_number = currentround.pf_number
-		else: #TODO: remove these stupid 999 values and implement the pf rejection properly
-			round_number = 999
-
-		# the eternal rejection
-		eternal_rejections = EternalRejection.objects.filter(round__reporter__team=self)
-		# assert len(eternal_rejections) < 2, "Team %s has more than one eternal rejection. This is forbidden!" % self.name
-		# Well, apparently it is...
-		reject = []
-		if len(eternal_rejections) > 0 and eternal_rejections[0].round.pf_number < pf_number:
-			if verbose:
-				print "Team %s rejected eternally problem %s" %(self.name, eternal_rejections[0].problem.name)
-			reject.append(eternal_rejections[0].problem)
-		noproblems.append(reject)
-
-		# now all the problems already presented
-		rounds = Round.objects.filter(reporter__team=self)
-		rounds = [round for round in rounds if round.pf_number < pf_number]
-		presented = []
-		for round in rounds:
-			if verbose:
-				print "In %s, I presented problem %s" % (round, round.problem_presented)
-			presented.append(round.problem_presented)
-		noproblems.append(presented)
-
-		# and problems already opposed
-		rounds = Round.objects.filter(opponent__team=self)
-		rounds = [round for round in rounds if round.pf_number < pf_number]
-		opposed = []
-		for round in rounds:
+
+		# the problem history of the team, see problemindex
+		pf_number = currentround.pf_number if currentround is not None else npf_tot + 1
+		history = problemindex.histories([self.pk])[self.pk]
+		earlier = dict((kind, [problem for pf, problem in history[kind] if pf < pf_number]) for kind in ["eternal", "presented", "opposed"])
+		problems = Problem.objects.in_bulk(set(sum(earlier.values(), [])))
+
+		noproblems = []
+		for kind, verb in [("eternal", "rejected eternally"), ("presented", "presented"), ("opposed", "opposed")]:
+			# only the first eternal rejection counts
+			pks = earlier[kind][:1] if kind == "eternal" else earlier[kind]
 			if verbose:
-				print "In %s, I opposed problem %s" % (round, round.problem_presented)
-			opposed.append(round.problem_presented)
-		noproblems.append(opposed)
+				for pk in pks:
+					print "Team %s %s problem %s" % (self.name, verb, problems[pk].name)
+			noproblems.append([problems[pk] for pk in pks])
 
 		assert len(noproblems) == 3, "Something wrong with your rejected problem..."
 		return noproblems
@@ -485,6 +461,16 @@ class Round(models.Model):
 	points_opponent = models.FloatField(default=0.0, editable=False)
 	points_reviewer = models.FloatField(default=0.0, editable=False)
 
+	class Meta:
+		# a room plays one round at a time; the unique index also serves the rounds of a fight and of a room in a fight
+		unique_together = ('pf_number', 'room', 'round_number')
+		# the rounds of a team in a role, in some fights
+		indexes = [
+			models.Index(fields=['reporter_team', 'pf_number'], name='round_reporter_team_pf'),
+			models.Index(fields=['opponent_team', 'pf_number'], name='round_opponent_team_pf'),
+			models.Index(fields=['reviewer_team', 'pf_number'], name='round_reviewer_team_pf'),
+		]
+
 	def __unicode__(self):
 		return "Fight %i | Round %i | Salle %s" % (self.pf_number, self.round_number, self.room.name)
 
@@ -492,40 +478,11 @@ class Round(models.Model):
 		jurygrades = JuryGrade.objects.filter(round=self)
 		print "Update scores for", self
 
-		reporter_grades = list(sorted([jurygrade.grade_reporter for jurygrade in jurygrades]))
-		opponent_grades = list(sorted([jurygrade.grade_opponent for jurygrade in jurygrades]))
-		reviewer_grades = list(sorted([jurygrade.grade_reviewer for jurygrade in jurygrades]))
+		grades = [(jurygrade.grade_reporter, jurygrade.grade_opponent, jurygrade.grade_reviewer) for jurygrade in jurygrades]
 
-		ngrades = min(len(reporter_grades), len(opponent_grades), len(reviewer_grades))
+		ngrades = len(grades)
 		if ngrades > 1 :
-			for grades in [reporter_grades, opponent_grades, reviewer_grades]:
-				if len(grades) in [5, 6]:
-					nreject = 1
-				elif len(grades) in [7, 8]:
-					nreject = 2
-				else:
-					nreject = round(len(grades) / 4.0)
-
-				if round(nreject / 2.0) == nreject / 2.0:
-				   nlow = int(nreject / 2.0)
-				   nhigh = int(nlow)
-				else:
-				   nlow = int(nreject / 2.0 + 0.5)
-				   nhigh = int(nreject / 2.0 - 0.5)
-
-				i = 0
-				while i < nhigh:
-				   grades.pop(-1)
-				   i += 1
-
-				i = 0
-				while i < nlow:
-				   grades.pop(0)
-				   i += 1
-
-			self.score_reporter = mean(reporter_grades)
-			self.score_opponent = mean(opponent_grades)
-			self.score_reviewer = mean(reviewer_grades)
+			(self.score_reporter, self.score_opponent, self.score_reviewer) = trimmed_means(grades, grade_rejection_rule)
 
 			prescoeff = self.reporter_team.presentation_coefficients()[self.pf_number-1]
 
@@ -549,55 +506,39 @@ class Round(models.Model):
 		d) was presented by the Opponent earlier.
 		If there are no problems left to challenge, the bans d), c), b), a) are successively removed, in that order.
 
+		The bans are read from the problem histories of the Reporter and the Opponent, see problemindex, whose challengeable function applies the removals.
+
 		:param verbose: verbosity flag
 		:return: return a tuple with five lists : ([already_presented_this_round], [a], [b], [c], [d])
 		"""
 
-		# remind that these below are ([eternal rejection], [presented], [opposed])
-		reporter_problems = self.reporter_team.problems(verbose=False, currentround=self)
-		opponent_problems = self.opponent_team.problems(verbose=False, currentround=self)
-		eternal_rejection = reporter_problems[0]
+		import problemindex
 
-		if verbose:
-			print "="*10, "Problem rejection for %s" % self, "="*10
-			if len(eternal_rejection) != 0:
-				print "Team %s eternally rejected problem \n\t%s" % (self.reporter_team, eternal_rejection[0])
-		presented_by_reporter = reporter_problems[1]
-		if verbose:
-			msg = "Team %s already presented the following problems:" % self.reporter_team
-			for problem in presented_by_reporter:
-				msg += "\n\t%s" % problem
-			print msg
-		opposed_by_opponent = opponent_problems[2]
-		if verbose:
-			msg = "Team %s already opposed the following problems:" % self.opponent_team
-			for problem in opposed_by_opponent:
-				msg += "\n\t%s" % problem
-			print msg
-		presented_by_opponent = opponent_problems[1]
-		if verbose:
-			msg = "Team %s already presented the following problems:" % self.opponent_team
-			for problem in presented_by_opponent:
-				msg += "\n\t%s" % problem
-			print msg
-
-		# Finally, problems already presented in this Fight, in the current room
-		thispfrounds = Round.objects.filter(pf_number=self.pf_number).filter(room=self.room)
-		presented_this_pf = [round.problem_presented for round in thispfrounds if round.round_number < self.round_number]
-		if verbose:
-			msg = "In this fight, problems already presented are:"
-			for problem in presented_this_pf:
-				msg += "\n\t%s" % problem
-			print msg
+		# the same round is asked several times by the templates
+		if not verbose and getattr(self, '_unavailable_problems', None) is not None:
+			return self._unavailable_problems
+
+		# the problem histories of the Reporter and the Opponent, in one lookup, see problemindex
+		banned = problemindex.bans(self)
+		# problems already presented in this Fight, in the current room
+		thispf = problemindex.presented_this_pf(self)
+		problems = Problem.objects.in_bulk(set(thispf).union(*banned.values()))
 
 		unavailable_problems = {}
-		unavailable_problems["presented_this_pf"] = [p for p in presented_this_pf if p != None]
-		unavailable_problems["eternal_rejection"] = [p for p in eternal_rejection if p != None]
-		unavailable_problems["presented_by_reporter"] = [p for p in presented_by_reporter if p != None]
-		unavailable_problems["opposed_by_opponent"] = [p for p in opposed_by_opponent if p != None]
-		unavailable_problems["presented_by_opponent"] = [p for p in presented_by_opponent if p != None]
+		unavailable_problems["presented_this_pf"] = [problems[pk] for pk in thispf]
+		for key, rule in [("eternal_rejection", 'a'), ("presented_by_reporter", 'b'), ("opposed_by_opponent", 'c'), ("presented_by_opponent", 'd')]:
+			unavailable_problems[key] = [problems[pk] for pk in banned[rule]]
 		unavailable_problems["number_of_unavailable_problems"] = sum([len(unavailable_problems[k]) for k in unavailable_problems.keys()])
 
+		if verbose:
+			print "="*10, "Problem rejection for %s" % self, "="*10
+			for key, msg in [("eternal_rejection", "Team %s eternally rejected" % self.reporter_team), ("presented_by_reporter", "Team %s already presented" % self.reporter_team),
+							 ("opposed_by_opponent", "Team %s already opposed" % self.opponent_team), ("presented_by_opponent", "Team %s already presented" % self.opponent_team),
+							 ("presented_this_pf", "In this fight, already presented")]:
+				if unavailable_problems[key]:
+					print msg + " the following problems:" + "".join("\n\t%s" % problem for problem in unavailable_problems[key])
+
+		self._unavailable_problems = unavailable_problems
 		return unavailable_problems
 
 
@@ -621,6 +562,12 @@ class JuryGrade(models.Model):
 			default=None
 			)
 
+	class Meta:
+		# a jury member grades a round once; the unique index also serves the grades of a round
+		unique_together = ('round', 'jury')
+		# the grades of a jury member
+		indexes = [models.Index(fields=['jury', 'round'], name='jurygrade_jury_round')]
+
 	def __unicode__(self):
 		return "Grade of %s" % self.jury.name
 
@@ -650,143 +597,166 @@ class EternalRejection(models.Model):
 		return "Problem rejected : %s" % self.problem
 
 
-# method for updating Teams and Participants when rounds are saved
-@receiver(post_save, sender=Round, dispatch_uid="update_participant_team_points")
-def update_points(sender, instance, **kwargs):
-	print "Updating Round %s" % instance
-	if (instance.reporter_team is None) or (instance.opponent_team is None) or (instance.reviewer_team is None) or instance.problem_presented is None :
-		# then all teams aren't yet defined, there is no need to compute scores
-		pass
-	else :
-		teams = [instance.reporter_team, instance.opponent_team, instance.reviewer_team]
-		# then compute teams (and participants) scores
-		for team in teams:
-			team.update_scores()
+class FightStanding(models.Model):
+	"""
+	Points and rank of a team in a Physics Fight, in the room where it played.
 
-		# and the problem mean scores
-		instance.problem_presented.update_scores()
+	The standings are computed from the rounds, and kept up to date whenever a round is saved or deleted (see propagation.update_standings). The bonus points are those the podium of a three-team fight would give, once all its rounds are played; the four-team fights give none, their bonus points are attributed by hand (see Team.bonus_points).
+	"""
 
+	team = models.ForeignKey(Team)
+	pf_number = models.IntegerField()
+	room = models.ForeignKey(Room)
+	points = models.FloatField(default=0.0)
+	rank = models.IntegerField(default=1)
+	bonus_points = models.FloatField(default=0.0)
+	complete = models.BooleanField(default=False)	# are all the rounds of the fight played ?
 
-def bonuspoints():
+	class Meta:
+		ordering = ['pf_number', 'room', 'rank']
 
-	# WARNING ! I SHOULD NOT BE USED IN IPT2018
-	return "Calling bonuspoints function should not be done in IPT2018!"
-
-
-	# the rounds must be saved first !
-	rounds = Round.objects.filter(pf_number=1) | Round.objects.filter(pf_number=2) | Round.objects.filter(pf_number=3) | Round.objects.filter(pf_number=4)
-	allteams = Team.objects.all()
-
-	bonuspts = {}
-	# set the bonus points to zero
-	for team in allteams:
-		bonuspts[team] = 0.0
-
-	for round in rounds.filter(round_number=3):
-		thispfteams = [round.reporter_team, round.opponent_team, round.reviewer_team]
-		thispfrounds = Round.objects.filter(pf_number=round.pf_number).filter(room=round.room).order_by('round_number')
-
-		# get the points of the physics fight for the 3 teams (without bonuses) in a dictionary
-		points_dict = {}
-		for team in thispfteams:
-			points_dict[team] = 0.0
-		for pfround in thispfrounds :
-			# add the points of each round
-			points_dict[pfround.reporter_team] += pfround.points_reporter
-			points_dict[pfround.opponent_team] += pfround.points_opponent
-			points_dict[pfround.reviewer_team] += pfround.points_reviewer
-
-# get teams sorted by total points for the physics fight
-		team_podium = sorted(thispfteams, key = lambda t : points_dict[t], reverse=True)
-		points_list = [points_dict[t] for t in team_podium]
-
-		# If everyone is ex-aequo
-		if points_list[0] == points_list[1] and points_list[0] == points_list[2] :
-			team_podium[0].bonus_points = 1.
-			team_podium[1].bonus_points = 1.
-			team_podium[2].bonus_points = 1.
-		# If 1 and 2 are ex-aequo
-		elif points_list[0] == points_list[1]:
-			team_podium[0].bonus_points = 1.5
-			team_podium[1].bonus_points = 1.5
-			team_podium[2].bonus_points = 0.0
-		# If 2 and 3 are ex-aequo
-		elif points_list[1] == points_list[2]:
-			team_podium[0].bonus_points = 2.0
-			team_podium[1].bonus_points = 0.5
-			team_podium[2].bonus_points = 0.5
-		# If no ex-aequo
-		else:
-			team_podium[0].bonus_points = 2.0
-			team_podium[1].bonus_points = 1.0
-			team_podium[2].bonus_points = 0.0
+	def __unicode__(self):
+		return "%s in Fight %i" % (self.team, self.pf_number)
 
-		sumbonuspts = 0
-		for team in team_podium:
-			bonuspts[team] += team.bonus_points
-			sumbonuspts += team.bonus_points
-		assert sumbonuspts == 3.0, sumbonuspts
 
-	return bonuspts
+class JuryAssignment(models.Model):
+	"""
+	A jury member sitting in the panel of a room for a Physics Fight, see panels.py.
+	"""
 
+	jury = models.ForeignKey(Jury)
+	pf_number = models.IntegerField()
+	room = models.ForeignKey(Room)
 
-update_signal = Signal()
-@receiver(update_signal, sender=Round, dispatch_uid="update_all")
-def update_all(sender, **kwargs):
+	class Meta:
+		ordering = ['pf_number', 'room', 'jury']
+		unique_together = ('jury', 'pf_number')
+
+	def __unicode__(self):
+		return "%s in Fight %i, %s" % (self.jury, self.pf_number, self.room)
 
-	allrounds = Round.objects.filter(pf_number=1) | Round.objects.filter(pf_number=2) | Round.objects.filter(pf_number=3) | Round.objects.filter(pf_number=4) | Round.objects.filter(pf_number=5) | Round.objects.filter(pf_number=6)
-	allrounds = sorted(allrounds,key=lambda round : round.round_number, reverse=False)
 
+class Task(models.Model):
+	"""
+	A recomputation of the background queue, waiting, running or done, see tasks.py.
 
-	allgrades = JuryGrade.objects.all()
-	allteams = Team.objects.all()
+	The key tells what to recompute: "team:<pk>" (the team and its members), "problem:<pk>" or "fight:<pf_number>:<room pk>" (the standings of a Physics Fight), or "all" (see propagation.bulk_recompute). There is at most one queued task per key: queuing it again only pushes back the time it is due. The database enforces it, whatever the processes queuing at once: a queued task repeats its key in queued_key, unique, and the other tasks leave it NULL.
+	"""
 
+	STATE_CHOICES = (
+		('queued', 'Queued'),
+		('running', 'Running'),
+		('done', 'Done'),
+		('failed', 'Failed'),
+	)
 
-	if 1: # might still be some bugs, it is safer to delete all grades before reupdating everything.
+	key = models.CharField(max_length=50, db_index=True)
+	queued_key = models.CharField(max_length=50, null=True, blank=True, unique=True, editable=False)
+	state = models.CharField(max_length=10, choices=STATE_CHOICES, default='queued', db_index=True)
+	worker = models.CharField(max_length=50, blank=True)
+	created = models.DateTimeField(default=timezone.now)
+	due = models.DateTimeField(default=timezone.now, db_index=True)
+	started = models.DateTimeField(null=True, blank=True)
+	finished = models.DateTimeField(null=True, blank=True)
+	error = models.TextField(blank=True)
 
-		# remove the phantom grades, if any
-		rgrades = []
-		for round in allrounds:
-			mygrades = JuryGrade.objects.filter(round=round)
-			for grade in mygrades:
-				rgrades.append(grade)
+	def __unicode__(self):
+		return "%s (%s)" % (self.key, self.state)
+
+
+# keep the round as it is in the database, to know what has changed once it is saved
+@receiver(pre_save, sender=Round, dispatch_uid="snapshot_round")
+def snapshot_round(sender, instance, raw=False, **kwargs):
+	import propagation
+	if not raw:
+		instance._stored_snapshot = propagation.stored_snapshot(instance.pk)
+
+# method for updating Teams and Participants when rounds are saved
+@receiver(post_save, sender=Round, dispatch_uid="update_participant_team_points")
+def update_points(sender, instance, raw=False, **kwargs):
+	import propagation, tasks, problemstats, problemindex
+	print "Updating Round %s" % instance
+	if not raw:
+		old = instance.__dict__.pop('_stored_snapshot', None)
+		new = propagation.snapshot(instance)
+
+		# the rejections of the round count for another team or physics fight
+		if old is not None and (old['reporter_team_id'], old['pf_number']) != (new['reporter_team_id'], new['pf_number']):
+			invalidate_presentation_coefficients([old['reporter_team_id'], new['reporter_team_id']])
+
+		# the teams, participants, problems and fights the round counted for and counts for are recomputed in the background
+		tasks.enqueue(tasks.round_keys([old, new]))
+		problemstats.invalidate([new['problem_presented_id'], old and old['problem_presented_id']])
+		problemindex.invalidate(problemindex.changed_teams(old, new))
+
+@receiver(post_delete, sender=Round, dispatch_uid="remove_participant_team_points")
+def remove_points(sender, instance, **kwargs):
+	import propagation, tasks, problemstats, problemindex
+	snapshot = propagation.snapshot(instance)
+	tasks.enqueue(tasks.round_keys([snapshot]))
+	problemstats.invalidate([instance.problem_presented_id])
+	problemindex.invalidate(problemindex.changed_teams(snapshot, None))
+
+
+# method for invalidating the presentation coefficients when rejections are changed
+@receiver(pre_save, sender=TacticalRejection, dispatch_uid="move_rejection")
+@receiver(pre_save, sender=EternalRejection, dispatch_uid="move_rejection")
+def move_rejection(sender, instance, raw=False, **kwargs):
+	import problemindex
+	if instance.pk is not None:
+		teams = list(sender.objects.filter(pk=instance.pk).values_list('round__reporter_team', flat=True))
+		invalidate_presentation_coefficients(teams)
+		# the eternal rejections are part of the problem history of the team
+		if sender is EternalRejection:
+			problemindex.invalidate(teams)
+
+@receiver(post_save, sender=TacticalRejection, dispatch_uid="update_rejection")
+@receiver(post_save, sender=EternalRejection, dispatch_uid="update_rejection")
+@receiver(post_delete, sender=TacticalRejection, dispatch_uid="update_rejection")
+@receiver(post_delete, sender=EternalRejection, dispatch_uid="update_rejection")
+def update_rejection(sender, instance, **kwargs):
+	import problemindex
+	teams = list(Round.objects.filter(pk=instance.round_id).values_list('reporter_team', flat=True))
+	invalidate_presentation_coefficients(teams)
+	if sender is EternalRejection:
+		problemindex.invalidate(teams)
+
+
+# a new data version is needed whenever something is saved or deleted in the tournament, see rendercache
+@receiver(post_save, dispatch_uid="IPT2018_data_saved")
+@receiver(post_delete, dispatch_uid="IPT2018_data_deleted")
+def data_changed(sender, **kwargs):
+	# the tasks are only the bookkeeping of the queue
+	if sender._meta.app_label == 'IPT2018' and sender is not Task:
+		transaction.on_commit(bump_version)
 
-		i = 0
-		for grade in allgrades:
-			if grade not in rgrades:
-				i+=1
-				grade.delete()
-		print "I removed %i phantom grades..." % i
 
-		# reset the bonus points to zero
-		#for team in allteams:
-			#team.bonus_points = 0.0
+def bonuspoints():
+	"""
+	:return: dictionary {team pk: bonus points won in the qualifying fights}, from the fight standings
+	"""
+	bonuspts = dict((pk, 0.0) for pk in Team.objects.values_list('pk', flat=True))
+	for team, bonus in FightStanding.objects.filter(pf_number__in=pfs[:4]).order_by().values_list('team').annotate(Sum('bonus_points')):
+		bonuspts[team] = bonus
+	return bonuspts
 
 
-	# update rounds
-	for round in allrounds:
-		# we do not want to add the bonus points now, let's keep that for a next step (just to check, that might disappear later)
-		update_points(sender, instance=round)
-		#round.save()
-		#sys.exit()
+update_signal = Signal()
+@receiver(update_signal, sender=Round, dispatch_uid="update_all")
+def update_all(sender, **kwargs):
+	import propagation, tasks
 
 	# WARNING !!!
 	# bonus point computation becomes trickier when you have a four-team fights. I deactivite it for the moment and give you the option to add them by hand from the admin panel
-	# add the bonus points
+	# the bonus points are added to the team points in the recompute
 	# bonuspts = bonuspoints()
-	print "="*15
-	for team in allteams:
-		#print "----"
-		#print team.name, team.total_points, bonuspts[team]
-		team.total_points += team.bonus_points
-		team.semi_points += team.bonus_points
-		team.save()
-		#print team.total_points
-		pass
-
-	# just in case, update the problems
-	for pb in Problem.objects.all():
-		pb.update_scores()
-
-	return "Teams, participants and problems updated !"
 
+	# the full recompute takes a while on a whole tournament: it is left to the background queue, unless the tasks run right away
+	if not tasks.setting('EAGER', False):
+		tasks.enqueue(['all'])
+		return "Full recompute queued, see the tasks in the admin panel."
+
+	# remove the phantom grades, then update rounds, teams, participants and problems in one go
+	summary = propagation.bulk_recompute(verbose=True)
+
+	return "I removed %i phantom grades. Rounds (%i), teams (%i), participants (%i) and problems (%i) updated !" % (summary["phantom grades"], summary["Round"], summary["Team"], summary["Participant"], summary["Problem"])
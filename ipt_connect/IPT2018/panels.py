@@ -0,0 +1,240 @@
+# coding: utf8
+"""
+Assignment of the jury members to the rooms, Physics Fight by Physics Fight.
+
+The hard constraints:
+
+* a jury member only sits in the fights marked as available (Jury.pf1 to pf4, Jury.final for the semi-final and the final);
+* a jury member linked to a team (its Team Leader) never sits in a room where that team plays, the teams of a room being those of its rounds in the fight. Before the rounds of a fight are scheduled, there is no such conflict;
+* a panel has at most max_size jury members, the jury members left over are reserves.
+
+Among the assignments respecting them, the solver looks for the one with the lowest cost, the sum over the panels of:
+
+* the squared difference between the size of the panel and the mean size, plus a heavy penalty below min_size;
+* the squared difference between the number of Team Leaders in the panel and the mean number;
+* the squared sum of the harshness indices of the panel members, divided by its size (see jurystats): harsh and lenient jury members are mixed;
+* the number of teams of the room that a member already graded in a previous fight, and the number of pairs of members who already sat together: the panels change from one fight to the next.
+
+The fights are solved in order, each one knowing the panels of the previous ones. A fight starts from a greedy assignment, the most constrained jury members first, each one in the allowed room with the smallest panel; then a local search moves a member to another room, or swaps two members of different rooms, and keeps the change whenever the cost does not increase. Every fight is deterministic for a given seed and given previous panels, and takes well under a second per fight for 100 jury members and 10 rooms.
+"""
+import random
+from django.db import transaction
+from models import Jury, Room, Round, JuryAssignment, npf_tot
+
+
+# default bounds of the size of a panel
+min_size = 5
+max_size = 8
+
+# default weights of the parts of the cost
+weights = {"size": 10.0, "minimum": 1000.0, "leaders": 3.0, "harshness": 1.0, "repeat_team": 2.0, "repeat_pair": 1.0}
+
+# default number of moves tried per fight
+iterations = 5000
+
+
+def availability_field(pf_number):
+	"""
+	:param pf_number: number of a Physics Fight
+	:return: the field of Jury telling whether a jury member is available for the fight
+	"""
+	field = 'pf%i' % pf_number
+	if field in [f.name for f in Jury._meta.get_fields()]:
+		return field
+	return 'final'
+
+
+class Solver(object):
+	"""
+	Assignment of the jury members, fight after fight.
+
+	:param jurys: dictionary {jury pk: {"team": pk of the team of the jury member or None, "available": set of the fights, "harshness": harshness index or None}}
+	:param fights: dictionary {pf_number: {room pk: set of the pks of the teams playing in the room}}
+	"""
+
+	def __init__(self, jurys, fights, min_size=min_size, max_size=max_size, weights=weights, seed=2018):
+		self.jurys = jurys
+		self.fights = fights
+		self.min_size = min_size
+		self.max_size = max_size
+		self.weights = weights
+		self.seed = seed
+
+		# teams graded and fellow members of every jury member, in the previous fights
+		self.seen_teams = dict((jury, set()) for jury in jurys)
+		self.seen_pairs = set()
+
+	def remember(self, panels, teams):
+		"""
+		Record the panels of a fight, for the repetition costs of the next ones.
+
+		:param panels: {room pk: [jury pks]}
+		:param teams: {room pk: set of teams}
+		"""
+		for room, members in panels.items():
+			for jury in members:
+				self.seen_teams.setdefault(jury, set()).update(teams.get(room, ()))
+			for ind, jury in enumerate(members):
+				for other in members[ind+1:]:
+					self.seen_pairs.add(frozenset((jury, other)))
+
+	def allowed(self, jury, room, teams):
+		return self.jurys[jury]["team"] is None or self.jurys[jury]["team"] not in teams[room]
+
+	def panel_cost(self, members, teams, means):
+		"""
+		:param members: jury pks of a panel
+		:param teams: teams of its room
+		:param means: (mean panel size, mean number of Team Leaders per panel)
+		:return: the cost of the panel
+		"""
+		size = len(members)
+		cost = self.weights["size"] * (size - means[0]) ** 2 + self.weights["minimum"] * max(0, self.min_size - size) ** 2
+		cost += self.weights["leaders"] * (sum(1 for jury in members if self.jurys[jury]["team"] is not None) - means[1]) ** 2
+		if size:
+			cost += self.weights["harshness"] * sum(self.jurys[jury]["harshness"] or 0.0 for jury in members) ** 2 / size
+		cost += self.weights["repeat_team"] * sum(len(self.seen_teams[jury] & teams) for jury in members)
+		cost += self.weights["repeat_pair"] * sum(1 for ind, jury in enumerate(members) for other in members[ind+1:] if frozenset((jury, other)) in self.seen_pairs)
+		return cost
+
+	def solve_fight(self, pf_number, iterations=iterations):
+		"""
+		:param pf_number: number of the Physics Fight
+		:param iterations: number of moves tried
+		:return: a tuple (panels {room pk: [jury pks]}, reserves [jury pks], cost)
+		"""
+		teams = self.fights[pf_number]
+		self.rnd = random.Random(1000 * self.seed + pf_number)
+		rooms = sorted(teams)
+		candidates = sorted(jury for jury, data in self.jurys.items() if pf_number in data["available"])
+		allowed = dict((jury, [room for room in rooms if self.allowed(jury, room, teams)]) for jury in candidates)
+
+		# greedy start: the most constrained first, the Team Leaders before the others, each in the allowed room with the smallest panel
+		panels = dict((room, []) for room in rooms)
+		reserves = []
+		self.rnd.shuffle(candidates)
+		for jury in sorted(candidates, key=lambda jury: (len(allowed[jury]), self.jurys[jury]["team"] is None)):
+			free = [room for room in allowed[jury] if len(panels[room]) < self.max_size]
+			if free:
+				panels[min(free, key=lambda room: (len(panels[room]), self.rnd.random()))].append(jury)
+			else:
+				reserves.append(jury)
+
+		nassigned = sum(len(members) for members in panels.values())
+		nleaders = sum(1 for members in panels.values() for jury in members if self.jurys[jury]["team"] is not None)
+		means = (float(nassigned) / len(rooms), float(nleaders) / len(rooms)) if rooms else (0.0, 0.0)
+		costs = dict((room, self.panel_cost(panels[room], teams[room], means)) for room in rooms)
+
+		# local search
+		movable = [jury for jury in candidates if allowed[jury]]
+		location = dict((jury, room) for room, members in panels.items() for jury in members)
+		# nothing to move with a single room, or nobody available
+		for iteration in range(iterations if len(rooms) > 1 and movable else 0):
+			jury = self.rnd.choice(movable)
+			source = location.get(jury)
+			target = self.rnd.choice(allowed[jury])
+			if target == source:
+				continue
+			other = None
+			if len(panels[target]) >= self.max_size or (source is not None and self.rnd.random() < 0.5):
+				# swap with a member of the target room who may take our place, a reserve joins a room with a free seat without a swap
+				swappable = [member for member in panels[target] if source is None or source in allowed[member]]
+				if not swappable:
+					continue
+				other = self.rnd.choice(swappable)
+
+			changed = [room for room in (source, target) if room is not None]
+			before = sum(costs[room] for room in changed)
+			newpanels = dict((room, [member for member in panels[room] if member not in (jury, other)]) for room in changed)
+			newpanels[target].append(jury)
+			if other is not None and source is not None:
+				newpanels[source].append(other)
+			newcosts = dict((room, self.panel_cost(newpanels[room], teams[room], means)) for room in changed)
+			if sum(newcosts.values()) <= before:
+				panels.update(newpanels)
+				costs.update(newcosts)
+				location[jury] = target
+				if other is None:
+					if source is None:
+						reserves.remove(jury)
+				else:
+					if source is None:
+						del location[other]
+						reserves.remove(jury)
+						reserves.append(other)
+					else:
+						location[other] = source
+
+		for members in panels.values():
+			members.sort()
+		return panels, sorted(reserves), sum(costs.values())
+
+	def solve(self, pf_numbers, iterations=iterations):
+		"""
+		:param pf_numbers: the Physics Fights to solve, in order
+		:param iterations: number of moves tried per fight
+		:return: dictionary {pf_number: (panels, reserves, cost)}, see solve_fight
+		"""
+		res = {}
+		for pf in pf_numbers:
+			res[pf] = self.solve_fight(pf, iterations)
+			self.remember(res[pf][0], self.fights[pf])
+		return res
+
+
+def load(pf_numbers, harshness=None):
+	"""
+	Read what the solver needs from the database.
+
+	:param pf_numbers: the Physics Fights to assign
+	:param harshness: dictionary {jury pk: harshness index}, see jurystats, None to ignore the harshness
+	:return: a tuple (jurys, fights, history, teams): jurys and fights for Solver, the panels {pf_number: {room pk: [jury pks]}} of the previous fights, and the teams {pf_number: {room pk: set of teams}} of the rooms of every scheduled fight
+	"""
+	fields = dict((pf, availability_field(pf)) for pf in range(1, npf_tot+1))
+	jurys = {}
+	for row in Jury.objects.values('pk', 'team', *set(fields.values())):
+		jurys[row['pk']] = {"team": row['team'], "available": set(pf for pf, field in fields.items() if row[field]), "harshness": (harshness or {}).get(row['pk'])}
+
+	# teams of every room of every fight, from the rounds
+	teams = {}
+	for pf, room, rep, opp, rev in Round.objects.values_list('pf_number', 'room', 'reporter_team', 'opponent_team', 'reviewer_team'):
+		teams.setdefault(pf, {}).setdefault(room, set()).update(team for team in (rep, opp, rev) if team is not None)
+
+	# the fights without rounds yet may take place in every room
+	rooms = list(Room.objects.values_list('pk', flat=True))
+	fights = dict((pf, teams.get(pf) or dict((room, set()) for room in rooms)) for pf in pf_numbers)
+
+	history = {}
+	for jury, pf, room in JuryAssignment.objects.exclude(pf_number__in=pf_numbers).filter(pf_number__lt=max(pf_numbers)).values_list('jury', 'pf_number', 'room'):
+		history.setdefault(pf, {}).setdefault(room, []).append(jury)
+	return jurys, fights, history, teams
+
+
+def assign(pf_numbers, seed=2018, iterations=iterations, use_harshness=True, save=True):
+	"""
+	Compute the panels of some Physics Fights, and store them in place of the current ones.
+
+	:param pf_numbers: the Physics Fights to assign
+	:param seed: seed of the random moves
+	:param iterations: number of moves tried per fight
+	:param use_harshness: mix the harsh and the lenient jury members, see jurystats
+	:param save: store the panels
+	:return: dictionary {pf_number: (panels, reserves, cost)}, see Solver.solve_fight
+	"""
+	pf_numbers = sorted(pf_numbers)
+	harshness = None
+	if use_harshness:
+		import jurystats
+		harshness = dict((jury, stats["harshness"]) for jury, stats in jurystats.jury_statistics().items())
+	jurys, fights, history, teams = load(pf_numbers, harshness)
+
+	solver = Solver(jurys, fights, seed=seed)
+	for pf, panels in sorted(history.items()):
+		solver.remember(panels, teams.get(pf, {}))
+	res = solver.solve(pf_numbers, iterations)
+
+	if save:
+		with transaction.atomic():
+			JuryAssignment.objects.filter(pf_number__in=pf_numbers).delete()
+			JuryAssignment.objects.bulk_create([JuryAssignment(jury_id=jury, pf_number=pf, room_id=room) for pf, (panels, reserves, cost) in sorted(res.items()) for room, members in sorted(panels.items()) for jury in members])
+	return res
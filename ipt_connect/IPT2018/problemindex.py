@@ -0,0 +1,145 @@
+# coding: utf8
+"""
+Problem history of the teams, for the problems the Opponent may challenge the Reporter on (see Round.unavailable_problems).
+
+The history of a team is the list of the problems it permanently rejected, presented and opposed, with the Physics Fight of each, so that the bans of any round are read from the histories of its Reporter and Opponent: one cache lookup for both teams. A missing history is rebuilt with two queries, for all the missing teams at once.
+
+The histories are kept in the cache team by team. Saving a round only drops those of its Reporter and Opponent, before and after the change, and only if the fight, the teams or the problem presented changed (see models.update_points): entering the grades leaves them untouched. Saving or deleting an eternal rejection drops the history of the Reporter of its round.
+
+The histories only live for history_timeout: a request racing a change may cache a history read before it, which the deletion on commit can miss.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from models import Round, Problem, EternalRejection
+
+
+# the rules of the challenge, and the history and team they read
+rules = [
+	('a', 'eternal', 'reporter'),		# permanently rejected by the Reporter earlier
+	('b', 'presented', 'reporter'),		# presented by the Reporter earlier
+	('c', 'opposed', 'opponent'),		# opposed by the Opponent earlier
+	('d', 'presented', 'opponent'),		# presented by the Opponent earlier
+]
+
+# the values of a round the histories depend on
+history_fields = ('pf_number', 'reporter_team_id', 'opponent_team_id', 'problem_presented_id')
+
+
+# seconds a history is kept in the cache
+history_timeout = 600
+
+
+def cache_key(pk):
+	return "IPT2018:problemindex:%s" % pk
+
+
+def invalidate(teams):
+	"""
+	Remove the cached histories of some teams.
+
+	They are removed right away, for the current transaction to see the new histories, and again once the transaction is committed, in case another request cached them in the meantime.
+
+	:param teams: list of Team primary keys, possibly None
+	"""
+	keys = [cache_key(team) for team in set(teams) if team is not None]
+	if keys:
+		cache.delete_many(keys)
+		transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def changed_teams(old, new):
+	"""
+	:param old: snapshot of a round before it was saved, None if it is new or deleted (see propagation.snapshot)
+	:param new: snapshot of the round once saved, None if deleted
+	:return: the teams whose history changed
+	"""
+	values = [snapshot and tuple(snapshot[field] for field in history_fields) for snapshot in (old, new)]
+	if values[0] == values[1]:
+		return []
+	return [snapshot[field] for snapshot in (old, new) if snapshot is not None for field in ('reporter_team_id', 'opponent_team_id')]
+
+
+def compute(teams):
+	"""
+	:param teams: list of Team primary keys
+	:return: dictionary {team pk: history}, the history being a dictionary with:
+		"eternal": list of the (pf_number, problem pk) of its eternal rejections, in the order they were entered,
+		"presented": list of the (pf_number, problem pk) of the problems it presented,
+		"opposed": list of the (pf_number, problem pk) of the problems it opposed
+	"""
+	histories = dict((pk, {"eternal": [], "presented": [], "opposed": []}) for pk in teams)
+
+	rounds = Round.objects.filter(Q(reporter_team__in=teams) | Q(opponent_team__in=teams), problem_presented__isnull=False)
+	for pf, reporter, opponent, problem in rounds.order_by('pf_number', 'round_number').values_list('pf_number', 'reporter_team', 'opponent_team', 'problem_presented'):
+		if reporter in histories:
+			histories[reporter]["presented"].append((pf, problem))
+		if opponent in histories:
+			histories[opponent]["opposed"].append((pf, problem))
+
+	for team, pf, problem in EternalRejection.objects.filter(round__reporter_team__in=teams).order_by('pk').values_list('round__reporter_team', 'round__pf_number', 'problem'):
+		histories[team]["eternal"].append((pf, problem))
+
+	return histories
+
+
+def histories(teams):
+	"""
+	:param teams: list of Team primary keys
+	:return: dictionary {team pk: history}, see compute, from the cache when possible
+	"""
+	teams = [team for team in set(teams) if team is not None]
+	cached = cache.get_many([cache_key(pk) for pk in teams])
+	res = dict((pk, cached[cache_key(pk)]) for pk in teams if cache_key(pk) in cached)
+	missing = [pk for pk in teams if pk not in res]
+	if missing:
+		computed = compute(missing)
+		cache.set_many(dict((cache_key(pk), value) for pk, value in computed.items()), history_timeout)
+		res.update(computed)
+	return res
+
+
+def bans(round):
+	"""
+	:param round: a Round instance
+	:return: dictionary {rule: list of the problem pks banned by the rule}, for the rules a), b), c) and d), see Round.unavailable_problems
+	"""
+	teams = {'reporter': round.reporter_team_id, 'opponent': round.opponent_team_id}
+	known = histories(teams.values())
+	res = {}
+	for rule, kind, role in rules:
+		earlier = [problem for pf, problem in known.get(teams[role], {}).get(kind, []) if pf < round.pf_number]
+		# only the first eternal rejection counts
+		res[rule] = earlier[:1] if kind == 'eternal' else earlier
+	return res
+
+
+def presented_this_pf(round):
+	"""
+	:param round: a Round instance
+	:return: list of the problem pks already presented in the fight, in the room of the round, before it
+	"""
+	rounds = Round.objects.filter(pf_number=round.pf_number, room=round.room_id, round_number__lt=round.round_number, problem_presented__isnull=False)
+	return list(rounds.order_by('round_number').values_list('problem_presented', flat=True))
+
+
+def challengeable(round, problems=None):
+	"""
+	The problems the Opponent may challenge the Reporter on, lifting the bans d), c), b), a) in that order if no problem is left.
+
+	:param round: a Round instance
+	:param problems: the problem pks of the tournament, all of them by default
+	:return: a tuple (list of the problem pks, list of the rules lifted)
+	"""
+	if problems is None:
+		problems = list(Problem.objects.order_by('pk').values_list('pk', flat=True))
+	banned = bans(round)
+	thispf = set(presented_this_pf(round))
+	active = [rule for rule, kind, role in rules]
+	lifted = []
+	while True:
+		excluded = thispf.union(*[banned[rule] for rule in active])
+		available = [problem for problem in problems if problem not in excluded]
+		if available or not active:
+			return available, lifted
+		lifted.append(active.pop())
@@ -0,0 +1,138 @@
+# coding: utf8
+"""
+Statistics of the problems: how many times every problem was presented, the mean scores of the reporters, opponents and reviewers on it, and the scores of every team on it, role by role.
+
+Only the rounds with grades count for the scores. The statistics of all the problems are computed at once, with two grouped queries and one values() query, and kept in the cache problem by problem, under a version of the problem: saving or deleting a round moves its problem, before and after the change, to a new version (see models.update_points), the other problems keep theirs.
+
+The new version is taken right away, for the current transaction to see the new statistics, and again once the transaction is committed: a request racing the change may cache statistics computed before it, under the version the commit then leaves behind.
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count
+from models import Round, Team, JuryGrade
+
+
+# roles in a round, and their names in the statistics
+roles = [('reporter', 'reports'), ('opponent', 'oppositions'), ('reviewer', 'reviews')]
+
+
+# the statistics are only dropped when the cache is full, a new version makes them unreachable anyway
+stats_timeout = None
+
+
+def version_key(pk):
+	return "IPT2018:problemstats:version:%s" % pk
+
+
+def cache_key(pk, version=None):
+	return "IPT2018:problemstats:%s:%s" % (pk, version or versions([pk])[pk])
+
+
+def versions(problems):
+	"""
+	:param problems: list of Problem primary keys
+	:return: dictionary {problem pk: current version of its statistics}
+	"""
+	keys = dict((pk, version_key(pk)) for pk in problems)
+	cached = cache.get_many(keys.values())
+	missing = [key for key in keys.values() if key not in cached]
+	if missing:
+		# first call, or the version was dropped from the cache: start a new one, greater than all the previous ones, as the data version does (see api.data_version)
+		now = int(time.time() * 1e6)
+		for key in missing:
+			cache.add(key, now, None)
+		cached.update(cache.get_many(missing))
+	return dict((pk, cached[key]) for pk, key in keys.items())
+
+
+def bump_versions(problems):
+	"""
+	Move some problems to a new version of their statistics.
+
+	:param problems: list of Problem primary keys
+	"""
+	now = int(time.time() * 1e6)
+	current = cache.get_many([version_key(pk) for pk in problems])
+	cache.set_many(dict((version_key(pk), max(now, current.get(version_key(pk), 0) + 1)) for pk in problems), None)
+
+
+def invalidate(problems):
+	"""
+	Drop the cached statistics of some problems, right away and once the current transaction is committed.
+
+	:param problems: list of Problem primary keys, possibly None
+	"""
+	problems = set(problem for problem in problems if problem is not None)
+	if problems:
+		bump_versions(problems)
+		transaction.on_commit(lambda: bump_versions(problems))
+
+
+def graded_rounds():
+	"""
+	:return: the rounds which have grades
+	"""
+	return Round.objects.filter(pk__in=JuryGrade.objects.values('round'))
+
+
+def compute(problems):
+	"""
+	:param problems: list of Problem primary keys
+	:return: dictionary {problem pk: statistics}, the statistics being a dictionary with:
+		"npres": the number of rounds the problem was presented in,
+		"means": the mean (score_reporter, score_opponent, score_reviewer) of its graded rounds, zeros if none,
+		"teams": dictionary {team pk: {"reports": [(round pk, score)], "oppositions": [...], "reviews": [...]}} of the teams which played it in a graded round
+	"""
+	stats = dict((pk, {"npres": 0, "means": (0.0, 0.0, 0.0), "teams": {}}) for pk in problems)
+
+	presented = Round.objects.filter(problem_presented__in=problems).order_by().values_list('problem_presented').annotate(Count('pk'))
+	for problem, npres in presented:
+		stats[problem]["npres"] = npres
+
+	graded = graded_rounds().filter(problem_presented__in=problems)
+	means = graded.order_by().values_list('problem_presented').annotate(Avg('score_reporter'), Avg('score_opponent'), Avg('score_reviewer'))
+	for problem, rep, opp, rev in means:
+		stats[problem]["means"] = (rep, opp, rev)
+
+	fields = ['pk', 'problem_presented'] + [role + '_team' for role, name in roles] + ['score_' + role for role, name in roles]
+	for round in graded.order_by('pk').values(*fields):
+		teams = stats[round['problem_presented']]["teams"]
+		for role, name in roles:
+			team = round[role + '_team']
+			if team is not None:
+				teams.setdefault(team, dict((key, []) for r, key in roles))[name].append((round['pk'], round['score_' + role]))
+
+	return stats
+
+
+def statistics(problems):
+	"""
+	:param problems: list of Problem primary keys
+	:return: dictionary {problem pk: statistics}, see compute, from the cache when possible
+	"""
+	keys = dict((pk, cache_key(pk, version)) for pk, version in versions(problems).items())
+	cached = cache.get_many(keys.values())
+	stats = dict((pk, cached[keys[pk]]) for pk in problems if keys[pk] in cached)
+	missing = [pk for pk in problems if pk not in stats]
+	if missing:
+		computed = compute(missing)
+		cache.set_many(dict((keys[pk], value) for pk, value in computed.items()), stats_timeout)
+		stats.update(computed)
+	return stats
+
+
+def team_results(stats):
+	"""
+	:param stats: statistics of a problem, see compute
+	:return: list of the results of the teams, ordered by name, as dictionaries {"name": name of the team, "reports": [{"round": round pk, "value": score}], "oppositions": [...], "reviews": [...]}
+	"""
+	names = dict(Team.objects.filter(pk__in=stats["teams"].keys()).values_list('pk', 'name'))
+	results = []
+	for team, scores in stats["teams"].items():
+		result = {"name": names[team]}
+		for role, key in roles:
+			result[key] = [{"round": round, "value": value} for round, value in scores[key]]
+		results.append(result)
+	results.sort(key=lambda result: result["name"])
+	return results
@@ -0,0 +1,51 @@
+# coding: utf8
+"""
+Render cache of the public pages, keyed on the tournament data version.
+
+Every change to the tournament data (a round, a grade, a rejection, a team...) bumps the data version once the transaction is committed, see IPT2018.models.data_changed. The rendered pages are stored under the current version, and are served until the next bump, however long that takes.
+
+The version and the pages are kept in the default cache, which must be shared by all the worker processes (file-based or database cache, memcached...) for a bump in one worker to be seen by the others.
+"""
+from hashlib import md5
+from functools import wraps
+from django.core.cache import cache
+from ipt_connect import api
+
+
+page_timeout = None		# pages are only dropped when the cache is full, a new version makes them unreachable anyway
+
+
+def data_version():
+	"""
+	:return: the current tournament data version, the one the JSON API gives too
+	"""
+	return api.data_version('IPT2018')
+
+
+def bump_version():
+	"""
+	Move to a new tournament data version.
+	"""
+	return api.bump_version('IPT2018')
+
+
+def cache_per_version(view):
+	"""
+	Decorator caching the successful GET responses of a view until the tournament data version changes.
+	"""
+	@wraps(view)
+	def wrapper(request, *args, **kwargs):
+		if request.method not in ('GET', 'HEAD'):
+			return view(request, *args, **kwargs)
+
+		# the pages may give the version they were rendered at to their scripts, see live.py
+		request.data_version = data_version()
+		key = "IPT2018:page:%s:%s" % (request.data_version, md5(request.get_full_path()).hexdigest())
+		response = cache.get(key)
+		if response is None:
+			response = view(request, *args, **kwargs)
+			if response.status_code == 200 and not response.streaming:
+				cache.set(key, response, page_timeout)
+		return response
+	return wrapper
+
@@ -0,0 +1,284 @@
+# coding: utf8
+"""
+Schedule of the Physics Fights: which teams meet in which room, and in which order they report.
+
+Every room of a fight gathers three or four teams, one round per team: in the round n, the n-th team of the room reports, the next one opposes and the one after reviews, as in the rounds created by hand. In the qualifying fights, the teams of a room all come from the same pool (Team.pool, the teams without a pool or not attributed may join any room); in the semi-final, the pools are ignored.
+
+The fights are scheduled in order, each one knowing the previous ones, scheduled or played. A fight starts from the teams of every pool cut into rooms, then a local search swaps two teams of different rooms whenever the cost does not increase. The cost of a room is:
+
+* the squared number of times every pair of its teams already met: the teams meet new teams at every fight;
+* the number of times its teams already played in a room of four teams, if it is one: those fights are the long ones, with a round as observer.
+
+The order of the teams of every room is then the one, out of all the possible ones, that varies the most the round in which the teams report and who opposes and reviews whom. 40 teams are scheduled in a fraction of a second per fight.
+"""
+import itertools
+import random
+from django.db import transaction
+from models import Team, Room, Round, JuryGrade, npf, pfs
+from rendercache import bump_version
+
+
+# default weights of the parts of the cost
+weights = {"meeting": 10.0, "four": 3.0, "report_round": 1.0, "opposition": 2.0, "review": 1.0}
+
+# default number of swaps tried per fight
+iterations = 20000
+
+# the positions of the reporter, opponent and reviewer of a round, relative to the round number
+shifts = (0, 1, 2)
+
+
+def room_rounds(teams):
+	"""
+	:param teams: the teams of a room, in order
+	:return: list of the (reporter, opponent, reviewer) of its rounds
+	"""
+	return [tuple(teams[(rn+shift) % len(teams)] for shift in shifts) for rn in range(len(teams))]
+
+
+def room_sizes(nteams):
+	"""
+	:param nteams: number of teams
+	:return: the sizes of the rooms of three or four teams gathering them, as many rooms as possible, None if impossible
+	"""
+	if nteams == 0:
+		return []
+	nrooms = nteams // 3
+	if nrooms == 0 or nteams - 3*nrooms > nrooms:
+		return None
+	return [4] * (nteams - 3*nrooms) + [3] * (nrooms - nteams + 3*nrooms)
+
+
+class Scheduler(object):
+	"""
+	Schedule of the teams, fight after fight.
+
+	:param pools: dictionary {team pk: pool of the team, None if it may join any room}
+	"""
+
+	def __init__(self, pools, weights=weights, seed=2018):
+		self.pools = pools
+		self.weights = weights
+		self.seed = seed
+
+		# what the teams already did in the previous fights
+		self.meetings = {}
+		self.fours = dict((team, 0) for team in pools)
+		self.report_rounds = {}
+		self.oppositions = {}
+		self.reviews = {}
+
+	def remember(self, rooms):
+		"""
+		Record the rooms of a fight, for the costs of the next ones.
+
+		:param rooms: list of the teams of every room, in order
+		"""
+		for teams in rooms:
+			for pair in itertools.combinations(sorted(teams), 2):
+				self.meetings[pair] = self.meetings.get(pair, 0) + 1
+			if len(teams) > 3:
+				for team in teams:
+					self.fours[team] = self.fours.get(team, 0) + 1
+			for rn, (rep, opp, rev) in enumerate(room_rounds(teams)):
+				self.report_rounds[rep, rn] = self.report_rounds.get((rep, rn), 0) + 1
+				self.oppositions[rep, opp] = self.oppositions.get((rep, opp), 0) + 1
+				self.reviews[rep, rev] = self.reviews.get((rep, rev), 0) + 1
+
+	def groups(self, teams, use_pools=True):
+		"""
+		Split the teams of a fight in groups of the same pool, each one cut into rooms of three or four teams.
+
+		:param teams: the team pks
+		:param use_pools: whether the teams of a room come from the same pool
+		:return: list of (list of the teams, list of the sizes of its rooms), the teams without a pool being spread in the groups
+		"""
+		if not use_pools:
+			sizes = room_sizes(len(teams))
+			if sizes is None:
+				raise ValueError("%i teams cannot be split into rooms of three or four teams" % len(teams))
+			return [(list(teams), sizes)]
+
+		pools = {}
+		for team in teams:
+			pools.setdefault(self.pools[team], []).append(team)
+		free = pools.pop(None, [])
+		names = sorted(pools)
+
+		# the teams without a pool complete the pools, as few of them as possible, the others make rooms of their own
+		best = None
+		for split in itertools.product(range(len(free)+1), repeat=len(names)):
+			if sum(split) > len(free):
+				continue
+			counts = [len(pools[name]) + extra for name, extra in zip(names, split)] + [len(free) - sum(split)]
+			sizes = [room_sizes(count) for count in counts]
+			if None in sizes:
+				continue
+			key = (-sum(len(size) for size in sizes), sum(split))
+			if best is None or key < best[0]:
+				best = (key, split, sizes)
+		if best is None:
+			raise ValueError("The pools %s cannot be split into rooms of three or four teams" % ", ".join("%s (%i teams)" % (name, len(pools[name])) for name in names))
+
+		key, split, sizes = best
+		res, start = [], 0
+		for name, extra, size in zip(names, split, sizes):
+			res.append((pools[name] + free[start:start+extra], size))
+			start += extra
+		if start < len(free):
+			res.append((free[start:], sizes[-1]))
+		return res
+
+	def room_cost(self, teams):
+		"""
+		:param teams: the teams of a room
+		:return: the cost of the room, whatever the order of the teams
+		"""
+		cost = self.weights["meeting"] * sum(self.meetings.get(pair, 0) ** 2 for pair in itertools.combinations(sorted(teams), 2))
+		if len(teams) > 3:
+			cost += self.weights["four"] * sum(self.fours.get(team, 0) for team in teams)
+		return cost
+
+	def order_cost(self, teams):
+		"""
+		:param teams: the teams of a room, in order
+		:return: the cost of the order: report rounds, oppositions and reviews already seen
+		"""
+		cost = 0.0
+		for rn, (rep, opp, rev) in enumerate(room_rounds(teams)):
+			cost += self.weights["report_round"] * self.report_rounds.get((rep, rn), 0)
+			cost += self.weights["opposition"] * (self.oppositions.get((rep, opp), 0) + self.oppositions.get((opp, rep), 0))
+			cost += self.weights["review"] * self.reviews.get((rep, rev), 0)
+		return cost
+
+	def pure(self, teams):
+		return len(set(self.pools[team] for team in teams) - set([None])) <= 1
+
+	def schedule_fight(self, pf_number, teams, use_pools=True, iterations=iterations):
+		"""
+		:param pf_number: number of the Physics Fight
+		:param teams: the pks of the teams playing it
+		:param use_pools: whether the teams of a room come from the same pool
+		:param iterations: number of swaps tried
+		:return: a tuple (list of the teams of every room, in order, cost)
+		"""
+		rnd = random.Random(1000 * self.seed + pf_number)
+		rooms = []
+		for group, sizes in self.groups(sorted(teams), use_pools):
+			rnd.shuffle(group)
+			for size in sizes:
+				rooms.append(group[:size])
+				group = group[size:]
+		if not rooms:
+			return [], 0.0
+
+		# local search on the rooms
+		costs = [self.room_cost(room) for room in rooms]
+		for iteration in range(iterations if len(rooms) > 1 else 0):
+			first, second = rnd.sample(range(len(rooms)), 2)
+			i, j = rnd.randrange(len(rooms[first])), rnd.randrange(len(rooms[second]))
+			newfirst, newsecond = list(rooms[first]), list(rooms[second])
+			newfirst[i], newsecond[j] = rooms[second][j], rooms[first][i]
+			if use_pools and not (self.pure(newfirst) and self.pure(newsecond)):
+				continue
+			newcosts = self.room_cost(newfirst), self.room_cost(newsecond)
+			if sum(newcosts) <= costs[first] + costs[second]:
+				rooms[first], rooms[second] = newfirst, newsecond
+				costs[first], costs[second] = newcosts
+
+		# the best order of every room
+		cost = sum(costs)
+		for ind, room in enumerate(rooms):
+			orders = [list(order) for order in itertools.permutations(sorted(room))]
+			rooms[ind] = min(orders, key=self.order_cost)
+			cost += self.order_cost(rooms[ind])
+		return rooms, cost
+
+	def schedule(self, fights, pooled=None, iterations=iterations):
+		"""
+		:param fights: list of (pf_number, team pks), in order
+		:param pooled: function telling from the number of a fight whether its rooms respect the pools, by default all of them do
+		:param iterations: number of swaps tried per fight
+		:return: dictionary {pf_number: (rooms, cost)}, see schedule_fight
+		"""
+		res = {}
+		for pf, teams in fights:
+			res[pf] = self.schedule_fight(pf, teams, pooled(pf) if pooled else True, iterations)
+			self.remember(res[pf][0])
+		return res
+
+
+def qualifying(pf_number):
+	"""
+	:return: whether the Physics Fight is a qualifying one, whose rooms respect the pools
+	"""
+	return pf_number in pfs[:4]
+
+
+def fight_teams(pf_number):
+	"""
+	:param pf_number: number of a Physics Fight
+	:return: the pks of the teams playing it by default: all of them in the qualifying fights, the teams in the semi-final in the semi-final
+	"""
+	if qualifying(pf_number):
+		return list(Team.objects.values_list('pk', flat=True))
+	if npf > 4 and pf_number in pfs[4:]:
+		return list(Team.objects.filter(is_in_semi=True).values_list('pk', flat=True))
+	raise ValueError("The teams of Fight %i must be given" % pf_number)
+
+
+def history(exclude):
+	"""
+	:param exclude: the Physics Fights to leave out
+	:return: dictionary {pf_number: list of the teams of every room, in the order of their report}, from the rounds already created
+	"""
+	rooms = {}
+	for pf, room, team in Round.objects.exclude(pf_number__in=exclude).filter(reporter_team__isnull=False).order_by('pf_number', 'room', 'round_number').values_list('pf_number', 'room', 'reporter_team'):
+		rooms.setdefault(pf, {}).setdefault(room, []).append(team)
+	return dict((pf, list(fight.values())) for pf, fight in rooms.items())
+
+
+def generate(pf_numbers, teams=None, seed=2018, iterations=iterations, replace=False, save=True):
+	"""
+	Schedule some Physics Fights, and create their rounds, without participants nor problems.
+
+	:param pf_numbers: the Physics Fights to schedule
+	:param teams: the pks of the teams playing them, by default see fight_teams
+	:param seed: seed of the random swaps
+	:param iterations: number of swaps tried per fight
+	:param replace: delete the rounds of these fights first, unless they have grades; otherwise, scheduling a fight with rounds is an error
+	:param save: create the rounds
+	:return: dictionary {pf_number: (list of (Room, list of the teams in order)), cost)}
+	"""
+	import propagation, tasks
+	pf_numbers = sorted(pf_numbers)
+	existing = Round.objects.filter(pf_number__in=pf_numbers)
+	if save and existing.exists():
+		if not replace:
+			raise ValueError("Fights %s already have rounds" % ", ".join(str(pf) for pf in sorted(set(existing.values_list('pf_number', flat=True)))))
+		if JuryGrade.objects.filter(round__in=existing).exists():
+			raise ValueError("Fights %s already have grades" % ", ".join(str(pf) for pf in sorted(set(existing.filter(jurygrade__isnull=False).values_list('pf_number', flat=True)))))
+
+	pools = dict((pk, pool if pool in ('A', 'B') else None) for pk, pool in Team.objects.values_list('pk', 'pool'))
+	scheduler = Scheduler(pools, seed=seed)
+	for pf, rooms in sorted(history(pf_numbers).items()):
+		if pf < pf_numbers[-1]:
+			scheduler.remember(rooms)
+	res = scheduler.schedule([(pf, teams if teams is not None else fight_teams(pf)) for pf in pf_numbers], qualifying, iterations)
+
+	allrooms = list(Room.objects.order_by('name'))
+	for pf, (rooms, cost) in res.items():
+		if len(rooms) > len(allrooms):
+			raise ValueError("Fight %i needs %i rooms, there are %i" % (pf, len(rooms), len(allrooms)))
+		res[pf] = (zip(allrooms, rooms), cost)
+
+	if save:
+		rounds = [Round(pf_number=pf, round_number=rn+1, room=room, reporter_team_id=rep, opponent_team_id=opp, reviewer_team_id=rev)
+			for pf, (rooms, cost) in sorted(res.items()) for room, teams in rooms for rn, (rep, opp, rev) in enumerate(room_rounds(teams))]
+		with transaction.atomic():
+			existing.delete()
+			Round.objects.bulk_create(rounds)
+			# the bulk writes do not send any signal
+			tasks.enqueue(tasks.round_keys([propagation.snapshot(round) for round in rounds]))
+			transaction.on_commit(bump_version)
+	return res
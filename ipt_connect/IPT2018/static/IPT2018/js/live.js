@@ -0,0 +1,170 @@
+/*
+ * Live updates of the tables of a page, see IPT2018/live.py.
+ *
+ * The page contains <div id="live" data-url="..." data-version="..."> with the live url and the data version it was rendered at.
+ * The tables (or rows) to update have a data-live attribute with their name in the live state, their rows a data-row attribute
+ * with their key, and the cells a data-col attribute with their index in the values of the row, and optionally a data-format:
+ * "ordinal", or a number of decimals.
+ *
+ * The tables with a data-emphase attribute are rankings: their rows are kept ordered by their first value, and the first ones are
+ * emphasised. Whenever a row appears or disappears, the page is reloaded.
+ */
+(function () {
+	var live = document.getElementById('live');
+	if (!live || !window.XMLHttpRequest || !window.JSON) {
+		return;
+	}
+	var url = live.getAttribute('data-url');
+	var version = live.getAttribute('data-version');
+	var interval = 2000;	// least ms between two requests, the server may change it
+	var retry = 5000;	// ms before asking again after a network error
+
+	function ordinal(n) {
+		var suffixes = ['th', 'st', 'nd', 'rd'];
+		var v = n % 100;
+		return n + (suffixes[(v - 20) % 10] || suffixes[v] || suffixes[0]);
+	}
+
+	function format(value, fmt) {
+		if (value === null) {
+			return '';
+		}
+		if (fmt === 'ordinal') {
+			return ordinal(value);
+		}
+		if (fmt) {
+			return Number(value).toFixed(parseInt(fmt, 10));
+		}
+		return String(value);
+	}
+
+	// rows of a live element, by key, leaving aside the rows which are live elements by themselves
+	function rowsOf(element) {
+		var res = {};
+		if (element.hasAttribute('data-row')) {
+			res[element.getAttribute('data-row')] = element;
+			return res;
+		}
+		var rows = element.querySelectorAll('[data-row]');
+		for (var i = 0; i < rows.length; i++) {
+			if (!rows[i].hasAttribute('data-live')) {
+				res[rows[i].getAttribute('data-row')] = rows[i];
+			}
+		}
+		return res;
+	}
+
+	function patch(row, values) {
+		for (var i = 0; i < values.length; i++) {
+			var cell = row.querySelector('[data-col="' + i + '"]');
+			if (cell) {
+				var target = cell.querySelector('p') || cell;
+				target.textContent = format(values[i], cell.getAttribute('data-format'));
+			}
+		}
+	}
+
+	function emphase(cell, on) {
+		var p = cell.querySelector('p.emphase');
+		if (on && !p) {
+			p = document.createElement('p');
+			p.className = 'emphase';
+			while (cell.firstChild) {
+				p.appendChild(cell.firstChild);
+			}
+			cell.appendChild(p);
+		} else if (!on && p) {
+			while (p.firstChild) {
+				cell.insertBefore(p.firstChild, p);
+			}
+			cell.removeChild(p);
+		}
+	}
+
+	function rank(table) {
+		var rows = [];
+		var keys = rowsOf(table);
+		for (var key in keys) {
+			rows.push(keys[key]);
+		}
+		rows.sort(function (a, b) {
+			return parseInt(a.querySelector('[data-col="0"]').textContent, 10) - parseInt(b.querySelector('[data-col="0"]').textContent, 10);
+		});
+		var top = parseInt(table.getAttribute('data-emphase'), 10);
+		for (var i = 0; i < rows.length; i++) {
+			rows[i].parentNode.appendChild(rows[i]);
+			for (var j = 0; j < rows[i].cells.length; j++) {
+				emphase(rows[i].cells[j], i < top);
+			}
+		}
+	}
+
+	// patch the page, return false if it has to be reloaded instead
+	function apply(changes, full) {
+		for (var name in changes) {
+			var rows = changes[name];
+			var element = document.querySelector('[data-live="' + name + '"]');
+			if (!element) {
+				for (var key in rows) {
+					return false;
+				}
+				continue;
+			}
+			var onpage = rowsOf(element);
+			for (key in rows) {
+				if (rows[key] === null || !onpage[key]) {
+					return false;
+				}
+				patch(onpage[key], rows[key]);
+			}
+			if (full) {
+				for (key in onpage) {
+					if (!(key in rows)) {
+						return false;
+					}
+				}
+			}
+			if (element.hasAttribute('data-emphase')) {
+				rank(element);
+			}
+		}
+		return true;
+	}
+
+	// the server holds the request until the data changes, or answers right away when busy: ask again at most every interval
+	function poll() {
+		var start = new Date().getTime();
+		var xhr = new XMLHttpRequest();
+		function next() {
+			setTimeout(poll, Math.max(interval - (new Date().getTime() - start), 0));
+		}
+		xhr.open('GET', url + '?since=' + version);
+		xhr.onload = function () {
+			// nothing changed since our version
+			if (xhr.status === 304) {
+				next();
+				return;
+			}
+			// stop on errors, or if we were redirected to another page
+			if (xhr.status !== 200 || (xhr.getResponseHeader('Content-Type') || '').indexOf('json') < 0) {
+				return;
+			}
+			var data = JSON.parse(xhr.responseText);
+			version = data.version;
+			if (data.interval) {
+				interval = 1000 * data.interval;
+			}
+			if (apply(data.changes, data.full)) {
+				next();
+			} else {
+				window.location.reload();
+			}
+		};
+		xhr.onerror = function () {
+			setTimeout(poll, retry);
+		};
+		xhr.send();
+	}
+
+	poll();
+})();
@@ -0,0 +1,249 @@
+# coding: utf8
+"""
+Background queue of the score recomputations.
+
+Saving or deleting a round (see models.update_points), or a grade sheet (see gradesheets.py), only stores the round and its scores: the aggregates of the teams and their members, of the problems and the fight standings are recomputed afterwards by worker threads, from tasks queued in the database (see models.Task) in the same transaction as the round.
+
+The tasks are debounced: a task is only run once its key was left alone for `debounce` seconds, or at the latest `max_delay` seconds after it was queued, and queuing a task which is already waiting only pushes it back. Whatever the number of grades saved meanwhile for the rounds of a team, the team is recomputed once. A worker takes all the due tasks at once, and runs them together.
+
+The workers are a pool of threads, started by the process which queues a task, once the transaction is committed. The queue lives in the database, so that the tasks queued by a process may be run by another one, and are not lost if the process stops: `python manage.py run_tasks` runs a pool in its own process, for the deployments which would rather not run it in the web server (set IPT_TASKS_IN_PROCESS to False then).
+
+Settings:
+	IPT_TASKS_EAGER: run the tasks right away when they are queued, as in the tests. Default False.
+	IPT_TASKS_IN_PROCESS: start the pool in the processes which queue tasks. Default True.
+	IPT_TASKS_WORKERS: number of threads of a pool. Default 2.
+	IPT_TASKS_DEBOUNCE: see above, in seconds. Default 1.
+"""
+import threading
+import traceback
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.db import transaction, connection, OperationalError, IntegrityError
+from django.db.models import Q, F, Min, Count
+from django.utils import timezone
+from models import Task
+import propagation
+
+
+# a task waits at most max_delay seconds, even if it is queued again and again
+max_delay = 10.0
+# a worker takes at most batch_size tasks at once
+batch_size = 100
+# seconds between two looks at the queue, when nothing wakes the workers up
+poll_interval = 5.0
+# a task running for longer than that is considered lost with its worker, and queued again
+stale_after = timedelta(minutes=10)
+# seconds before trying again the tasks which met a busy database
+retry_delay = 1.0
+# the tasks done are kept that long, for the statistics
+keep_done = timedelta(days=1)
+
+workers = []
+workers_lock = threading.Lock()
+sqlite_lock = threading.Lock()
+wakeup = threading.Event()
+
+
+def setting(name, default):
+	return getattr(settings, 'IPT_TASKS_' + name, default)
+
+
+def round_keys(rounds):
+	"""
+	:param rounds: rounds, as snapshots (see propagation.snapshot), possibly None
+	:return: the set of the keys of the recomputations the rounds are involved in
+	"""
+	keys = set()
+	for round in rounds:
+		if round is None:
+			continue
+		keys.add("fight:%i:%i" % (round['pf_number'], round['room_id']))
+		for field in ['reporter_team_id', 'opponent_team_id', 'reviewer_team_id']:
+			if round[field] is not None:
+				keys.add("team:%i" % round[field])
+		if round['problem_presented_id'] is not None:
+			keys.add("problem:%i" % round['problem_presented_id'])
+	return keys
+
+
+def run(keys):
+	"""
+	Run the recomputations of some keys, in one go.
+
+	:param keys: task keys, see models.Task
+	"""
+	if 'all' in keys:
+		propagation.bulk_recompute()
+		return
+	teams, problems, fights = set(), set(), set()
+	for key in keys:
+		kind, args = key.split(':', 1)
+		if kind == 'team':
+			teams.add(int(args))
+		elif kind == 'problem':
+			problems.add(int(args))
+		elif kind == 'fight':
+			fights.add(tuple(int(arg) for arg in args.split(':')))
+	propagation.recompute(teams, problems, fights)
+
+
+def enqueue(keys):
+	"""
+	Queue recomputations. Those already waiting are pushed back instead. The workers are woken up once the current transaction is committed.
+
+	:param keys: task keys, see models.Task
+	"""
+	keys = set(keys)
+	if not keys:
+		return
+	if setting('EAGER', False):
+		run(keys)
+		return
+	due = timezone.now() + timedelta(seconds=setting('DEBOUNCE', 1.0))
+	queued = Task.objects.filter(queued_key__in=keys)
+	queued.update(due=due)
+	new = sorted(keys - set(queued.values_list('key', flat=True)))
+	if new:
+		try:
+			with transaction.atomic():
+				Task.objects.bulk_create([Task(key=key, queued_key=key, due=due) for key in new])
+		except IntegrityError:
+			# another process queued some of the keys meanwhile: the unique queued_key refused them, they are pushed back instead
+			for key in new:
+				try:
+					with transaction.atomic():
+						Task.objects.create(key=key, queued_key=key, due=due)
+				except IntegrityError:
+					Task.objects.filter(queued_key=key).update(due=due)
+	if setting('IN_PROCESS', True):
+		transaction.on_commit(wake)
+
+
+def requeue(tasks, due):
+	"""
+	Queue running tasks again. A task whose key was queued again meanwhile is dropped: the queued task will do it.
+
+	:param tasks: queryset of running tasks
+	:param due: when they are due
+	"""
+	tasks.filter(key__in=Task.objects.filter(state='queued').values('key')).delete()
+	tasks.update(state='queued', queued_key=F('key'), due=due)
+
+
+def run_pending():
+	"""
+	Take the due tasks and run them.
+
+	:return: the number of tasks run
+	"""
+	now = timezone.now()
+	requeue(Task.objects.filter(state='running', started__lt=now - stale_after), now)
+
+	# a key being recomputed by another worker waits for the next round, so that the recomputations of a key are not mixed
+	running = set(Task.objects.filter(state='running').values_list('key', flat=True))
+	due = Task.objects.filter(state='queued').filter(Q(due__lte=now) | Q(created__lte=now - timedelta(seconds=max_delay)))
+	pks = [pk for pk, key in due.order_by('created').values_list('pk', 'key')[:batch_size] if key not in running]
+	if not pks:
+		return 0
+
+	# other workers may take the same tasks at the same time: only the tasks we marked with our name are ours
+	name = uuid4().hex
+	Task.objects.filter(pk__in=pks, state='queued').update(state='running', queued_key=None, worker=name, started=now)
+	tasks = Task.objects.filter(state='running', worker=name)
+	keys = set(tasks.values_list('key', flat=True))
+	try:
+		if connection.vendor == 'sqlite':
+			# SQLite has a single writer: the threads of the pool take turns instead of failing on a locked database
+			with sqlite_lock:
+				run(keys)
+		else:
+			run(keys)
+	except OperationalError:
+		# the database is busy, typically SQLite locked by another writer: the recomputation was rolled back, it is tried again later
+		requeue(tasks, timezone.now() + timedelta(seconds=retry_delay))
+		raise
+	except Exception:
+		tasks.update(state='failed', finished=timezone.now(), error=traceback.format_exc())
+		raise
+	ndone = tasks.update(state='done', finished=timezone.now())
+	Task.objects.filter(state='done', finished__lt=now - keep_done).delete()
+	return ndone
+
+
+def next_due():
+	"""
+	:return: the number of seconds before the next queued task is due, None if the queue is empty
+	"""
+	due = Task.objects.filter(state='queued').aggregate(Min('due'))['due__min']
+	if due is None:
+		return None
+	return max((due - timezone.now()).total_seconds(), 0.0)
+
+
+def work():
+	"""
+	Loop of a worker thread.
+	"""
+	while True:
+		delay = None
+		try:
+			while run_pending():
+				pass
+			delay = next_due()
+		except Exception:
+			traceback.print_exc()
+			delay = retry_delay
+		finally:
+			connection.close()
+		wakeup.wait(poll_interval if delay is None else min(delay + 0.01, poll_interval))
+		wakeup.clear()
+
+
+def start_workers(nworkers=None):
+	"""
+	Start the pool of worker threads of the process, or the threads missing.
+
+	:param nworkers: size of the pool, IPT_TASKS_WORKERS by default
+	:return: the threads of the pool
+	"""
+	with workers_lock:
+		workers[:] = [worker for worker in workers if worker.is_alive()]
+		for ind in range(len(workers), nworkers or setting('WORKERS', 2)):
+			worker = threading.Thread(target=work, name="IPT2018 tasks %i" % (ind+1))
+			worker.daemon = True
+			worker.start()
+			workers.append(worker)
+		return list(workers)
+
+
+def wake():
+	"""
+	Wake the workers of the process up, starting them if needed.
+	"""
+	start_workers()
+	wakeup.set()
+
+
+def statistics(since=timedelta(hours=1)):
+	"""
+	:param since: period of the latency statistics
+	:return: dictionary with the number of tasks in every state, the age of the oldest queued task, and the number, mean, median, 95th percentile and maximum latency (from queuing to end) and run time of the tasks done during the period, in seconds
+	"""
+	now = timezone.now()
+	res = dict((state, 0) for state, label in Task.STATE_CHOICES)
+	for state, n in Task.objects.order_by().values_list('state').annotate(Count('pk')):
+		res[state] = n
+	oldest = Task.objects.filter(state='queued').aggregate(Min('created'))['created__min']
+	res['oldest'] = (now - oldest).total_seconds() if oldest is not None else None
+
+	done = Task.objects.filter(state='done', finished__gte=now - since).values_list('created', 'started', 'finished')
+	latencies = sorted((finished - created).total_seconds() for created, started, finished in done)
+	runtimes = sorted((finished - started).total_seconds() for created, started, finished in done)
+	res['ndone'] = len(latencies)
+	for name, values in [('latency', latencies), ('runtime', runtimes)]:
+		if values:
+			res[name] = {'mean': sum(values) / len(values), 'median': values[len(values) // 2], 'p95': values[int(0.95 * (len(values) - 1))], 'max': values[-1]}
+		else:
+			res[name] = None
+	return res
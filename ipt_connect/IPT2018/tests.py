@@ -1,3 +1,1326 @@
-from django.test import TestCase
+# coding: utf8
+import os, sys, json, time, itertools
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections
+from django.db.models import Count, Q, F
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from django.core.urlresolvers import reverse
+from django.apps import apps
 
-# Create your tests here.
+from models import *
+from grids import rounds_grid
+import gradematrix
+import jurystats
+import panels
+import schedule
+import problemstats
+import problemindex
+import urls
+import propagation
+import tasks
+import rendercache
+import live
+from ipt_connect import synthetic, api, scoring, yearapps, schema
+
+
+locmem_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=locmem_cache)
+class CacheTestCase(TestCase):
+	"""
+	Base class of all the tests, with a cache of their own: what they cache must never reach the cache of the project, that a tournament would then serve.
+	"""
+
+	def setUp(self):
+		cache.clear()
+
+
+@override_settings(IPT_TASKS_EAGER=True)
+class ViewTestCase(CacheTestCase):
+	"""
+	Base class of the view tests, logged in as a staff member so that the pages are not hidden by the ninja mode.
+	"""
+
+	def setUp(self):
+		super(ViewTestCase, self).setUp()
+		User.objects.create_user('staff', 'staff@ipt.fr', 'password', is_staff=True)
+		self.client.login(username='staff', password='password')
+		self.room = Room.objects.create(name='Room 1')
+
+	def add_team(self, name, nparticipants=4):
+		"""
+		:param name: name of the team
+		:param nparticipants: number of Team Members
+		:return: the team and the list of its participants
+		"""
+		team = Team.objects.create(name=name)
+		participants = [Participant.objects.create(name='Participant %i' % i, surname=name, team=team, role='TM', email='participant@ipt.fr') for i in range(nparticipants)]
+		return team, participants
+
+	def add_round(self, pf_number, round_number, reporter, opponent, reviewer, grades):
+		"""
+		:param reporter, opponent, reviewer: the participants
+		:param grades: list of (grade_reporter, grade_opponent, grade_reviewer), one per jury member
+		:return: the round, scored
+		"""
+		round = Round.objects.create(pf_number=pf_number, round_number=round_number, room=self.room,
+			reporter_team=reporter.team, opponent_team=opponent.team, reviewer_team=reviewer.team,
+			reporter=reporter, opponent=opponent, reviewer=reviewer)
+		for i, (grade_reporter, grade_opponent, grade_reviewer) in enumerate(grades):
+			jury = Jury.objects.create(name='Jury %i' % i, surname='Round %i' % round.pk)
+			JuryGrade.objects.create(round=round, jury=jury, grade_reporter=grade_reporter, grade_opponent=grade_opponent, grade_reviewer=grade_reviewer)
+		round.save()
+		return round
+
+	def commit(self):
+		"""
+		Run the hooks waiting for the transaction to be committed, as a commit would: TestCase never commits.
+		"""
+		hooks, connection.run_on_commit = connection.run_on_commit, []
+		for sids, hook in hooks:
+			hook()
+
+	def count_queries(self, url):
+		"""
+		:return: the number of queries run to render the page, and the response
+		"""
+		cache.clear()
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		return len(queries.captured_queries), response
+
+
+class ScoringTest(CacheTestCase):
+	"""
+	The shared scorer against the algorithms the year apps used before it, kept here as they were.
+	"""
+
+	@staticmethod
+	def ipt_score(grades):
+		grades = sorted(grades)
+		if len(grades) in [5, 6]:
+			nreject = 1
+		elif len(grades) in [7, 8]:
+			nreject = 2
+		else:
+			nreject = round(len(grades) / 4.0)
+		if round(nreject / 2.0) == nreject / 2.0:
+			nlow = int(nreject / 2.0)
+			nhigh = int(nlow)
+		else:
+			nlow = int(nreject / 2.0 + 0.5)
+			nhigh = int(nreject / 2.0 - 0.5)
+		grades = grades[nlow:len(grades)-nhigh]
+		return float(sum(grades)) / len(grades) if grades else 0
+
+	@staticmethod
+	def fpt_score(grades):
+		grades = sorted(grades)
+		ngrades = len(grades)
+		grades.pop(0)
+		if ngrades >= 7:
+			grades.pop(-1)
+		return float(sum(grades)) / len(grades) if grades else 0
+
+	def test_former_algorithms(self):
+		import random
+		rnd = random.Random(2018)
+		roundgrades = {}
+		for ngrades in range(2, 16):
+			for i in range(20):
+				grades = [(rnd.randint(1, 10), rnd.randint(1, 10), rnd.randint(1, 10)) for j in range(ngrades)]
+				roundgrades[(ngrades, i)] = grades
+				for rule, former in [(scoring.IPT_RULE, self.ipt_score), (scoring.FPT_RULE, self.fpt_score)]:
+					expected = [former([row[role] for row in grades]) for role in range(3)]
+					for score, value in zip(scoring.trimmed_means(grades, rule), expected):
+						self.assertAlmostEqual(score, value)
+					self.assertAlmostEqual(scoring.trimmed_mean([row[0] for row in grades], rule), expected[0])
+
+		# the rounds scored at once, grouped by number of grades, give the same scores
+		for rule in [scoring.IPT_RULE, scoring.FPT_RULE]:
+			for key, scores in scoring.score_rounds(roundgrades, rule).items():
+				for score, value in zip(scores, scoring.trimmed_means(roundgrades[key], rule)):
+					self.assertAlmostEqual(score, value)
+
+	def test_discarded(self):
+		self.assertEqual([scoring.discarded(scoring.IPT_RULE, ngrades) for ngrades in [2, 4, 5, 7, 9, 10, 12]], [(1, 0), (1, 0), (1, 0), (1, 1), (1, 1), (2, 1), (2, 1)])
+		self.assertEqual([scoring.discarded(scoring.FPT_RULE, ngrades) for ngrades in [2, 6, 7, 10]], [(1, 0), (1, 0), (1, 1), (1, 1)])
+		self.assertEqual(scoring.trimmed_means([]), (0.0, 0.0, 0.0))
+
+
+@override_settings(IPT_TASKS_EAGER=True)
+class PropagationTest(CacheTestCase):
+	"""
+	The aggregates of a synthetic tournament, recomputed in bulk or one by one, and kept up to date when the rounds change.
+	"""
+
+	def setUp(self):
+		super(PropagationTest, self).setUp()
+		synthetic.generate('IPT2018', nteams=9, nparticipants=36, njurys=20, photos=False)
+
+	def stored(self):
+		"""
+		:return: dictionary {(model, pk): {field: value}} of the stored aggregates, those propagation.expected_aggregates computes
+		"""
+		fieldnames = {}
+		for (model, pk), fields in propagation.expected_aggregates().items():
+			fieldnames.setdefault(model, set()).update(fields)
+		res = {}
+		for model, names in fieldnames.items():
+			for row in model.objects.values('pk', *names):
+				res[(model, row.pop('pk'))] = row
+		return res
+
+	def test_bulk_and_full_recompute(self):
+		bulk = self.stored()
+		self.assertTrue(all(fields['total_points'] > 0 for (model, pk), fields in bulk.items() if model is Team))
+		self.assertEqual(propagation.check_consistency(), [])
+		for model in [Team, Participant, Problem]:
+			model.objects.update(**dict((field, 0) for field in set(field for (other, pk), fields in bulk.items() if other is model for field in fields)))
+
+		propagation.full_recompute()
+		full = self.stored()
+		self.assertEqual(sorted(full), sorted(bulk))
+		for key, fields in bulk.items():
+			for field, value in fields.items():
+				self.assertAlmostEqual(full[key][field], value, msg="%s %i: %s" % (key[0].__name__, key[1], field))
+
+	def test_round_changes(self):
+		# the grades change: the teams, participants, problem and standings of the round follow when it is saved
+		round = Round.objects.filter(pf_number=1).order_by('pk')[0]
+		points = Team.objects.get(pk=round.reporter_team_id).total_points
+		JuryGrade.objects.filter(round=round).update(grade_reporter=1 if round.score_reporter > 5 else 10)
+		round.save()
+		self.assertNotAlmostEqual(Team.objects.get(pk=round.reporter_team_id).total_points, points)
+		self.assertEqual(propagation.check_consistency(), [])
+
+		# the round moves to another problem and another fight: what it counted for before is updated too
+		round.problem_presented = Problem.objects.exclude(pk=round.problem_presented_id).order_by('pk')[0]
+		round.pf_number, round.round_number = 2, 9
+		round.save()
+		self.assertEqual(propagation.check_consistency(), [])
+		round.delete()
+		self.assertEqual(propagation.check_consistency(), [])
+
+	def test_consistency(self):
+		self.assertEqual(propagation.check_consistency(), [])
+		team = Team.objects.order_by('pk')[0]
+		participant = Participant.objects.filter(team=team).order_by('pk')[0]
+		standing = FightStanding.objects.order_by('pk')[0]
+		Team.objects.filter(pk=team.pk).update(total_points=F('total_points') + 1)
+		Participant.objects.filter(pk=participant.pk).update(nrounds_as_rep=F('nrounds_as_rep') + 1)
+		FightStanding.objects.filter(pk=standing.pk).update(rank=standing.rank + 1)
+
+		drifts = propagation.check_consistency()
+		self.assertEqual(sorted((drift['model'], drift['pk'], drift['field']) for drift in drifts),
+			sorted([('Team', team.pk, 'total_points'), ('Participant', participant.pk, 'nrounds_as_rep'), ('FightStanding', standing.pk, 'rank')]))
+		drift = [drift for drift in drifts if drift['model'] == 'Team'][0]
+		self.assertAlmostEqual(drift['stored'] - drift['expected'], 1.0)
+
+		propagation.recompute(teams=[team.pk], fights=[(standing.pf_number, standing.room_id)])
+		self.assertEqual(propagation.check_consistency(), [])
+
+
+class ParticipantsOverviewTest(ViewTestCase):
+
+	def test_constant_query_count(self):
+		url = reverse('IPT2018:participants_overview')
+		for name in ['A', 'B', 'C']:
+			self.add_team(name, nparticipants=2)
+		nqueries, response = self.count_queries(url)
+		self.assertEqual(len(response.context['participants']), 6)
+
+		for name in ['D', 'E', 'F', 'G', 'H', 'I']:
+			self.add_team(name, nparticipants=5)
+		self.assertEqual(self.count_queries(url)[0], nqueries)
+
+	def test_ranking(self):
+		(teama, (a1, a2)), (teamb, (b1, b2)), (teamc, (c1, c2)) = [self.add_team(name, nparticipants=2) for name in ['A', 'B', 'C']]
+		self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		self.add_round(1, 2, b2, c2, a1, [(9, 5, 7), (9, 5, 7)])
+
+		participants = list(self.count_queries(reverse('IPT2018:participants_overview'))[1].context['participants'])
+		self.assertEqual(participants[:5], [b2, a1, b1, c2, c1])
+		self.assertEqual(participants[1].nrounds, 2)
+		self.assertAlmostEqual(participants[1].allpoints, 15.0)
+		self.assertAlmostEqual(participants[1].avggrade, 7.5)
+		self.assertEqual(participants[5].avggrade, 0.0)
+
+
+class RoundsGridTest(ViewTestCase):
+
+	def add_fights(self, nrooms, pf_numbers):
+		"""
+		Schedule three rounds per fight in every room, between the teams of the room. The rounds are not graded.
+		"""
+		rounds = []
+		for i in range(nrooms):
+			room = Room.objects.create(name='Room %02i' % (i+2))
+			teams = [self.add_team('Team %i.%i' % (i, j), nparticipants=1)[1][0] for j in range(3)]
+			for pf in pf_numbers:
+				for rn in range(3):
+					reporter, opponent, reviewer = teams[rn], teams[(rn+1) % 3], teams[(rn+2) % 3]
+					rounds.append(Round(pf_number=pf, round_number=rn+1, room=room,
+						reporter_team=reporter.team, opponent_team=opponent.team, reviewer_team=reviewer.team,
+						reporter=reporter, opponent=opponent, reviewer=reviewer))
+		Round.objects.bulk_create(rounds)
+
+	def test_grid(self):
+		self.add_fights(2, [2, 1, 6])
+		rooms, grid = rounds_grid([1, 2])
+		self.assertEqual([room.name for room in rooms], ['Room 02', 'Room 03', 'Room 1'])
+		self.assertEqual([[len(cell) for cell in row] for row in grid], [[3, 3], [3, 3], [0, 0]])
+		for row in grid[:2]:
+			for pf, cell in zip([1, 2], row):
+				self.assertEqual([(round.pf_number, round.round_number) for round in cell], [(pf, 1), (pf, 2), (pf, 3)])
+		# the pages read the room of the rounds, without a query per round
+		with CaptureQueriesContext(connection) as queries:
+			self.assertEqual([[cell[0].room.name for cell in row] for row in grid[:2]], [['Room 02'] * 2, ['Room 03'] * 2])
+		self.assertEqual(len(queries.captured_queries), 0)
+
+	def test_bounded_query_count(self):
+		urls = [reverse('IPT2018:tournament_overview'), reverse('IPT2018:rounds'), reverse('IPT2018:physics_fights')]
+		self.add_fights(1, pfs + [npf+1])
+		nqueries = [self.count_queries(url)[0] for url in urls]
+
+		self.add_fights(10, pfs + [npf+1])
+		self.assertEqual([self.count_queries(url)[0] for url in urls], nqueries)
+
+
+
+class TeamDetailTest(ViewTestCase):
+
+	def test_constant_query_count(self):
+		(teama, (a1, a2)), (teamb, (b1, b2)), (teamc, (c1, c2)) = [self.add_team(name, nparticipants=2) for name in ['A', 'B', 'C']]
+		problem = Problem.objects.create(name='Problem 1', description='Problem 1')
+		self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		Round.objects.update(problem_presented=problem)
+		url = reverse('IPT2018:team_detail', kwargs={'team_name': 'A'})
+		nqueries, response = self.count_queries(url)
+		self.assertEqual(response.context['team'].rank, 1)
+		self.assertEqual([round.myrole for round in response.context['allrounds']], ['reporter'])
+
+		self.add_round(1, 2, b2, c2, a1, [(9, 5, 7), (9, 5, 7)])
+		self.add_round(1, 3, c1, a2, b1, [(5, 5, 5), (5, 5, 5)])
+		Round.objects.update(problem_presented=problem)
+		count, response = self.count_queries(url)
+		self.assertEqual(count, nqueries)
+		# A: 8*3 + 7 + 5*2, B: 6*2 + 9*3 + 5
+		self.assertEqual(response.context['team'].rank, 2)
+		self.assertEqual([(round.myrole, round.mygrade) for round in response.context['allrounds']], [('reporter', 8.0), ('opponent', 5.0), ('reviewer', 7.0)])
+
+
+class GradeMatrixTest(ViewTestCase):
+
+	def test_matrix(self):
+		(teama, (a1, a2)), (teamb, (b1, b2)), (teamc, (c1, c2)) = [self.add_team(name, nparticipants=2) for name in ['A', 'B', 'C']]
+		round1 = self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		round2 = self.add_round(1, 2, b2, c2, a1, [(9, 5, 7)])
+		self.add_round(1, 3, c1, a2, b1, [])
+		Room.objects.create(name='Room 2')
+		jury = JuryGrade.objects.filter(round=round1).order_by('pk')[0].jury
+		JuryGrade.objects.create(round=round2, jury=jury, grade_reporter=7, grade_opponent=5, grade_reviewer=5)
+
+		url = reverse('IPT2018:physics_fight_detail', kwargs={'pfid': 1})
+		nqueries, response = self.count_queries(url)
+		room, other = response.context['rooms']
+		self.assertEqual((room['name'], other['rounds']), ('Room 1', []))
+		self.assertEqual([(round['round_number'], round['reporter_team']) for round in room['rounds']], [(1, 'A'), (2, 'B')])
+		self.assertEqual(sorted(juror['grades'] for juror in room['jurys']), [[None, (9, 5, 7)], [(8, 6, 4), None], [(8, 6, 4), (7, 5, 5)]])
+		self.assertEqual(room['means'][0], (8.0, 6.0, 4.0))
+
+		for i in range(3):
+			self.add_round(1, 4+i, a1, b1, c1, [(5, 5, 5)] * 5)
+		self.assertEqual(self.count_queries(url)[0], nqueries)
+
+		lines = self.client.get(reverse('IPT2018:physics_fight_csv', kwargs={'pfid': 1})).content.splitlines()
+		self.assertEqual(lines[0].split(','), gradematrix.csv_header)
+		# 2 + 2 grades and 2 means, then 3 rounds of 5 grades and a mean
+		self.assertEqual(len(lines), 1 + 6 + 3 * 6)
+		self.assertEqual(lines[3], 'Room 1,1,,A,B,C,Mean,8.00,6.00,4.00')
+
+
+class ProblemStatisticsTest(ViewTestCase):
+
+	def test_statistics(self):
+		(teama, (a1, a2)), (teamb, (b1, b2)), (teamc, (c1, c2)) = [self.add_team(name, nparticipants=2) for name in ['A', 'B', 'C']]
+		problem1, problem2 = [Problem.objects.create(name='Problem %i' % i, description='Problem %i' % i) for i in [1, 2]]
+		round1 = self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		round2 = self.add_round(1, 2, b2, c2, a1, [(9, 5, 7), (9, 5, 7)])
+		round3 = self.add_round(1, 3, c1, a2, b1, [])
+		for round, problem in [(round1, problem1), (round2, problem1), (round3, problem1)]:
+			round.problem_presented = problem
+			round.save()
+
+		stats = problemstats.statistics([problem1.pk, problem2.pk])
+		self.assertEqual((stats[problem1.pk]["npres"], stats[problem1.pk]["means"]), (3, (8.5, 5.5, 5.5)))
+		self.assertEqual((stats[problem2.pk]["npres"], stats[problem2.pk]["means"]), (0, (0.0, 0.0, 0.0)))
+		meangrades, teamresults = problem1.status(verbose=False)
+		self.assertEqual(meangrades, {"report": 8.5, "opposition": 5.5, "review": 5.5})
+		self.assertEqual([result["name"] for result in teamresults], ['A', 'B', 'C'])
+		self.assertEqual(teamresults[0]["reports"], [{"round": round1.pk, "value": 8.0}])
+		self.assertEqual(teamresults[0]["reviews"], [{"round": round2.pk, "value": 7.0}])
+
+		# a round of the first problem moves to the second one: the statistics of both are recomputed
+		cache.set(problemstats.cache_key(0), 'unrelated')
+		round3.problem_presented = problem2
+		round3.save()
+		self.assertIsNone(cache.get(problemstats.cache_key(problem1.pk)))
+		self.assertEqual(cache.get(problemstats.cache_key(0)), 'unrelated')
+		stats = problemstats.statistics([problem1.pk, problem2.pk])
+		self.assertEqual((stats[problem1.pk]["npres"], stats[problem2.pk]["npres"]), (2, 1))
+
+		# statistics cached by a request racing a change are left behind by the commit, the other problems keep theirs
+		cache.set(problemstats.cache_key(problem1.pk), dict(stats[problem1.pk], npres=7))
+		self.assertEqual(problemstats.statistics([problem1.pk])[problem1.pk]["npres"], 7)
+		self.commit()
+		self.assertEqual(problemstats.statistics([problem1.pk])[problem1.pk]["npres"], 2)
+		key = problemstats.cache_key(problem1.pk)
+		Team.objects.create(name='D')
+		self.commit()
+		self.assertEqual(problemstats.cache_key(problem1.pk), key)
+		self.assertIsNotNone(cache.get(key))
+
+	def test_constant_query_count(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		problem = Problem.objects.create(name='Problem 1', description='Problem 1')
+		url = reverse('IPT2018:problem_detail', kwargs={'pk': problem.pk})
+		self.add_round(1, 1, a1, b1, c1, [(8, 6, 4)]).save()
+		Round.objects.update(problem_presented=problem)
+		nqueries = [self.count_queries(url)[0], self.count_queries(reverse('IPT2018:problems_overview'))[0]]
+
+		for i in range(5):
+			self.add_round(2, i+1, a1, b1, c1, [(5, 5, 5)] * 3)
+		Round.objects.update(problem_presented=problem)
+		self.assertEqual([self.count_queries(url)[0], self.count_queries(reverse('IPT2018:problems_overview'))[0]], nqueries)
+
+
+class ProblemIndexTest(ViewTestCase):
+
+	def test_bans(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		p1, p2, p3, p4, p5 = [Problem.objects.create(name='Problem %i' % i, description='Problem %i' % i) for i in range(1, 6)]
+		first = self.add_round(1, 1, a1, b1, c1, [])
+		first.problem_presented = p1
+		first.save()
+		EternalRejection.objects.create(round=first, problem=p2)
+		second = self.add_round(1, 2, b1, c1, a1, [])
+		second.problem_presented = p3
+		second.save()
+		current = self.add_round(2, 1, a1, b1, c1, [])
+		current.problem_presented = p4
+		current.save()
+		following = self.add_round(2, 2, b1, c1, a1, [])
+
+		self.assertEqual(problemindex.bans(current), {'a': [p2.pk], 'b': [p1.pk], 'c': [p1.pk], 'd': [p3.pk]})
+		self.assertEqual(problemindex.presented_this_pf(following), [p4.pk])
+		# the histories of both teams come from a single cache lookup
+		with CaptureQueriesContext(connection) as queries:
+			problemindex.bans(current)
+		self.assertEqual(len(queries.captured_queries), 0)
+
+		unavailable = current.unavailable_problems()
+		self.assertEqual(unavailable["eternal_rejection"], [p2])
+		self.assertEqual(unavailable["presented_by_opponent"], [p3])
+		self.assertEqual(unavailable["number_of_unavailable_problems"], 4)
+		with CaptureQueriesContext(connection) as queries:
+			current.unavailable_problems()
+		self.assertEqual(len(queries.captured_queries), 0)
+		self.assertEqual([[problem.pk for problem in problems] for problems in teama.problems(currentround=current)], [[p2.pk], [p1.pk], []])
+
+		# the bans d), c), b), a) are lifted in turn when no problem is left
+		self.assertEqual(problemindex.challengeable(current), ([p4.pk, p5.pk], []))
+		self.assertEqual(problemindex.challengeable(current, [p1.pk, p2.pk, p3.pk]), ([p3.pk], ['d']))
+		self.assertEqual(problemindex.challengeable(current, [p1.pk, p2.pk]), ([p1.pk], ['d', 'c', 'b']))
+
+		# entering the grades keeps the histories, changing the problem or a rejection drops them
+		JuryGrade.objects.create(round=first, jury=Jury.objects.create(name='Jury', surname='Index'), grade_reporter=5, grade_opponent=5, grade_reviewer=5)
+		first.save()
+		self.assertIsNotNone(cache.get(problemindex.cache_key(teama.pk)))
+		first.problem_presented = p5
+		first.save()
+		self.assertIsNone(cache.get(problemindex.cache_key(teama.pk)))
+		self.assertIsNone(cache.get(problemindex.cache_key(teamc.pk)))
+		EternalRejection.objects.filter(round=first).update(problem=p1)
+		self.assertEqual(problemindex.bans(current), {'a': [p1.pk], 'b': [p5.pk], 'c': [p5.pk], 'd': [p3.pk]})
+		EternalRejection.objects.get(round=first).delete()
+		self.assertEqual(problemindex.bans(current)['a'], [])
+		second.delete()
+		self.assertEqual(problemindex.bans(current)['d'], [])
+
+
+class JuryStatisticsTest(ViewTestCase):
+
+	def test_statistics(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		jurys = [Jury.objects.create(name='Jury %i' % i, surname='Stats') for i in range(5)]
+		# with 5 grades, the lowest one is discarded
+		for round_number, grades in [(1, [4, 6, 6, 6, 8]), (2, [5, 7, 7, 7, 7])]:
+			round = self.add_round(1, round_number, a1, b1, c1, [])
+			for jury, grade in zip(jurys, grades):
+				JuryGrade.objects.create(round=round, jury=jury, grade_reporter=grade, grade_opponent=grade, grade_reviewer=grade)
+			round.save()
+
+		stats = jurystats.jury_statistics()
+		self.assertEqual(stats[jurys[0].pk]["means"], (4.5, 4.5, 4.5))
+		# scores 6.5 and 7
+		self.assertEqual(stats[jurys[0].pk]["deviations"], (-2.25, -2.25, -2.25))
+		self.assertEqual(stats[jurys[4].pk]["deviation"], 0.75)
+		self.assertEqual([(stats[jury.pk]["dropped_low"], stats[jury.pk]["dropped_high"]) for jury in jurys], [(6, 0)] + [(0, 0)] * 4)
+		harshness = [stats[jury.pk]["harshness"] for jury in jurys]
+		self.assertLess(harshness[0], -1.5)
+		self.assertEqual(max(harshness), harshness[4])
+		self.assertAlmostEqual(sum(harshness), 0.0)
+
+		nqueries, response = self.count_queries(reverse('IPT2018:jurys_statistics'))
+		self.add_round(1, 3, a1, b1, c1, [(5, 5, 5)] * 6)
+		self.assertEqual(self.count_queries(reverse('IPT2018:jurys_statistics'))[0], nqueries)
+		self.assertEqual(self.count_queries(reverse('IPT2018:jurys_overview'))[1].context['jurys'][0].meanrepgrade, 4.5)
+
+		self.client.logout()
+		self.assertNotEqual(self.client.get(reverse('IPT2018:jurys_statistics')).status_code, 200)
+
+	def test_tied_drops(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		jurys = [Jury.objects.create(name='Jury %i' % i, surname='Stats') for i in range(5)]
+		# with 5 grades, the lowest one is discarded, shared between the tied jury members
+		for round_number, grades in [(1, [7, 7, 7, 7, 7]), (2, [6, 6, 8, 8, 8])]:
+			round = self.add_round(1, round_number, a1, b1, c1, [])
+			for jury, grade in zip(jurys, grades):
+				JuryGrade.objects.create(round=round, jury=jury, grade_reporter=grade, grade_opponent=grade, grade_reviewer=grade)
+			round.save()
+
+		nlow, nhigh = scoring.discarded(grade_rejection_rule, 5)
+		counts = jurystats.dropped_counts()
+		for ind in range(2):
+			self.assertAlmostEqual(sum(count[ind] for count in counts.values()), 2 * 3 * [nlow, nhigh][ind])
+		self.assertAlmostEqual(counts[jurys[0].pk][0], 3 * (0.2 + 0.5) * nlow)
+		self.assertAlmostEqual(counts[jurys[4].pk][0], 3 * 0.2 * nlow)
+		self.assertEqual(jurystats.drop_shares([7, 7, 7, 7, 7], 1), [0.2] * 5)
+		self.assertEqual(jurystats.drop_shares([4, 6, 6, 8], 2), [1.0, 0.5, 0.5, 0.0])
+
+
+class JuryPanelsTest(ViewTestCase):
+
+	def test_constraints(self):
+		teams = [self.add_team(name, nparticipants=1) for name in 'ABCDEF']
+		rooms = [self.room, Room.objects.create(name='Room 2')]
+		for room, ((teama, (a1,)), (teamb, (b1,)), (teamc, (c1,))) in zip(rooms, [teams[:3], teams[3:]]):
+			Round.objects.create(pf_number=1, round_number=1, room=room, reporter_team=teama, opponent_team=teamb, reviewer_team=teamc, reporter=a1, opponent=b1, reviewer=c1)
+		leaders = [Jury.objects.create(name='Leader', surname=team.name, team=team, pf1=True, pf2=True) for team, participants in teams]
+		others = [Jury.objects.create(name='Jury %i' % i, surname='Panels', pf1=True, pf2=(i % 2 == 0)) for i in range(9)]
+		absent = Jury.objects.create(name='Absent', surname='Panels', pf1=False, pf2=False)
+
+		panels.assign([1, 2])
+		self.assertFalse(JuryAssignment.objects.filter(jury=absent).exists())
+		self.assertFalse(JuryAssignment.objects.filter(pf_number=2, jury__pf2=False).exists())
+		for assignment in JuryAssignment.objects.filter(pf_number=1, jury__team__isnull=False):
+			self.assertFalse(Round.objects.filter(pf_number=1, room=assignment.room).filter(Q(reporter_team=assignment.jury.team) | Q(opponent_team=assignment.jury.team) | Q(reviewer_team=assignment.jury.team)).exists())
+		# 15 jury members in Fight 1, 11 in Fight 2 (no rounds yet, no conflict)
+		sizes = dict(((pf, room), count) for pf, room, count in JuryAssignment.objects.order_by().values_list('pf_number', 'room').annotate(Count('pk')))
+		self.assertEqual(sorted(sizes[1, room.pk] for room in rooms), [7, 8])
+		self.assertEqual(sorted(sizes[2, room.pk] for room in rooms), [5, 6])
+		self.assertEqual(sorted(JuryAssignment.objects.filter(pf_number=1, room=rooms[0], jury__team__isnull=False).values_list('jury__team__name', flat=True)), ['D', 'E', 'F'])
+
+		# assigning again replaces the panels of the fight, with the same result for the same seed
+		before = list(JuryAssignment.objects.filter(pf_number=2).values_list('jury', 'room'))
+		panels.assign([2])
+		self.assertEqual(list(JuryAssignment.objects.filter(pf_number=2).values_list('jury', 'room')), before)
+
+		response = self.count_queries(reverse('IPT2018:jury_panels'))[1]
+		self.assertEqual([len(fight["rooms"]) for fight in response.context['fights']], [2, 2])
+
+	def test_no_jury_available(self):
+		Room.objects.create(name='Room 2')
+		available = Jury.objects.create(name='Jury', surname='Panels', pf2=True)
+		# nobody ticked the other fights
+		res = panels.assign(range(1, npf_tot+1))
+		self.assertEqual(sorted(pf for pf, (fight, reserves, cost) in res.items() if any(fight.values())), [2])
+		self.assertEqual(list(JuryAssignment.objects.values_list('jury', 'pf_number')), [(available.pk, 2)])
+
+	def test_large(self):
+		# 100 jury members, a fifth of them Team Leaders, in 10 rooms of 3 teams
+		jurys = dict((jury, {"team": jury if jury < 20 else None, "available": set(pf for pf in range(1, npf_tot+1) if (jury + pf) % 7), "harshness": ((jury * 37) % 21 - 10) / 5.0}) for jury in range(100))
+		fights = dict((pf, dict((room, set((room * 3 + pf * i) % 30 for i in range(3))) for room in range(10))) for pf in range(1, npf_tot+1))
+		start = time.time()
+		res = panels.Solver(jurys, fights).solve(range(1, npf_tot+1))
+		self.assertLess(time.time() - start, 10.0)
+		for pf, (fight, reserves, cost) in res.items():
+			assigned = [jury for members in fight.values() for jury in members]
+			self.assertEqual(sorted(assigned + reserves), sorted(jury for jury in jurys if pf in jurys[jury]["available"]))
+			self.assertLessEqual(max(len(members) for members in fight.values()) - min(len(members) for members in fight.values()), 1)
+			for room, members in fight.items():
+				self.assertFalse(set(jurys[jury]["team"] for jury in members) & fights[pf][room])
+
+
+class ScheduleTest(ViewTestCase):
+
+	def test_generate(self):
+		teams = [self.add_team('Team %02i' % i, nparticipants=1)[0] for i in range(30)]
+		Team.objects.filter(pk__in=[team.pk for team in teams[:14]]).update(pool='A')
+		Team.objects.filter(pk__in=[team.pk for team in teams[14:28]]).update(pool='B')
+		Team.objects.filter(pk=teams[28].pk).update(pool='O')
+		for i in range(2, 11):
+			Room.objects.create(name='Room %i' % i)
+
+		res = schedule.generate(pfs[:4])
+		self.assertEqual(Round.objects.count(), 4 * 30)
+		pools = dict(Team.objects.values_list('pk', 'pool'))
+		meetings = {}
+		for pf, (rooms, cost) in res.items():
+			self.assertEqual(sorted(team for room, roomteams in rooms for team in roomteams), sorted(team.pk for team in teams))
+			for room, roomteams in rooms:
+				self.assertIn(len(roomteams), [3, 4])
+				self.assertLessEqual(len(set(pools[team] for team in roomteams) - set([None, 'O'])), 1)
+				for pair in itertools.combinations(sorted(roomteams), 2):
+					meetings[pair] = meetings.get(pair, 0) + 1
+				rounds = Round.objects.filter(pf_number=pf, room=room).order_by('round_number')
+				self.assertEqual([(round.reporter_team_id, round.opponent_team_id, round.reviewer_team_id) for round in rounds], schedule.room_rounds(roomteams))
+		self.assertEqual(max(meetings.values()), 1)
+
+		# the rounds of a fight are only replaced on demand, and never once graded
+		with self.assertRaises(ValueError):
+			schedule.generate([1])
+		schedule.generate([1], replace=True)
+		self.assertEqual(Round.objects.count(), 4 * 30)
+		round = Round.objects.filter(pf_number=1)[0]
+		JuryGrade.objects.create(round=round, jury=Jury.objects.create(name='Jury', surname='Schedule'), grade_reporter=5, grade_opponent=5, grade_reviewer=5)
+		with self.assertRaises(ValueError):
+			schedule.generate([1], replace=True)
+		self.assertTrue(Round.objects.filter(pk=round.pk).exists())
+
+	def test_large(self):
+		# 44 teams in two pools, and two without a pool
+		pools = dict((team, 'AB'[team % 2] if team < 44 else None) for team in range(46))
+		scheduler = schedule.Scheduler(pools)
+		start = time.time()
+		res = scheduler.schedule([(pf, list(pools)) for pf in pfs[:4]])
+		self.assertLess(time.time() - start, 10.0)
+		self.assertEqual(max(scheduler.meetings.values()), 1)
+		self.assertLessEqual(max(scheduler.fours.values()), 1)
+		# every team reported once per fight, at most twice in the same round
+		self.assertEqual(sum(scheduler.report_rounds.values()), 4 * 46)
+		self.assertLessEqual(max(scheduler.report_rounds.values()), 2)
+
+
+class FightStandingTest(ViewTestCase):
+
+	def test_maintained_on_write(self):
+		(teama, (a1, a2)), (teamb, (b1, b2)), (teamc, (c1, c2)) = [self.add_team(name, nparticipants=2) for name in ['A', 'B', 'C']]
+		self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		self.add_round(1, 2, b2, c2, a1, [(9, 5, 7), (9, 5, 7)])
+		standings = dict((standing.team_id, standing) for standing in FightStanding.objects.all())
+		self.assertEqual(len(standings), 3)
+		self.assertFalse(any(standing.complete or standing.bonus_points for standing in standings.values()))
+
+		last = self.add_round(1, 3, c1, a2, b1, [(5, 5, 5), (5, 5, 5)])
+		standings = dict((standing.team_id, standing) for standing in FightStanding.objects.all())
+		# A: 8*3 + 7 + 5*2, B: 6*2 + 9*3 + 5, C: 4 + 5*2 + 5*3
+		self.assertAlmostEqual(standings[teama.pk].points, 41.0)
+		self.assertAlmostEqual(standings[teamb.pk].points, 44.0)
+		self.assertAlmostEqual(standings[teamc.pk].points, 29.0)
+		self.assertEqual([standings[team.pk].rank for team in [teama, teamb, teamc]], [2, 1, 3])
+		self.assertEqual([standings[team.pk].bonus_points for team in [teama, teamb, teamc]], [1.0, 2.0, 0.0])
+		self.assertEqual(bonuspoints()[teamb.pk], 2.0)
+
+		last.delete()
+		self.assertFalse(FightStanding.objects.filter(complete=True).exists())
+		self.assertEqual(propagation.check_consistency(), [])
+
+	def test_bonus_rules(self):
+		def round(pf, room, teams, points):
+			res = {'pf_number': pf, 'room': room}
+			for role, team, value in zip(['reporter', 'opponent', 'reviewer'], teams, points):
+				res[role+'_team'] = team
+				res['points_'+role] = value
+			return res
+		# a complete four-team fight, and an incomplete three-team one
+		rounds = [round(1, 1, (a, b, c), (30, 20, 10)) for a, b, c in [(1, 2, 3), (2, 3, 4), (3, 4, 1), (4, 1, 2)]]
+		rounds.append(round(1, 2, (5, 6, 7), (30, 20, 10)))
+		for rule, bonus in [(scoring.three_team_bonus, 0.0), (scoring.podium_bonus, 3.0)]:
+			standings = scoring.fight_standings(rounds, rule)
+			self.assertEqual(len(standings), 7)
+			self.assertEqual([standing['complete'] for standing in standings], [True] * 4 + [False] * 3)
+			self.assertEqual(sum(standing['bonus_points'] for standing in standings), bonus)
+
+
+class RenderCacheTest(ViewTestCase):
+
+	def test_fresh_page_after_commit(self):
+		self.add_team('Alpha', nparticipants=1)
+		self.commit()
+		version = rendercache.data_version()
+		self.assertContains(self.client.get(reverse('IPT2018:ranking')), 'Alpha')
+
+		# the page is served from the cache until the change is committed
+		self.add_team('Beta', nparticipants=1)
+		self.assertNotContains(self.client.get(reverse('IPT2018:ranking')), 'Beta')
+		self.assertEqual(rendercache.data_version(), version)
+		self.commit()
+		self.assertGreater(rendercache.data_version(), version)
+		response = self.client.get(reverse('IPT2018:ranking'))
+		self.assertContains(response, 'Beta')
+		self.assertEqual(response.context['request'].data_version, rendercache.data_version())
+
+		# the tasks are not tournament data
+		version = rendercache.data_version()
+		Task.objects.create(key='all')
+		self.commit()
+		self.assertEqual(rendercache.data_version(), version)
+
+
+class PresentationCoefficientsTest(ViewTestCase):
+
+	def test_cached_per_version(self):
+		team = self.add_team('A', nparticipants=1)[0]
+		self.assertEqual(team.presentation_coefficients(), [3.0] * npf_tot)
+		# a team taking the pk of another one, e.g. in a database flushed or imported, does not get its coefficients
+		cache.set(prescoeffs_cache_key(team.pk), [2.6] * npf_tot)
+		self.assertEqual(team.presentation_coefficients(), [2.6] * npf_tot)
+		rendercache.bump_version()
+		self.assertEqual(team.presentation_coefficients(), [3.0] * npf_tot)
+
+	def test_rejection_changes(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		first = self.add_round(1, 1, a1, b1, c1, [])
+		second = self.add_round(1, 2, c1, a1, b1, [])
+		problems = [Problem.objects.create(name='Problem %i' % i, description='Problem %i' % i) for i in range(4)]
+		def coefficients(team):
+			return [round(value, 6) for value in Team.objects.get(pk=team.pk).presentation_coefficients()]
+		unpenalized = [3.0] * npf_tot
+		# the fourth tactical rejection of a fight costs 0.2 on it and on the next fights, not on the final
+		penalized = [2.8] * npf + [3.0] * (npf_tot - npf)
+
+		self.assertEqual(coefficients(teama), unpenalized)
+		with CaptureQueriesContext(connection) as queries:
+			Team.objects.get(pk=teama.pk).presentation_coefficients()
+		self.assertEqual(len(queries.captured_queries), 1)
+		rejections = [TacticalRejection.objects.create(round=first, problem=problem) for problem in problems]
+		self.assertEqual(coefficients(teama), penalized)
+
+		# the round moves to another reporter team: its rejections count for it instead
+		first.reporter_team, first.opponent_team, first.reporter, first.opponent = teamb, teama, b1, a1
+		first.save()
+		self.assertEqual([coefficients(teama), coefficients(teamb)], [unpenalized, penalized])
+
+		# a rejection moves to a round of another team, or is deleted
+		rejections[0].round = second
+		rejections[0].save()
+		self.assertEqual([coefficients(teamb), coefficients(teamc)], [unpenalized, unpenalized])
+		for rejection in rejections[1:]:
+			rejection.round = second
+			rejection.save()
+		self.assertEqual(coefficients(teamc), penalized)
+		rejections[0].delete()
+		self.assertEqual(coefficients(teamc), unpenalized)
+
+
+@override_settings(IPT_LIVE_WAIT=0.1)
+class LiveTest(ViewTestCase):
+
+	def poll(self, name, since, **kwargs):
+		"""
+		:return: the answer to a live request, None if it is 304 Not Modified
+		"""
+		response = self.client.get(reverse('IPT2018:' + name, kwargs=kwargs or None), {'since': since})
+		if response.status_code == 304:
+			return None
+		self.assertEqual(response.status_code, 200)
+		return json.loads(response.content)
+
+	def test_ranking_changes(self):
+		(teama, (a1, a2)), (teamb, (b1, b2)), (teamc, (c1, c2)), (teamd, (d1, d2)) = [self.add_team(name, nparticipants=2) for name in ['A', 'B', 'C', 'D']]
+		self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		version = self.client.get(reverse('IPT2018:ranking')).context['request'].data_version
+
+		# the first poll sends the whole state, the following ones nothing until the data changes
+		data = self.poll('live_ranking', 0)
+		self.assertTrue(data['full'])
+		self.assertEqual(data['version'], version)
+		self.assertEqual(data['changes']['qualifying'][str(teama.pk)], [1, 24.0])
+		self.assertIsNone(self.poll('live_ranking', version))
+		# an unknown version gets the whole state, without waiting
+		with self.settings(IPT_LIVE_WAIT=60):
+			start = time.time()
+			self.assertTrue(self.poll('live_ranking', version + 1000)['full'])
+			# nor does a request when too many are waiting
+			with self.settings(IPT_LIVE_WAITING=0):
+				self.assertIsNone(self.poll('live_ranking', version))
+			self.assertLess(time.time() - start, 30)
+
+		# the commit hook is not run in the tests
+		self.add_round(1, 2, d1, b2, a2, [(9, 9, 9), (9, 9, 9)])
+		rendercache.bump_version()
+		data = self.poll('live_ranking', version)
+		self.assertFalse(data['full'])
+		self.assertGreater(data['version'], version)
+		self.assertEqual(data['changes'], {'qualifying': {
+			str(teama.pk): [1, 24.0 + 9],
+			str(teamb.pk): [2, 12.0 + 9*2],
+			str(teamc.pk): [4, 4.0],
+			str(teamd.pk): [3, 9*3.0],
+		}})
+
+	@override_settings(IPT_LIVE_WAIT=60)
+	def test_wait_for_change(self):
+		import threading
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		version = rendercache.data_version()
+		with self.settings(IPT_LIVE_WAITING=0):
+			self.assertIsNone(self.poll('live_ranking', version))
+
+		# the request waits until the data version moves, here in another thread
+		self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		bump = threading.Timer(0.5, rendercache.bump_version)
+		start = time.time()
+		bump.start()
+		data = self.poll('live_ranking', version)
+		bump.join()
+		self.assertLess(time.time() - start, 30)
+		self.assertGreater(data['version'], version)
+		self.assertEqual(data['changes'], {'qualifying': {str(teama.pk): [1, 24.0], str(teamb.pk): [2, 12.0], str(teamc.pk): [3, 4.0]}})
+		self.assertEqual(live.waiting, [0])
+
+	def test_round_changes(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		round = self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (6, 6, 6)])
+		version = rendercache.data_version()
+		self.poll('live_round', version, pk=round.pk)
+
+		grade = JuryGrade.objects.get(round=round, grade_reporter=6)
+		grade.grade_reporter = 10
+		grade.save()
+		round.save()
+		rendercache.bump_version()
+		data = self.poll('live_round', version, pk=round.pk)
+		round.refresh_from_db()
+		self.assertEqual(data['changes'], {'grades': {str(grade.jury_id): [10, 6, 6]}, 'means': {'mean': [round.score_reporter, round.score_opponent, round.score_reviewer]}})
+
+
+@override_settings(IPT_TASKS_EAGER=False, IPT_TASKS_IN_PROCESS=False, IPT_TASKS_DEBOUNCE=0)
+class GradeSheetTest(ViewTestCase):
+
+	def submit(self, data):
+		return self.client.post(reverse('IPT2018:submit_grades'), json.dumps(data), content_type='application/json')
+
+	def test_submit(self):
+		(teama, (a1, a2)), (teamb, (b1, b2)), (teamc, (c1, c2)) = [self.add_team(name, nparticipants=2) for name in ['A', 'B', 'C']]
+		juries = [Jury.objects.create(name='Jury %i' % i, surname='Sheet') for i in range(3)]
+		round1 = self.add_round(1, 1, a1, b1, c1, [])
+		round2 = self.add_round(1, 2, b2, c2, a1, [])
+
+		sheets = {"rounds": [
+			{"round": round1.pk, "grades": [{"jury": jury.pk, "reporter": 8, "opponent": 6, "reviewer": 4} for jury in juries]},
+			{"round": round2.pk, "grades": [{"jury": jury.pk, "reporter": 9, "opponent": 5, "reviewer": 7} for jury in juries[:2]]},
+		]}
+		response = self.submit(sheets)
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(json.loads(response.content)['changed'], [round1.pk, round2.pk])
+		self.assertEqual(JuryGrade.objects.count(), 5)
+		round1.refresh_from_db()
+		self.assertEqual((round1.score_reporter, round1.points_opponent), (8.0, 12.0))
+
+		# the teams wait for the queue, and a second sheet for the same rounds does not queue them twice
+		self.assertEqual(Team.objects.get(pk=teama.pk).total_points, 0.0)
+		sheets["rounds"][0]["grades"][0]["reporter"] = 5
+		self.assertEqual(self.submit(sheets).status_code, 202)
+		self.assertEqual(JuryGrade.objects.count(), 5)
+		self.assertEqual(sorted(Task.objects.filter(state='queued').values_list('key', flat=True)), ['fight:1:%i' % self.room.pk] + sorted('team:%i' % team.pk for team in [teama, teamb, teamc]))
+
+		self.assertEqual(tasks.run_pending(), 4)
+		self.assertEqual(Task.objects.filter(state='done').count(), 4)
+		self.assertEqual(propagation.check_consistency(), [])
+		self.assertEqual(FightStanding.objects.filter(team=teama).get().points, Round.objects.get(pk=round1.pk).points_reporter + Round.objects.get(pk=round2.pk).points_reviewer)
+
+	def test_invalid_submission(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		jury = Jury.objects.create(name='Jury', surname='Sheet')
+		round = self.add_round(1, 1, a1, b1, c1, [])
+		ntasks = Task.objects.count()
+
+		self.assertEqual(self.client.post(reverse('IPT2018:submit_grades'), 'grades', content_type='application/json').status_code, 400)
+		response = self.submit({"round": round.pk, "grades": [{"jury": jury.pk, "reporter": 11, "opponent": 6, "reviewer": 4}, {"jury": jury.pk + 1, "reporter": 8, "opponent": 6, "reviewer": 4}]})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(len(json.loads(response.content)['errors']), 2)
+		self.assertFalse(JuryGrade.objects.exists())
+		self.assertEqual(Task.objects.count(), ntasks)
+
+
+@override_settings(IPT_TASKS_EAGER=False, IPT_TASKS_IN_PROCESS=False, IPT_TASKS_DEBOUNCE=60)
+class TaskQueueTest(ViewTestCase):
+
+	def test_debounce(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		round = self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		for grade in range(10):
+			JuryGrade.objects.filter(round=round).update(grade_reporter=grade+1)
+			round.save()
+
+		# ten saves, one task per team, problem and fight, none of them due yet
+		keys = ['fight:1:%i' % self.room.pk] + sorted('team:%i' % team.pk for team in [teama, teamb, teamc])
+		self.assertEqual(sorted(Task.objects.values_list('key', flat=True)), keys)
+		self.assertEqual(tasks.run_pending(), 0)
+		self.assertEqual(Team.objects.get(pk=teama.pk).total_points, 0.0)
+
+		# a task queued again and again still runs after max_delay
+		Task.objects.filter(key='team:%i' % teama.pk).update(created=timezone.now() - timedelta(seconds=tasks.max_delay))
+		self.assertEqual(tasks.run_pending(), 1)
+		Task.objects.filter(state='queued').update(due=timezone.now())
+		self.assertEqual(tasks.run_pending(), 3)
+		self.assertEqual(propagation.check_consistency(), [])
+
+		statistics = tasks.statistics()
+		self.assertEqual((statistics['queued'], statistics['done'], statistics['ndone']), (0, 4, 4))
+		self.assertIsNone(statistics['oldest'])
+
+	def test_one_queued_task_per_key(self):
+		from django.db import transaction, IntegrityError
+		tasks.enqueue(['all', 'team:1'])
+		tasks.enqueue(['all'])
+		self.assertEqual(Task.objects.filter(key='all').count(), 1)
+		# another process cannot queue the key again, whatever it read before
+		with self.assertRaises(IntegrityError):
+			with transaction.atomic():
+				Task.objects.create(key='all', queued_key='all')
+
+		# a running task leaves its key free, and is dropped if it meets a busy database once its key is queued again
+		Task.objects.update(state='running', queued_key=None)
+		tasks.enqueue(['all'])
+		self.assertEqual(sorted(Task.objects.values_list('key', 'state')), [('all', 'queued'), ('all', 'running'), ('team:1', 'running')])
+		tasks.requeue(Task.objects.filter(state='running'), timezone.now())
+		self.assertEqual(sorted(Task.objects.values_list('queued_key', 'state')), [('all', 'queued'), ('team:1', 'queued')])
+
+	def test_admin(self):
+		User.objects.create_superuser('admin', 'admin@ipt.fr', 'password')
+		self.client.login(username='admin', password='password')
+		tasks.enqueue(['all'])
+		response = self.client.get(reverse('admin:IPT2018_task_changelist'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.context['statistics']['queued'], 1)
+
+
+class AdminListTest(ViewTestCase):
+
+	def test_keyset_pages(self):
+		User.objects.create_superuser('admin', 'admin@ipt.fr', 'password')
+		self.client.login(username='admin', password='password')
+		self.add_team('A', nparticipants=150)
+		url = reverse('admin:IPT2018_participant_changelist')
+
+		response = self.client.get(url)
+		first = response.context['cl']
+		self.assertTrue(first.keyset)
+		self.assertEqual(first.result_count, 150)
+		self.assertEqual(len(first.result_list), 100)
+		# only the columns of the list are loaded
+		self.assertIn('passport_number', first.result_list[0].get_deferred_fields())
+
+		response = self.client.get(url + first.next_page_url)
+		second = response.context['cl']
+		self.assertEqual([participant.pk for participant in second.result_list], sorted(Participant.objects.values_list('pk', flat=True), reverse=True)[100:])
+		self.assertIsNone(second.next_page_url)
+		# sorting on a column gives the numbered pages back
+		self.assertFalse(self.client.get(url, {'o': '1'}).context['cl'].keyset)
+
+	def test_owned_team(self):
+		from django.contrib.auth.models import Permission
+		teama, participants = self.add_team('A', nparticipants=3)
+		teamb, others = self.add_team('B', nparticipants=2)
+		leader = User.objects.create_user('leader', 'leader@ipt.fr', 'password', is_staff=True)
+		leader.user_permissions.add(Permission.objects.get(codename='change_participant', content_type__app_label='IPT2018'))
+		self.client.login(username='leader', password='password')
+		url = reverse('admin:IPT2018_participant_changelist')
+
+		self.assertEqual(self.client.get(url).context['cl'].result_count, 0)
+		# a Team Leader managing no team cannot save a participant without a team
+		from django.contrib import admin
+		from django.core.exceptions import PermissionDenied
+		from django.test import RequestFactory
+		request = RequestFactory().post(url)
+		request.user, request.session = leader, {}
+		with self.assertRaises(PermissionDenied):
+			admin.site._registry[Participant].save_model(request, Participant(name='Participant', surname='C', role='TM', email='participant@ipt.fr'), None, False)
+		self.assertFalse(Participant.objects.filter(team__isnull=True).exists())
+
+		teama.IOC = leader
+		teama.save()
+		request.session = {}
+		participant = Participant(name='Participant', surname='C', role='TM', email='participant@ipt.fr')
+		admin.site._registry[Participant].save_model(request, participant, None, False)
+		self.assertEqual(participant.team_id, teama.pk)
+		self.assertEqual(self.client.get(url).context['cl'].result_count, 4)
+		# the team is resolved once per session
+		with CaptureQueriesContext(connection) as queries:
+			self.client.get(url)
+		self.assertFalse([query for query in queries.captured_queries if '"IPT2018_team"."IOC_id" = ' in query['sql']])
+
+
+class IndexTest(ViewTestCase):
+
+	def test_unique(self):
+		from django.db import IntegrityError, transaction
+		(a, pa), (b, pb), (c, pc) = [self.add_team(name, 1) for name in 'ABC']
+		round = self.add_round(1, 1, pa[0], pb[0], pc[0], [(5, 5, 5)])
+		with self.assertRaises(IntegrityError), transaction.atomic():
+			Round.objects.create(pf_number=1, round_number=1, room=self.room)
+		with self.assertRaises(IntegrityError), transaction.atomic():
+			JuryGrade.objects.create(round=round, jury=round.jurygrade_set.get().jury, grade_reporter=6, grade_opponent=6, grade_reviewer=6)
+
+	def test_plans(self):
+		from django.core.management import call_command
+		from StringIO import StringIO
+		self.add_round(1, 1, *[self.add_team(name, 1)[1][0] for name in 'ABC'], grades=[(5, 5, 5)])
+		out = StringIO()
+		call_command('add_indexes', stdout=out)
+		self.assertIn("0 indexes and constraints added", out.getvalue())
+		if connection.vendor != 'sqlite':
+			return
+		out = StringIO()
+		call_command('explain_queries', stdout=out)
+		self.assertNotIn("SCAN IPT2018_round", out.getvalue())
+		self.assertIn("USING INDEX round_reporter_team_pf", out.getvalue())
+
+
+class ApiTest(ViewTestCase):
+
+	def test_resources(self):
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		round = self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+
+		data = json.loads(self.client.get(reverse('api_tournament', kwargs={'app_label': 'IPT2018'})).content)
+		self.assertEqual(data['resources'], api.resources)
+		for resource in api.resources:
+			response = self.client.get(reverse('api_resource', kwargs={'app_label': 'IPT2018', 'resource': resource}))
+			self.assertEqual(response.status_code, 200)
+			self.assertIn(resource, json.loads(response.content))
+
+		data = json.loads(self.client.get(reverse('api_resource', kwargs={'app_label': 'IPT2018', 'resource': 'ranking'})).content)
+		self.assertEqual([(team['rank'], team['team']) for team in data['ranking']['qualifying']], [(1, teama.pk), (2, teamb.pk), (3, teamc.pk)])
+		data = json.loads(self.client.get(reverse('api_resource', kwargs={'app_label': 'IPT2018', 'resource': 'grades'}), {'round': round.pk}).content)
+		self.assertEqual([grade['grade_reporter'] for grade in data['grades']], [8, 8])
+		self.assertNotIn('email', json.loads(self.client.get(reverse('api_resource', kwargs={'app_label': 'IPT2018', 'resource': 'participants'})).content)['participants'][0])
+
+	def test_conditional_requests(self):
+		url = reverse('api_resource', kwargs={'app_label': 'IPT2018', 'resource': 'teams'})
+		self.add_team('A')
+		response = self.client.get(url)
+		etag, last_modified = response['ETag'], response['Last-Modified']
+		self.assertFalse(etag.startswith('W/'))
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+		self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+		# the commit hook is not run in the tests
+		self.add_team('B')
+		time.sleep(1)
+		rendercache.bump_version()
+		response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+		self.assertEqual(len(json.loads(response.content)['teams']), 2)
+		self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+
+# the tables and the columns added since the first tournaments, see ipt_connect/schema.py
+series_tables = [('FPT2017', 'FightStanding'), ('IPT2018', 'FightStanding'), ('IPT2018', 'JuryAssignment'), ('IPT2018', 'Task')]
+series_columns = [('IPT2018', 'Participant', field) for field in ('nrounds_as_rep', 'nrounds_as_opp', 'nrounds_as_rev')]
+
+
+def downgrade(alias='default'):
+	"""
+	Bring a database back to the schema of the first tournaments, its data kept.
+	"""
+	from django.db.migrations.operations import RemoveField
+	from django.db.migrations.state import ProjectState
+	# the columns are removed one after the other, every removal copying the table without the columns removed before
+	state = ProjectState.from_apps(apps)
+	with connections[alias].schema_editor() as editor:
+		for app_label, name in series_tables:
+			editor.delete_model(apps.get_model(app_label, name))
+		for app_label, name, field in series_columns:
+			operation = RemoveField(name, field)
+			removed = state.clone()
+			operation.state_forwards(app_label, removed)
+			operation.database_forwards(app_label, editor, state, removed)
+			state = removed
+
+
+class SchemaTest(ViewTestCase):
+
+	def test_upgrade(self):
+		from django.core.management import call_command
+		from StringIO import StringIO
+		(teama, (a1,)), (teamb, (b1,)), (teamc, (c1,)) = [self.add_team(name, nparticipants=1) for name in ['A', 'B', 'C']]
+		self.add_round(1, 1, a1, b1, c1, [(8, 6, 4), (8, 6, 4)])
+		self.add_round(1, 2, b1, c1, a1, [(9, 5, 7), (9, 5, 7)])
+		self.add_round(1, 3, c1, a1, b1, [(5, 5, 5), (5, 5, 5)])
+		counts = list(Participant.objects.order_by('pk').values_list('nrounds_as_rep', 'nrounds_as_opp', 'nrounds_as_rev'))
+		self.assertEqual(counts, [(1, 1, 1)] * 3)
+		self.assertEqual(schema.missing(), [])
+
+		downgrade()
+		self.assertEqual(len(schema.missing()), len(series_tables) + len(series_columns))
+		out = StringIO()
+		call_command('upgrade_schema', stdout=out)
+		self.assertIn("7 tables and columns added", out.getvalue())
+		self.assertEqual(schema.missing(), [])
+		# the new columns and tables are filled from the rounds
+		self.assertEqual(list(Participant.objects.order_by('pk').values_list('nrounds_as_rep', 'nrounds_as_opp', 'nrounds_as_rev')), counts)
+		self.assertEqual(FightStanding.objects.filter(complete=True).count(), 3)
+		self.assertEqual(propagation.check_consistency(), [])
+
+
+@override_settings(IPT_TASKS_EAGER=True)
+class ImportSqliteTest(CacheTestCase):
+
+	def test_baseline_database(self):
+		import tempfile, shutil, sqlite3
+		from django.core.management import call_command
+		from StringIO import StringIO
+		if connection.vendor == 'sqlite':
+			with connection.cursor() as cursor:
+				cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE sql LIKE '%%auth_user__old%%'")
+				if cursor.fetchone()[0]:
+					self.skipTest("SQLite 3.26 or later left the foreign keys to auth_user renamed by the Django 1.11 migrations dangling: loaddata cannot check them")
+		tmpdir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, tmpdir)
+		path, alias = os.path.join(tmpdir, 'db.sqlite3'), 'baseline'
+		connections.databases[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+		def remove():
+			connections[alias].close()
+			del connections.databases[alias]
+		self.addCleanup(remove)
+
+		# a tournament of the first models, its rounds graded but not scored yet
+		call_command('migrate', database=alias, run_syncdb=True, verbosity=0)
+		Room.objects.using(alias).bulk_create([Room(pk=1, name='Room 1')])
+		Team.objects.using(alias).bulk_create([Team(pk=pk, name=name) for pk, name in [(1, 'A'), (2, 'B'), (3, 'C')]])
+		Participant.objects.using(alias).bulk_create([Participant(pk=pk, name='Participant', surname=str(pk), team_id=pk, role='TM', email='participant@ipt.fr') for pk in [1, 2, 3]])
+		Round.objects.using(alias).bulk_create([Round(pk=rn, pf_number=1, round_number=rn, room_id=1, reporter_team_id=a, opponent_team_id=b, reviewer_team_id=c, reporter_id=a, opponent_id=b, reviewer_id=c)
+			for rn, (a, b, c) in [(1, (1, 2, 3)), (2, (2, 3, 1)), (3, (3, 1, 2))]])
+		Jury.objects.using(alias).bulk_create([Jury(pk=pk, name='Jury', surname=str(pk)) for pk in [1, 2]])
+		JuryGrade.objects.using(alias).bulk_create([JuryGrade(round_id=rn, jury_id=jury, grade_reporter=5+rn, grade_opponent=5, grade_reviewer=4) for rn in [1, 2, 3] for jury in [1, 2]])
+		apps.get_model('FPT2017', 'Team').objects.using(alias).bulk_create([apps.get_model('FPT2017', 'Team')(name='F')])
+		downgrade(alias)
+		connections[alias].close()
+
+		out = StringIO()
+		call_command('import_sqlite', path, stdout=out)
+		self.assertIn("Upgraded the copy, IPT2018.Participant: nrounds_as_rep", out.getvalue())
+		self.assertEqual([Team.objects.count(), JuryGrade.objects.count(), apps.get_model('FPT2017', 'Team').objects.count()], [3, 6, 1])
+		# the scores, the standings and the new columns are rebuilt from the rounds
+		self.assertEqual(list(Round.objects.order_by('pk').values_list('score_reporter', flat=True)), [6.0, 7.0, 8.0])
+		self.assertEqual(list(Participant.objects.order_by('pk').values_list('nrounds_as_rep', 'nrounds_as_opp', 'nrounds_as_rev')), [(1, 1, 1)] * 3)
+		self.assertEqual(FightStanding.objects.filter(complete=True).count(), 3)
+		self.assertEqual(propagation.check_consistency(), [])
+		# the database imported is left untouched
+		tables = [name for (name,) in sqlite3.connect(path).execute("SELECT name FROM sqlite_master WHERE type='table'")]
+		self.assertNotIn('IPT2018_task', tables)
+		self.assertIn('IPT2018_round', tables)
+
+
+class ProductionSettingsTest(CacheTestCase):
+
+	def load(self, **environ):
+		"""
+		:return: the production settings module, loaded with the environment variables IPT_<name>
+		"""
+		import imp
+		saved = dict(os.environ)
+		try:
+			for name in [name for name in os.environ if name.startswith('IPT_')]:
+				del os.environ[name]
+			os.environ.update(dict(('IPT_' + name, value) for name, value in environ.items()))
+			if 'ipt_connect.production_settings' in sys.modules:
+				return imp.reload(sys.modules['ipt_connect.production_settings'])
+			from ipt_connect import production_settings
+			return production_settings
+		finally:
+			os.environ.clear()
+			os.environ.update(saved)
+
+	def test_profile(self):
+		from django.core.exceptions import ImproperlyConfigured
+		settings = self.load(SECRET_KEY='secret', DB_NAME='tournament', ALLOWED_HOSTS='ipt.fr, www.ipt.fr')
+		self.assertEqual(settings.DATABASES['default']['ENGINE'], 'django.db.backends.postgresql')
+		self.assertEqual(settings.DATABASES['default']['NAME'], 'tournament')
+		self.assertEqual(settings.DATABASES['default']['CONN_MAX_AGE'], 600)
+		self.assertNotIn('DISABLE_SERVER_SIDE_CURSORS', settings.DATABASES['default'])
+		self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.db.DatabaseCache')
+		self.assertEqual(settings.ALLOWED_HOSTS, ['ipt.fr', 'www.ipt.fr'])
+		self.assertFalse(settings.DEBUG)
+
+		settings = self.load(SECRET_KEY='secret', DB_POOLER='pgbouncer', DB_CONN_MAX_AGE='0')
+		self.assertTrue(settings.DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'])
+		self.assertEqual(settings.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+		with self.assertRaises(ImproperlyConfigured):
+			self.load(SECRET_KEY='secret', DB_POOLER='pgpool')
+		with self.assertRaises(ImproperlyConfigured):
+			self.load(SECRET_KEY='')
+
+
+class SqliteTuningTest(CacheTestCase):
+
+	def connect(self, path):
+		"""
+		:return: a new connection to a SQLite database, set up by the connection_created receivers
+		"""
+		from django.db.backends.sqlite3.base import DatabaseWrapper
+		wrapper = DatabaseWrapper(dict(connection.settings_dict, ENGINE='django.db.backends.sqlite3', NAME=path), 'sqlitetuning')
+		wrapper.ensure_connection()
+		self.addCleanup(wrapper.close)
+		return wrapper
+
+	def test_pragmas(self):
+		import tempfile, shutil
+		tmpdir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, tmpdir)
+
+		with self.connect(os.path.join(tmpdir, 'default.sqlite3')).cursor() as cursor:
+			cursor.execute("PRAGMA journal_mode")
+			self.assertEqual(cursor.fetchone()[0], 'delete')
+
+		with override_settings(IPT_SQLITE_TUNING=True):
+			tuned = self.connect(os.path.join(tmpdir, 'tuned.sqlite3'))
+		with tuned.cursor() as cursor:
+			for pragma, value in [('journal_mode', 'wal'), ('synchronous', 1), ('busy_timeout', 10000), ('cache_size', -64000)]:
+				cursor.execute("PRAGMA %s" % pragma)
+				self.assertEqual(cursor.fetchone()[0], value)
+		# the transactions take the write lock as they start
+		with CaptureQueriesContext(tuned) as queries:
+			tuned._start_transaction_under_autocommit()
+		self.assertEqual(queries.captured_queries[-1]['sql'], "BEGIN IMMEDIATE")
+		tuned.rollback()
+
+
+class SyntheticTest(CacheTestCase):
+
+	def test_year_apps(self):
+		for app_label in yearapps.year_apps:
+			counts = synthetic.generate(app_label, nteams=9, nparticipants=36, njurys=20, photos=False)
+			Round, JuryGrade = [apps.get_model(app_label, name) for name in ('Round', 'JuryGrade')]
+			self.assertEqual(counts['Round'], Round.objects.count())
+			# every round scheduled is graded, the final included
+			self.assertFalse(Round.objects.filter(jurygrade__isnull=True).exists(), app_label)
+			self.assertEqual(counts['JuryGrade'], JuryGrade.objects.count())
+
+
+# query and memory budgets of every view, see ViewBudgetTest
+budgets_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'view_budgets.json')
+
+try:
+	import tracemalloc
+except ImportError:
+	# Python 2 has no tracemalloc: the memory budgets are only recorded and checked with an interpreter which has it
+	tracemalloc = None
+
+# the views which only answer POST requests, they have no page
+post_views = ['submit_grades']
+
+
+@override_settings(IPT_TASKS_EAGER=True)
+class ViewBudgetTest(CacheTestCase):
+	"""
+	Render every page of the tournament on a synthetic tournament of realistic size (30 teams, 200 participants, 60 jurors, see ipt_connect.synthetic), and check that none runs more queries, or allocates more memory, than its recorded budget.
+
+	The memory is the peak of the memory allocated by Python while rendering the page, traced by tracemalloc. The wall time depends too much on the machine to be a budget: it is only printed when recording.
+
+	To record new budgets, after a deliberate change, run the tests with the environment variable IPT_RECORD_BUDGETS=1: view_budgets.json is then rewritten with the current query counts, and a generous memory margin.
+	"""
+
+	@classmethod
+	def setUpTestData(cls):
+		synthetic.generate('IPT2018', photos=False)
+		panels.assign(range(1, npf_tot+1))
+		rounds = list(Round.objects.order_by('pf_number', 'room__name', 'round_number'))
+		cls.round = rounds[0]
+		cls.semifinalround = [round for round in rounds if round.pf_number == npf][0]
+		cls.finalround = rounds[-1]
+		cls.participant = cls.round.reporter
+		cls.jury = Jury.objects.order_by('pk')[0]
+		cls.problem = cls.round.problem_presented
+		cls.team = cls.round.reporter_team
+
+	def setUp(self):
+		super(ViewBudgetTest, self).setUp()
+		User.objects.create_superuser('admin', 'admin@ipt.fr', 'password')
+		self.client.login(username='admin', password='password')
+
+	def view_urls(self):
+		"""
+		:return: list of (view name, url) for every pattern of IPT2018/urls.py
+		"""
+		kwargs = {
+			'participant_detail': {'pk': self.participant.pk},
+			'jury_detail': {'pk': self.jury.pk},
+			'problem_detail': {'pk': self.problem.pk},
+			'round_detail': {'pk': self.round.pk},
+			'live_round': {'pk': self.round.pk},
+			'semifinalround_detail': {'pk': self.semifinalround.pk},
+			'finalround_detail': {'pk': self.finalround.pk},
+			'team_detail': {'team_name': self.team.name},
+			'physics_fight_detail': {'pfid': 1},
+			'physics_fight_csv': {'pfid': 1},
+		}
+		res = []
+		for pattern in urls.urlpatterns:
+			if pattern.name in post_views:
+				continue
+			if pattern.name is not None:
+				url = reverse('IPT2018:'+pattern.name, kwargs=kwargs.get(pattern.name))
+			else:
+				url = '/IPT2018/' + pattern.regex.pattern.strip('^$')
+			res.append((pattern.name or pattern.callback.__name__, url))
+		return res
+
+	def measure(self, url):
+		"""
+		:return: dictionary with the number of queries, the wall time in seconds and, with tracemalloc, the peak memory allocated in kB while rendering the page
+		"""
+		cache.clear()
+		if tracemalloc:
+			tracemalloc.start()
+		start = time.time()
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+		seconds = time.time() - start
+		res = {'queries': len(queries.captured_queries), 'seconds': seconds}
+		if tracemalloc:
+			res['memory_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+			tracemalloc.stop()
+		self.assertEqual(response.status_code, 200, "%s returned %i" % (url, response.status_code))
+		return res
+
+	def test_budgets(self):
+		measures = {}
+		for name, url in self.view_urls():
+			measure = self.measure(url)
+			if name in measures:
+				measure = dict((key, max(value, measures[name][key])) for key, value in measure.items())
+			measures[name] = measure
+
+		if os.environ.get('IPT_RECORD_BUDGETS'):
+			budgets = dict((name, {'queries': measure['queries']}) for name, measure in measures.items())
+			for name, measure in measures.items():
+				if 'memory_kb' in measure:
+					budgets[name]['memory_kb'] = 1000 * (2 * measure['memory_kb'] // 1000 + 1)
+			with open(budgets_file, 'w') as f:
+				json.dump(budgets, f, indent=1, sort_keys=True, separators=(',', ': '))
+				f.write('\n')
+			for name in sorted(measures):
+				sys.stderr.write("\n%-25s %5i queries %8.3f s %8s kB" % (name, measures[name]['queries'], measures[name]['seconds'], measures[name].get('memory_kb', '-')))
+			return
+
+		with open(budgets_file) as f:
+			budgets = json.load(f)
+		for name in sorted(measures):
+			self.assertIn(name, budgets, "No budget recorded for %s, see ViewBudgetTest" % name)
+			for key in ['queries', 'memory_kb']:
+				if key in measures[name] and key in budgets[name]:
+					self.assertLessEqual(measures[name][key], budgets[name][key], "%s is over its budget: %s > %s %s" % (name, measures[name][key], budgets[name][key], key))
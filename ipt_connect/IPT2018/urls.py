@@ -12,6 +12,8 @@ urlpatterns = [
     url(r'^participants$', participants_overview, name='participants_overview'),
     url(r'^participants/(?P<pk>[0-9]+)/$', participant_detail, name='participant_detail'),
     url(r'^jurys$', jurys_overview, name='jurys_overview'),
+    url(r'^jurys/statistics$', jurys_statistics, name='jurys_statistics'),
+    url(r'^jurys/panels$', jury_panels, name='jury_panels'),
     url(r'^member_for_team$', member_for_team),
     url(r'^jurys/(?P<pk>[0-9]+)/$', jury_detail, name='jury_detail'),
 	url(r'^problems$', problems_overview, name="problems_overview"),
@@ -24,8 +26,11 @@ urlpatterns = [
 	url(r'^teams/(?P<team_name>[A-Za-z0-9\w|\W\- ]+)/$', team_detail, name='team_detail'),
 	url(r'^physics_fights$', physics_fights, name='physics_fights'),
 	url(r'^physics_fights/(?P<pfid>[0-9]+)/$', physics_fight_detail, name='physics_fight_detail'),
+	url(r'^physics_fights/(?P<pfid>[0-9]+)/grades.csv$', physics_fight_csv, name='physics_fight_csv'),
     url(r'^ranking$', ranking, name='ranking'),
     url(r'^poolranking$', poolranking, name='poolranking'),
+	url(r'^live/ranking$', live_ranking, name='live_ranking'),
+	url(r'^live/rounds/(?P<pk>[0-9]+)/$', live_round, name='live_round'),
     url(r'^participants_export$', participants_export),
 	url(r'^participants_export_web$', participants_export_web),
 	url(r'^participants_all$', participants_all),
@@ -34,4 +39,6 @@ urlpatterns = [
 	url(r'^trombinoscope$', participants_trombinoscope),
     url(r'^soon', soon),
     url(r'^update_all', update_all),
+    url(r'^check_scores', check_scores),
+	url(r'^grades/submit$', submit_grades, name='submit_grades'),
 ]
@@ -1,8 +1,20 @@
 # coding: utf8
-from django.http import HttpResponse
+import json
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render
 from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_POST
 from models import *
+from django.db.models import F, Q, FloatField, IntegerField, ExpressionWrapper
+from django.db.models.functions import Greatest
+import propagation
+import live
+import gradesheets
+import problemstats
+from rendercache import cache_per_version
+from grids import rounds_grid, column
+from gradematrix import grade_matrix, write_csv
+from jurystats import mean_grades, jury_statistics
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.admin.views.decorators import staff_member_required
 
@@ -15,7 +27,6 @@ def home(request):
 	return HttpResponse(text)
 
 cache_duration_short = 1 * 1
-cache_duration = 20 * 1
 
 ninja_mode = True
 
@@ -66,26 +77,52 @@ def update_all(request):
 
 	return HttpResponse(list_receivers[0][1])
 
+@require_POST
+@user_passes_test(lambda u: u.is_staff)
+def submit_grades(request):
+	"""
+	Store the grade sheets of one or several rounds, sent as JSON, see gradesheets.py.
+	"""
+	try:
+		data = json.loads(request.body)
+	except ValueError:
+		return JsonResponse({"errors": ["The request body is not valid JSON"]}, status=400)
+
+	sheets, errors = gradesheets.parse(data)
+	if errors:
+		return JsonResponse({"errors": errors}, status=400)
+
+	# the scores of the teams, participants and problems follow in the background
+	return JsonResponse({"rounds": sorted(sheets), "changed": gradesheets.store(sheets)}, status=202)
+
+@user_passes_test(lambda u: u.is_superuser or u.username == 'david')
+def check_scores(request):
+	drifts = propagation.check_consistency()
+
+	text = "%i inconsistent values found\n" % len(drifts)
+	for drift in drifts:
+		text += "%s %s: %s is %s, should be %s\n" % (drift["model"], drift["pk"], drift["field"], drift["stored"], drift["expected"])
+
+	return HttpResponse(text, content_type="text/plain")
+
 
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def participants_overview(request):
-	participants = Participant.objects.filter(role='TM') | Participant.objects.filter(role='TC')
-	for participant in participants:
-		participant.allpoints = participant.tot_score_as_reporter + participant.tot_score_as_opponent + participant.tot_score_as_reviewer
-		try:
-			participant.avggrade = participant.allpoints / len(Round.objects.filter(reporter=participant) | Round.objects.filter(opponent=participant) | Round.objects.filter(reviewer=participant))
-		except:
-			participant.avggrade = 0.0
-			print "PLOP"
-
-	participants = sorted(participants, key=lambda participant: participant.avggrade, reverse=True)
+	# the numbers of rounds played in every role are kept up to date on the participants, see Participant.update_scores
+	allpoints = F('tot_score_as_reporter') + F('tot_score_as_opponent') + F('tot_score_as_reviewer')
+	nrounds = F('nrounds_as_rep') + F('nrounds_as_opp') + F('nrounds_as_rev')
+	participants = Participant.objects.filter(role__in=['TM', 'TC']).select_related('team').annotate(
+		allpoints=ExpressionWrapper(allpoints, output_field=FloatField()),
+		nrounds=ExpressionWrapper(nrounds, output_field=IntegerField()),
+		avggrade=ExpressionWrapper(allpoints / Greatest(nrounds, 1), output_field=FloatField()),
+	).order_by('-avggrade', 'pk')
 
 	return render(request, 'IPT2018/participants_overview.html', {'participants': participants})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def participants_all(request):
 	participants = Participant.objects.all().order_by('team','surname')
 
@@ -93,7 +130,7 @@ def participants_all(request):
 
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def participant_detail(request, pk):
 	participant = Participant.objects.get(pk=pk)
 
@@ -111,136 +148,111 @@ def participant_detail(request, pk):
 	return render(request, 'IPT2018/participant_detail.html', {'participant': participant, "average_grades": average_grades})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def jurys_overview(request):
 	jurys = Jury.objects.all().order_by('name')
 
+	# the mean grades of all the jury members in one grouped query, see jurystats
+	means = mean_grades()
 	for jury in jurys:
-		mygrades = JuryGrade.objects.filter(jury=jury)
-		if mygrades:
-			jury.meanrepgrade = mean([grade.grade_reporter for grade in mygrades])
-		else:
-			jury.meanrepgrade = 0.0
-		if mygrades:
-			jury.meanoppgrade = mean([grade.grade_opponent for grade in mygrades])
-		else:
-			jury.meanoppgrade = 0.0
-		if mygrades:
-			jury.meanrevgrade = mean([grade.grade_reviewer for grade in mygrades])
-		else:
-			jury.meanrevgrade = 0.0
+		jury.meanrepgrade, jury.meanoppgrade, jury.meanrevgrade = means.get(jury.pk, (0, (0.0, 0.0, 0.0)))[1]
 	return render(request, 'IPT2018/jurys_overview.html', {'jurys': jurys})
 
+@user_passes_test(lambda u: u.is_staff)
+@cache_per_version
+def jurys_statistics(request):
+	"""
+	Harshness of the jury members, for the organizers making the jury panels, see jurystats.
+	"""
+	jurys = list(Jury.objects.all().select_related('team').order_by('surname', 'name'))
+	stats = jury_statistics()
+	for jury in jurys:
+		jury.stats = stats.get(jury.pk)
+	return render(request, 'IPT2018/jurys_statistics.html', {'jurys': jurys})
+
+@user_passes_test(lambda u: u.is_staff)
+@cache_per_version
+def jury_panels(request):
+	"""
+	The jury panels of every Physics Fight, as computed by panels.py (manage.py assign_juries) or edited in the admin.
+	"""
+	fights = []
+	for assignment in JuryAssignment.objects.select_related('jury', 'jury__team', 'room'):
+		if not fights or fights[-1]["pf"] != assignment.pf_number:
+			fights.append({"pf": assignment.pf_number, "rooms": []})
+		rooms = fights[-1]["rooms"]
+		if not rooms or rooms[-1]["room"] != assignment.room:
+			rooms.append({"room": assignment.room, "jurys": []})
+		rooms[-1]["jurys"].append(assignment.jury)
+	return render(request, 'IPT2018/jury_panels.html', {'fights': fights})
+
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def jury_detail(request, pk):
 	jury = Jury.objects.get(pk=pk)
 	mygrades = JuryGrade.objects.filter(jury=jury)
 	return render(request, 'IPT2018/jury_detail.html', {'jury': jury, "grades": mygrades})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def tournament_overview(request):
-	rounds = Round.objects.all()
-
-	teams = Team.objects.all()
-	teams = sorted(teams, key=lambda team: team.name)
-
-	rooms = Room.objects.all()
-	rooms = sorted(rooms, key=lambda room: room.name)
+	teams = Team.objects.order_by('name')
 
+	rooms, orderedroundsperroom = rounds_grid(pfs)
 	roomnumbers = [ind +1 for ind, room in enumerate(rooms)]
-	orderedroundsperroom=[]
-
-	for room in rooms:
-		thisroom = []
-
-		for pf in pfs:
-			thispf = []
-			myrounds = Round.objects.filter(pf_number=pf).filter(room=room)
-			myrounds = sorted(myrounds, key=lambda round: round.round_number)
-
-			for round in myrounds:
-				thispf.append(round)
-
-			thisroom.append(thispf)
 
-		orderedroundsperroom.append(thisroom)
-
-	return render(request, 'IPT2018/tournament_overview.html', {'teams': teams, 'rounds': rounds, 'pfs': pfs, 'roomnumbers':roomnumbers, 'orderedroundsperroom': orderedroundsperroom})
+	return render(request, 'IPT2018/tournament_overview.html', {'teams': teams, 'pfs': pfs, 'roomnumbers':roomnumbers, 'orderedroundsperroom': orderedroundsperroom})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def teams_overview(request):
 	teams = Team.objects.all()
 	teams = sorted(teams, key=lambda team: team.name)
 	return render(request, 'IPT2018/teams_overview.html', {'teams': teams})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def team_detail(request, team_name):
 	team = Team.objects.get(name=team_name)
-	ranking = Team.objects.order_by('-total_points')
-	for i,t in enumerate(ranking):
-		if t == team:
-			team.rank = i+1
-	# team.rank = ranking.index(team) + 1
-	participants = Participant.objects.filter(team=team).filter(role='TM') | Participant.objects.filter(team=team).filter(role='TC')
+	# the rank is the number of teams ahead, plus one
+	team.rank = Team.objects.filter(total_points__gt=team.total_points).count() + 1
 
-	rankedparticipants = participants.order_by('total_points')
+	rankedparticipants = Participant.objects.filter(team=team, role__in=['TM', 'TC']).order_by('total_points')
 
 	teamleaders = Jury.objects.filter(team=team)
 
-	myreprounds = Round.objects.filter(reporter_team=team)
-	myopprounds = Round.objects.filter(opponent_team=team)
-	myrevrounds = Round.objects.filter(reviewer_team=team)
-
+	# all the rounds of the team in one query, listed by role, those the team was graded in only
+	rounds = list(Round.objects.filter(Q(reporter_team=team) | Q(opponent_team=team) | Q(reviewer_team=team)).select_related('problem_presented').order_by('pk'))
 	allrounds = []
+	for role in ['reporter', 'opponent', 'reviewer']:
+		for round in rounds:
+			if getattr(round, role + '_team_id') == team.pk and getattr(round, 'score_' + role) > 0.:
+				round.myrole = role
+				round.mygrade = getattr(round, 'score_' + role)
+				allrounds.append(round)
 
-	for round in myreprounds:
-		# if len(JuryGrade.objects.filter(round=round)) > 0:
-		if round.score_reporter > 0.:
-			round.myrole = "reporter"
-			round.mygrade = round.score_reporter
-			allrounds.append(round)
-	for round in myopprounds:
-		# if len(JuryGrade.objects.filter(round=round)) > 0:
-		if round.score_opponent > 0.:
-			round.myrole = "opponent"
-			round.mygrade = round.score_opponent
-			allrounds.append(round)
-	for round in myrevrounds:
-		# if len(JuryGrade.objects.filter(round=round)) > 0:
-		if round.score_reviewer > 0.:
-			round.myrole = "reviewer"
-			round.mygrade = round.score_reviewer
-			allrounds.append(round)
-
-	penalties=[]
-	prescoeffs = team.presentation_coefficients(verbose=False)
-
-	for ind, p in enumerate(prescoeffs):
-		if p != 3.0:
-			penalties.append([ind+1, p])
-
-	return render(request, 'IPT2018/team_detail.html', {'team': team, 'participants': rankedparticipants, 'teamleaders': teamleaders, 'allrounds': allrounds, 'penalties': penalties})
+	# the coefficients are cached, see Team.presentation_coefficients
+	penalties = [[ind+1, p] for ind, p in enumerate(team.presentation_coefficients(verbose=False)) if p != 3.0]
+
+	standings = FightStanding.objects.filter(team=team).select_related('room')
+
+	return render(request, 'IPT2018/team_detail.html', {'team': team, 'participants': rankedparticipants, 'teamleaders': teamleaders, 'allrounds': allrounds, 'penalties': penalties, 'standings': standings})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def problems_overview(request):
-	problems = Problem.objects.all().order_by('name')
-	rounds = Round.objects.all()
+	problems = list(Problem.objects.all().order_by('name'))
+	# the statistics of all the problems at once, see problemstats
+	stats = problemstats.statistics([problem.pk for problem in problems])
 	for problem in problems:
-		problem.npres = len(rounds.filter(problem_presented=problem))
-		problem.meangradrep = problem.mean_score_of_reporters
-		problem.meangradopp = problem.mean_score_of_opponents
-		problem.meangradrev = problem.mean_score_of_reviewers
+		problem.npres = stats[problem.pk]["npres"]
+		problem.meangradrep, problem.meangradopp, problem.meangradrev = stats[problem.pk]["means"]
 
 	return render(request, 'IPT2018/problems_overview.html', {'problems': problems})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def problem_detail(request, pk):
 	problem = Problem.objects.get(pk=pk)
 	(meangrades, teamresults) = problem.status(verbose=False)
@@ -248,34 +260,17 @@ def problem_detail(request, pk):
 	return render(request, 'IPT2018/problem_detail.html', {'problem': problem, "meangrades": meangrades, "teamresults": teamresults})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def rounds(request):
-	qfrounds = Round.objects.filter(pf_number=1) | Round.objects.filter(pf_number=2) | Round.objects.filter(pf_number=3) | Round.objects.filter(pf_number=4)
-
-	rooms = Room.objects.order_by('name')
-
-	orderedroundsperroom=[]
-	for room in rooms:
-		thisroom = []
-		for pf in pfs[:4]:
-			thisroom.append(qfrounds.filter(pf_number=pf).filter(room=room).order_by('round_number'))
-		orderedroundsperroom.append(thisroom)
-
-
+	# the four qualifying fights, and the final in a last column
+	rooms, grid = rounds_grid(pfs[:4] + [npf+1])
+	orderedroundsperroom = [row[:4] for row in grid]
 
 	if with_final_pf :
-		myrounds = Round.objects.filter(pf_number=npf+1)
-		finalrounds = sorted(myrounds, key=lambda round: round.round_number)
-		try:
-			finalteams = [finalrounds[0].reporter_team, finalrounds[0].opponent_team, finalrounds[0].reviewer_team]
-			finalpoints = [team.points(pfnumber=npf+1, bonuspoints=False) for team in finalteams]
-		except:
-			finalteams = ["---", "---", "---"]
-			finalpoints = [0, 0, 0]
-
-			finalranking = []
-		for team, point in zip(finalteams, finalpoints):
-			finalranking.append([team, point])
+		finalrounds = sorted(column(grid, 4), key=lambda round: round.round_number)
+		finalranking = [[standing.team, standing.points] for standing in FightStanding.objects.filter(pf_number=npf+1).select_related('team')]
+		if not finalranking:
+			finalranking = [["---", 0], ["---", 0], ["---", 0]]
 
 		return render(request, 'IPT2018/rounds.html', {'orderedroundsperroom': orderedroundsperroom, 'finalrounds': finalrounds, "finalranking": finalranking})
 
@@ -284,7 +279,7 @@ def rounds(request):
 
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def round_detail(request, pk):
 	round = Round.objects.get(pk=pk)
 
@@ -313,7 +308,7 @@ def round_detail(request, pk):
 
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def semifinalround_detail(request, pk):
 	round = Round.objects.get(pk=pk)
 	jurygrades = JuryGrade.objects.filter(round=round).order_by('jury__name')
@@ -341,7 +336,7 @@ def semifinalround_detail(request, pk):
 
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def finalround_detail(request, pk):
 	round = Round.objects.get(pk=pk)
 	jurygrades = JuryGrade.objects.filter(round=round).order_by('jury__name')
@@ -371,55 +366,39 @@ def finalround_detail(request, pk):
 
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def physics_fights(request):
-	rounds = Round.objects.all()
-	pf1 = rounds.filter(pf_number=1)
-	pf2 = rounds.filter(pf_number=2)
-	pf3 = rounds.filter(pf_number=3)
+	rooms, grid = rounds_grid(pfs[:3])
+	pf1, pf2, pf3 = [column(grid, ind) for ind in range(3)]
 	return render(request, 'IPT2018/physics_fights.html', {'pf1': pf1, 'pf2': pf2, 'pf3': pf3})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def physics_fight_detail(request, pfid):
-	rounds = Round.objects.filter(pf_number=pfid)
-	rooms = Room.objects.all().order_by('name')
+	return render(request, 'IPT2018/physics_fight_detail.html', {"pf": int(pfid), "rooms": grade_matrix(int(pfid))})
 
-	roomgrades = []
-	for room in rooms:
-		roomrounds = rounds.filter(room=room)
-		finished = False
-		grades = JuryGrade.objects.filter(round__room=room, round__pf_number=pfid).order_by('round__round_number', 'jury__surname')
-		gradesdico = {}
-		for grade in grades:
-			gradesdico[grade.jury] = []
-		for grade in grades:
-			gradesdico[grade.jury].append(grade)
-
-		juryallgrades = [{'juryroundsgrades': gradesdico[jury], 'name': jury.name+" "+jury.surname} for jury in gradesdico.keys()]
-		print juryallgrades
-
-		# meangrades
-		meanroundsgrades = []
-		for round in roomrounds:
-			meangrades=[]
-			try:
-				meangrades.append(round.score_reporter)
-				meangrades.append(round.score_opponent)
-				meangrades.append(round.score_reviewer)
-
-			except:
-				pass
-			meanroundsgrades.append(meangrades)
-
-		infos = {"pf": pfid, "room": room.name, "finished": finished}
-		roundsgrades = [juryallgrades, meanroundsgrades, infos]
-		roomgrades.append(roundsgrades)
-
-	return render(request, 'IPT2018/physics_fight_detail.html', {"roomgrades": roomgrades})
+@user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
+@cache_per_version
+def physics_fight_csv(request, pfid):
+	response = HttpResponse(content_type='text/csv; charset=utf-8')
+	response['Content-Disposition'] = 'attachment; filename="IPT2018_physics_fight_%i_grades.csv"' % int(pfid)
+	write_csv(grade_matrix(int(pfid)), response)
+	return response
+
+def fights_status():
+	"""
+	:return: two dictionaries, {team pk: number of qualifying fights played} and {team pk: qualifying fight being played}, from the fight standings
+	"""
+	played, ongoing = {}, {}
+	for team, pf, complete in FightStanding.objects.filter(pf_number__in=pfs[:4]).values_list('team', 'pf_number', 'complete'):
+		if complete:
+			played[team] = played.get(team, 0) + 1
+		else:
+			ongoing[team] = pf
+	return played, ongoing
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def ranking(request):
 	rankteams = []
 	ranking = Team.objects.order_by('-total_points')
@@ -427,16 +406,13 @@ def ranking(request):
 	# if len(teams) > 0 :
 	if len(ranking) > 0:
 
+		played, ongoing = fights_status()
 		for ind, team in enumerate(ranking):
-			nrounds_as_rep = team.nrounds_as_rep # Round.objects.filter(reporter_team=team)
-			nrounds_as_opp = team.nrounds_as_opp # Round.objects.filter(opponent_team=team)
-			nrounds_as_rev = team.nrounds_as_rev # Round.objects.filter(reviewer_team=team)
-			pfsplayed = min(nrounds_as_rep, nrounds_as_opp, nrounds_as_rev)
-			team.pfsplayed = pfsplayed
+			team.pfsplayed = played.get(team.pk, 0)
 			team.ongoingpf = False
-			#if max(nrounds_as_rep, nrounds_as_opp, nrounds_as_rev) > pfsplayed:
+			#if team.pk in ongoing:
 				#team.ongoingpf = True
-				#team.currentpf = pfsplayed+1
+				#team.currentpf = ongoing[team.pk]
 			team.rank = ind+1
 			if team.rank == 1:
 				team.emphase = True
@@ -459,8 +435,10 @@ def ranking(request):
 	return render(request, 'IPT2018/ranking.html', {'rankteams': rankteams, 'semirankteams': semirankteams})
 
 @user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
-@cache_page(cache_duration)
+@cache_per_version
 def poolranking(request):
+	played, ongoing = fights_status()
+
 	# Pool A
 	rankteamsA = []
 	ranking = Team.objects.filter(pool="A").order_by('-total_points')
@@ -469,15 +447,11 @@ def poolranking(request):
 	if len(ranking) > 0:
 
 		for ind, team in enumerate(ranking):
-			nrounds_as_rep = team.nrounds_as_rep # Round.objects.filter(reporter_team=team)
-			nrounds_as_opp = team.nrounds_as_opp # Round.objects.filter(opponent_team=team)
-			nrounds_as_rev = team.nrounds_as_rev # Round.objects.filter(reviewer_team=team)
-			pfsplayed = min(nrounds_as_rep, nrounds_as_opp, nrounds_as_rev)
-			team.pfsplayed = pfsplayed
+			team.pfsplayed = played.get(team.pk, 0)
 			team.ongoingpf = False
-			if max(nrounds_as_rep, nrounds_as_opp, nrounds_as_rev) > pfsplayed:
+			if team.pk in ongoing:
 				team.ongoingpf = True
-				team.currentpf = pfsplayed+1
+				team.currentpf = ongoing[team.pk]
 			team.rank = ind+1
 			if team.rank == 1:
 				team.emphase=True
@@ -491,18 +465,38 @@ def poolranking(request):
 	if len(ranking) > 0:
 
 		for ind, team in enumerate(ranking):
-			nrounds_as_rep = team.nrounds_as_rep # Round.objects.filter(reporter_team=team)
-			nrounds_as_opp = team.nrounds_as_opp # Round.objects.filter(opponent_team=team)
-			nrounds_as_rev = team.nrounds_as_rev # Round.objects.filter(reviewer_team=team)
-			pfsplayed = min(nrounds_as_rep, nrounds_as_opp, nrounds_as_rev)
-			team.pfsplayed = pfsplayed
+			team.pfsplayed = played.get(team.pk, 0)
 			team.ongoingpf = False
-			if max(nrounds_as_rep, nrounds_as_opp, nrounds_as_rev) > pfsplayed:
+			if team.pk in ongoing:
 				team.ongoingpf = True
-				team.currentpf = pfsplayed+1
+				team.currentpf = ongoing[team.pk]
 			team.rank = ind+1
 			if team.rank == 1:
 				team.emphase=True
 			rankteamsB.append(team)
 
 	return render(request, 'IPT2018/poolranking.html', {'rankteamsA': rankteamsA, 'rankteamsB': rankteamsB})
+
+
+def live_response(name, compute, request):
+	"""
+	:return: the answer to a live request, see live.poll: 304 Not Modified if the data did not change since the version of the client, within the wait
+	"""
+	try:
+		since = int(request.GET.get('since', 0))
+	except ValueError:
+		since = 0
+	res = live.poll(name, compute, since)
+	if res is None:
+		return HttpResponseNotModified()
+	return JsonResponse(res)
+
+
+@user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
+def live_ranking(request):
+	return live_response('ranking', live.ranking_state, request)
+
+
+@user_passes_test(ninja_test, redirect_field_name=None, login_url='/IPT2018/soon')
+def live_round(request, pk):
+	return live_response('round:%s' % int(pk), lambda: live.round_state(pk), request)
@@ -0,0 +1 @@
+default_app_config = 'ipt_connect.apps.IptConnectConfig'
@@ -0,0 +1,136 @@
+# coding: utf8
+"""
+Admin lists of the year apps that stay fast with thousands of rows, e.g. the participants during the registrations.
+
+* The list only loads the columns it shows (ListAdmin.list_only, an only() projection) and joins the related objects it shows (list_select_related). The change form still loads the whole object.
+* In the default order, the most recent first, the pages are read with keyset pagination: the next page is the rows with a pk below the last one of the current page, ?after=<pk>, instead of an OFFSET the database has to scan through. Sorting on a column falls back to the usual numbered pages.
+* The total count of the unfiltered table is not computed (show_full_result_count).
+* The team a Team Leader manages is resolved once per session (owned_team), instead of a User query on every page. The session entry is dropped whenever a team of the year is saved or deleted (watch_ownership).
+"""
+from uuid import uuid4
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+
+# parameter of the query string of the keyset pagination
+keyset_var = 'after'
+
+
+class KeysetChangeList(ChangeList):
+	"""
+	Change list paginated on the primary key in the default order, see the module docstring.
+	"""
+
+	def __init__(self, request, *args, **kwargs):
+		try:
+			self.after = int(request.GET[keyset_var])
+		except (KeyError, ValueError):
+			self.after = None
+		self.keyset = False
+		self.next_page_url = None
+		super(KeysetChangeList, self).__init__(request, *args, **kwargs)
+
+	def get_filters_params(self, params=None):
+		lookup_params = super(KeysetChangeList, self).get_filters_params(params)
+		lookup_params.pop(keyset_var, None)
+		return lookup_params
+
+	def get_query_string(self, new_params=None, remove=None):
+		# a new filter or order starts from the first page
+		new_params = dict(new_params or {})
+		new_params.setdefault(keyset_var, None)
+		return super(KeysetChangeList, self).get_query_string(new_params, remove)
+
+	def get_queryset(self, request):
+		qs = super(KeysetChangeList, self).get_queryset(request)
+		if self.model_admin.list_only:
+			qs = qs.only(*self.model_admin.list_only)
+		return qs
+
+	def get_results(self, request):
+		ordering = list(self.queryset.query.order_by)
+		if ordering not in (['-pk'], ['pk']) or self.show_all or self.page_num:
+			return super(KeysetChangeList, self).get_results(request)
+
+		# the same attributes as ChangeList.get_results, without the OFFSET query
+		self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+		self.result_count = self.paginator.count
+		self.show_full_result_count = self.model_admin.show_full_result_count
+		self.full_result_count = self.root_queryset.count() if self.show_full_result_count else None
+		self.show_admin_actions = not self.show_full_result_count or bool(self.full_result_count)
+		self.can_show_all = self.result_count <= self.list_max_show_all
+		self.multi_page = self.result_count > self.list_per_page
+
+		self.keyset = True
+		qs = self.queryset
+		if self.after is not None:
+			qs = qs.filter(pk__lt=self.after) if ordering == ['-pk'] else qs.filter(pk__gt=self.after)
+		rows = list(qs[:self.list_per_page+1])
+		if len(rows) > self.list_per_page:
+			rows = rows[:self.list_per_page]
+			self.next_page_url = self.get_query_string({keyset_var: rows[-1].pk})
+		self.result_list = rows
+
+
+class ListAdmin(admin.ModelAdmin):
+	"""
+	Admin of a model with a long list, see the module docstring.
+	"""
+
+	# the fields loaded for the list, None for all of them
+	list_only = None
+	show_full_result_count = False
+	change_list_template = 'admin/keyset_change_list.html'
+
+	def get_changelist(self, request, **kwargs):
+		return KeysetChangeList
+
+
+def ownership_key(app_label):
+	return "%s:ownership_version" % app_label
+
+
+def ownership_version(app_label):
+	"""
+	:return: the current version of the team ownerships of a year app
+	"""
+	version = cache.get(ownership_key(app_label))
+	if version is None:
+		version = uuid4().hex
+		cache.add(ownership_key(app_label), version, None)
+		version = cache.get(ownership_key(app_label), version)
+	return version
+
+
+def ownership_changed(sender, **kwargs):
+	cache.set(ownership_key(sender._meta.app_label), uuid4().hex, None)
+
+
+def watch_ownership(team_model):
+	"""
+	Drop the team ownerships kept in the sessions whenever a team of the year app is saved or deleted.
+
+	:param team_model: the Team model of the year app
+	"""
+	post_save.connect(ownership_changed, sender=team_model, dispatch_uid="%s_ownership_saved" % team_model._meta.app_label)
+	post_delete.connect(ownership_changed, sender=team_model, dispatch_uid="%s_ownership_deleted" % team_model._meta.app_label)
+
+
+def owned_team(request, team_model):
+	"""
+	:param request: a request of a logged in user
+	:param team_model: the Team model of the year app
+	:return: the pk of the team of the year app the user manages (Team.IOC), None if none
+	"""
+	app_label = team_model._meta.app_label
+	key = "%s:owned_team" % app_label
+	version = ownership_version(app_label)
+	stored = request.session.get(key)
+	if stored is not None and stored[:2] == [request.user.pk, version]:
+		return stored[2]
+
+	team = team_model.objects.filter(IOC=request.user.pk).values_list('pk', flat=True).first()
+	request.session[key] = [request.user.pk, version, team]
+	return team
@@ -0,0 +1,187 @@
+# coding: utf8
+"""
+Read-only JSON API of the tournaments, for the projector displays, the live-stream overlays and whoever prefers data to pages.
+
+	/api/v1/                            the tournaments
+	/api/v1/<tournament>/               the resources of a tournament
+	/api/v1/<tournament>/<resource>     teams, participants, problems, rounds, grades or ranking
+
+The rounds and the grades can be filtered with ?pf=<Physics Fight number>, the grades with ?round=<pk>. The objects refer to each other by their pk.
+
+Every tournament has a data version, a timestamp in microseconds moved forward when something of the tournament is saved or deleted (see bump_version). The responses carry a strong ETag built from that version and a Last-Modified date, the time of the version: a client polling with If-None-Match or If-Modified-Since gets a 304 until the next change. The JSON is built from values() queries, once per version: it is kept in the cache until the next change.
+
+The tournaments hidden by their ninja mode are only served to the staff, like their pages.
+"""
+import time
+from datetime import datetime
+from hashlib import md5
+from importlib import import_module
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition, require_safe
+from ipt_connect.yearapps import fields, year_apps
+
+
+api_version = 1
+
+# the public fields of every model, those an app does not have are left aside
+team_fields = ['pk', 'name', 'surname', 'pool', 'total_points', 'bonus_points', 'semi_points', 'is_in_semi', 'nrounds_as_rep', 'nrounds_as_opp', 'nrounds_as_rev']
+participant_fields = ['pk', 'name', 'surname', 'team', 'role', 'total_points', 'mean_score_as_reporter', 'mean_score_as_opponent', 'mean_score_as_reviewer', 'nrounds_as_rep', 'nrounds_as_opp', 'nrounds_as_rev']
+problem_fields = ['pk', 'name', 'description', 'mean_score_of_reporters', 'mean_score_of_opponents', 'mean_score_of_reviewers']
+round_fields = ['pk', 'pf_number', 'round_number', 'room', 'reporter_team', 'opponent_team', 'reviewer_team', 'reporter', 'reporter_2', 'opponent', 'reviewer', 'problem_presented', 'score_reporter', 'score_opponent', 'score_reviewer', 'points_reporter', 'points_opponent', 'points_reviewer']
+grade_fields = ['pk', 'round', 'jury', 'grade_reporter', 'grade_opponent', 'grade_reviewer']
+
+
+def version_key(app_label):
+	return "%s:data_version" % app_label
+
+
+def data_version(app_label):
+	"""
+	:param app_label: name of a year app
+	:return: the current data version of the tournament
+	"""
+	version = cache.get(version_key(app_label))
+	if version is None:
+		# first call, or the version was dropped from the cache: start a new one, greater than all the previous ones
+		cache.add(version_key(app_label), int(time.time() * 1e6), None)
+		version = cache.get(version_key(app_label))
+	return version
+
+
+def bump_version(app_label):
+	"""
+	Move the tournament to a new data version. The version is a timestamp in microseconds, so that it increases even if the cache lost it.
+
+	:param app_label: name of a year app
+	:return: the new version
+	"""
+	version = max(int(time.time() * 1e6), (cache.get(version_key(app_label)) or 0) + 1)
+	cache.set(version_key(app_label), version, None)
+	return version
+
+
+def data_changed(sender, **kwargs):
+	"""
+	Receiver of post_save and post_delete, connected in ipt_connect.apps: a new data version is needed once the transaction is committed. IPT2018 takes care of its own version, see IPT2018.models.data_changed.
+	"""
+	app_label = sender._meta.app_label
+	if app_label in year_apps and app_label != 'IPT2018':
+		transaction.on_commit(lambda: bump_version(app_label))
+
+
+def values(model, wanted, **extra):
+	"""
+	:param model: a model class
+	:param wanted: list of the fields to return, the model may lack some of them
+	:param extra: further values, as expressions
+	:return: a values() queryset of the fields the model has, ordered by pk
+	"""
+	names = fields(model) | set(['pk'])
+	return model.objects.order_by('pk').values(*[name for name in wanted if name in names], **extra)
+
+
+def teams(app_label, request):
+	return list(values(apps.get_model(app_label, 'Team'), team_fields))
+
+
+def participants(app_label, request):
+	return list(values(apps.get_model(app_label, 'Participant'), participant_fields))
+
+
+def problems(app_label, request):
+	return list(values(apps.get_model(app_label, 'Problem'), problem_fields))
+
+
+def rounds(app_label, request):
+	rounds = values(apps.get_model(app_label, 'Round'), round_fields, room_name=F('room__name'))
+	if request.GET.get('pf', '').isdigit():
+		rounds = rounds.filter(pf_number=int(request.GET['pf']))
+	return list(rounds)
+
+
+def grades(app_label, request):
+	jury_fields = fields(apps.get_model(app_label, 'Jury'))
+	names = dict(('jury_' + name, F('jury__' + name)) for name in ['name', 'surname'] if name in jury_fields)
+	grades = values(apps.get_model(app_label, 'JuryGrade'), grade_fields, **names)
+	if request.GET.get('pf', '').isdigit():
+		grades = grades.filter(round__pf_number=int(request.GET['pf']))
+	if request.GET.get('round', '').isdigit():
+		grades = grades.filter(round=int(request.GET['round']))
+	return list(grades)
+
+
+def ranking(app_label, request):
+	"""
+	:return: dictionary {"qualifying": ranked teams}, with the semi-final ranking under "semi" for the tournaments which have one
+	"""
+	Team = apps.get_model(app_label, 'Team')
+	if 'total_points' in fields(Team):
+		teams = Team.objects.order_by('-total_points', 'pk').values_list('pk', 'name', 'total_points')
+	else:
+		# the points are computed on the fly
+		teams = [(team.pk, team.name, team.points()) for team in Team.objects.all()]
+		teams.sort(key=lambda team: -team[2])
+	res = {"qualifying": [{"rank": ind+1, "team": pk, "name": name, "points": points} for ind, (pk, name, points) in enumerate(teams)]}
+
+	if 'is_in_semi' in fields(Team):
+		semiteams = Team.objects.filter(is_in_semi=True).order_by('-semi_points', 'pk').values_list('pk', 'name', 'semi_points')
+		res["semi"] = [{"rank": ind+1, "team": pk, "name": name, "points": points} for ind, (pk, name, points) in enumerate(semiteams)]
+	return res
+
+
+resources = ['teams', 'participants', 'problems', 'rounds', 'grades', 'ranking']
+builders = {'teams': teams, 'participants': participants, 'problems': problems, 'rounds': rounds, 'grades': grades, 'ranking': ranking}
+
+
+def visible(request, app_label):
+	"""
+	:return: may the user see the tournament ?
+	"""
+	ninja_test = getattr(import_module('%s.views' % app_label), 'ninja_test', None)
+	return ninja_test is None or ninja_test(request.user)
+
+
+def etag(request, app_label, resource=None):
+	return "%s-%s" % (data_version(app_label), md5(request.get_full_path()).hexdigest())
+
+
+def last_modified(request, app_label, resource=None):
+	return datetime.utcfromtimestamp(data_version(app_label) / 1e6)
+
+
+def response(payload, status=200):
+	# sorted keys, so that the same data always gives the same bytes, as a strong ETag promises
+	return JsonResponse(payload, status=status, json_dumps_params={'sort_keys': True})
+
+
+@require_safe
+def index(request):
+	return response({"version": api_version, "tournaments": list(year_apps)})
+
+
+@require_safe
+def tournament(request, app_label):
+	if not visible(request, app_label):
+		return response({"error": "%s is not public yet" % app_label}, status=403)
+	return response({"tournament": app_label, "version": data_version(app_label), "resources": resources})
+
+
+@require_safe
+def resource(request, app_label, resource):
+	if not visible(request, app_label):
+		return response({"error": "%s is not public yet" % app_label}, status=403)
+	return conditional_resource(request, app_label, resource)
+
+
+@condition(etag_func=etag, last_modified_func=last_modified)
+def conditional_resource(request, app_label, resource):
+	key = "api:%s:%s:%s" % (app_label, data_version(app_label), md5(request.get_full_path()).hexdigest())
+	content = cache.get(key)
+	if content is None:
+		content = response({"tournament": app_label, resource: builders[resource](app_label, request)}).content
+		cache.set(key, content, None)
+	return HttpResponse(content, content_type='application/json')
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+
+
+class IptConnectConfig(AppConfig):
+	name = 'ipt_connect'
+
+	def ready(self):
+		import api, sqlitetuning
+		# the data version of the tournaments, see api.py
+		post_save.connect(api.data_changed, dispatch_uid="ipt_connect_data_saved")
+		post_delete.connect(api.data_changed, dispatch_uid="ipt_connect_data_deleted")
+		# the pragmas of the SQLite connections, see sqlitetuning.py
+		connection_created.connect(sqlitetuning.tune, dispatch_uid="ipt_connect_sqlite_tuning")
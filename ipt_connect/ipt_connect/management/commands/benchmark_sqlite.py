@@ -0,0 +1,130 @@
+# coding: utf8
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS, OperationalError
+from django.test import RequestFactory, override_settings
+
+from IPT2018.models import JuryGrade
+from IPT2018 import gradesheets, views
+
+
+def percentile(values, fraction):
+	if not values:
+		return float('nan')
+	values = sorted(values)
+	return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class Command(BaseCommand):
+	help = "Compare the concurrent grade saves and ranking reads of IPT2018 on a SQLite database with and without the tuning of ipt_connect/sqlitetuning.py. The benchmark runs on copies, the database is left untouched"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--database', default=None, help="The SQLite database, with a tournament in IPT2018 (default the one of the settings, see generate_tournament)")
+		parser.add_argument('--writers', type=int, default=4, help="Number of threads saving grade sheets (default 4)")
+		parser.add_argument('--readers', type=int, default=4, help="Number of threads reading the ranking (default 4)")
+		parser.add_argument('--seconds', type=float, default=10.0, help="Duration of every run (default 10)")
+		parser.add_argument('--seed', type=int, default=2018, help="Seed of the random grades (default 2018)")
+
+	def handle(self, *args, **options):
+		settings_dict = connections.databases[DEFAULT_DB_ALIAS]
+		if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+			raise CommandError("The database of the settings is not a SQLite one")
+		source = options['database'] or settings_dict['NAME']
+		if not os.path.isfile(source):
+			raise CommandError("No SQLite database at %s" % source)
+
+		tmpdir = tempfile.mkdtemp()
+		name = settings_dict['NAME']
+		try:
+			results = []
+			for tuned in (False, True):
+				# a fresh copy for every run, in the journal mode of a database never tuned
+				path = os.path.join(tmpdir, 'tuned.sqlite3' if tuned else 'default.sqlite3')
+				for suffix in ('', '-wal', '-shm'):
+					if os.path.isfile(source + suffix):
+						shutil.copy(source + suffix, path + suffix)
+				db = sqlite3.connect(path)
+				db.execute("PRAGMA journal_mode = DELETE")
+				db.close()
+
+				connections[DEFAULT_DB_ALIAS].close()
+				settings_dict['NAME'] = path
+				with override_settings(IPT_SQLITE_TUNING=tuned, IPT_TASKS_EAGER=False, IPT_TASKS_IN_PROCESS=False,
+						CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+					results.append(self.run(options))
+				connections[DEFAULT_DB_ALIAS].close()
+		finally:
+			settings_dict['NAME'] = name
+			shutil.rmtree(tmpdir)
+
+		self.stdout.write("%-9s %9s %9s %9s %7s %9s %9s %9s" % ("", "writes/s", "p50 ms", "p95 ms", "locked", "reads/s", "p50 ms", "p95 ms"))
+		for label, res in zip(("default", "tuned"), results):
+			self.stdout.write("%-9s %9.1f %9.1f %9.1f %7i %9.1f %9.1f %9.1f" % (label,
+				len(res['writes']) / options['seconds'], 1000 * percentile(res['writes'], 0.5), 1000 * percentile(res['writes'], 0.95), res['errors'],
+				len(res['reads']) / options['seconds'], 1000 * percentile(res['reads'], 0.5), 1000 * percentile(res['reads'], 0.95)))
+
+	def run(self, options):
+		"""
+		:return: dictionary with the durations in seconds of the grade saves ("writes") and ranking reads ("reads"), and the number of saves and reads which failed on a locked database ("errors")
+		"""
+		sheets = {}
+		for round, jury in JuryGrade.objects.order_by('round', 'jury').values_list('round', 'jury'):
+			sheets.setdefault(round, []).append(jury)
+		if not sheets:
+			raise CommandError("There are no grades in IPT2018, see generate_tournament")
+		rounds = sorted(sheets)
+		connections[DEFAULT_DB_ALIAS].close()
+
+		res = {'writes': [], 'reads': [], 'errors': 0}
+		lock = threading.Lock()
+		stop = time.time() + options['seconds']
+		request = RequestFactory().get('/IPT2018/ranking')
+		request.user = User(is_staff=True)
+
+		def write(seed):
+			rnd = random.Random(seed)
+			try:
+				while time.time() < stop:
+					round = rnd.choice(rounds)
+					sheet = {round: [(jury, rnd.randint(1, 10), rnd.randint(1, 10), rnd.randint(1, 10)) for jury in sheets[round]]}
+					start = time.time()
+					try:
+						gradesheets.store(sheet)
+					except OperationalError:
+						with lock:
+							res['errors'] += 1
+						continue
+					with lock:
+						res['writes'].append(time.time() - start)
+			finally:
+				connections[DEFAULT_DB_ALIAS].close()
+
+		def read():
+			try:
+				while time.time() < stop:
+					start = time.time()
+					try:
+						views.ranking(request)
+					except OperationalError:
+						with lock:
+							res['errors'] += 1
+						continue
+					with lock:
+						res['reads'].append(time.time() - start)
+			finally:
+				connections[DEFAULT_DB_ALIAS].close()
+
+		threads = [threading.Thread(target=write, args=(1000 * options['seed'] + i,)) for i in range(options['writers'])]
+		threads += [threading.Thread(target=read) for i in range(options['readers'])]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return res
@@ -0,0 +1,39 @@
+# coding: utf8
+from django.core.management.base import BaseCommand, CommandError
+from django.apps import apps
+
+from ipt_connect import synthetic
+from ipt_connect.yearapps import year_apps
+
+
+class Command(BaseCommand):
+	help = "Generate a synthetic tournament for a year app, see ipt_connect/synthetic.py"
+
+	def add_arguments(self, parser):
+		parser.add_argument('app_label', help="The year app, e.g. IPT2018")
+		parser.add_argument('--teams', type=int, default=30, help="Number of teams (default 30)")
+		parser.add_argument('--participants', type=int, default=200, help="Number of participants, Team Leaders included (default 200)")
+		parser.add_argument('--jurors', type=int, default=60, help="Number of jurors (default 60)")
+		parser.add_argument('--problems', type=int, default=17, help="Number of problems (default 17)")
+		parser.add_argument('--seed', type=int, default=2018, help="Seed of the random generator (default 2018)")
+		parser.add_argument('--no-photos', action='store_false', dest='photos', help="Do not write the ID photos in MEDIA_ROOT")
+		parser.add_argument('--flush', action='store_true', help="Delete the tournament data of the app first")
+
+	def handle(self, *args, **options):
+		app_label = options['app_label']
+		if app_label not in year_apps:
+			raise CommandError("Unknown year app %s, choose among %s" % (app_label, ", ".join(year_apps)))
+
+		if options['flush']:
+			synthetic.flush(app_label)
+		elif apps.get_model(app_label, 'Round').objects.exists() or apps.get_model(app_label, 'Team').objects.exists():
+			raise CommandError("There already is a tournament in %s, use --flush to replace it" % app_label)
+
+		try:
+			counts = synthetic.generate(app_label, nteams=options['teams'], nparticipants=options['participants'], njurys=options['jurors'],
+				nproblems=options['problems'], seed=options['seed'], photos=options['photos'], verbose=options['verbosity'] > 1)
+		except ValueError as e:
+			raise CommandError(str(e))
+
+		for name in synthetic.tournament_models[::-1]:
+			self.stdout.write("%s: %i" % (name, counts[name]))
@@ -0,0 +1,62 @@
+# coding: utf8
+import os
+import shutil
+import tempfile
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.utils.six import StringIO
+
+from ipt_connect import schema
+
+
+# the contents created by migrate, the sessions: everybody logs in again, and the tables rebuilt from the rounds
+excluded = ['contenttypes', 'auth.permission', 'sessions'] + schema.derived_models
+
+# alias of the SQLite database during the import
+source_alias = 'import_sqlite'
+
+
+class Command(BaseCommand):
+	help = "Copy the data of a SQLite database of ipt_connect, e.g. db.sqlite3, into the database of the settings (the PostgreSQL one of production_settings), whose tables must already be created and empty. The SQLite database is left untouched: a copy of it is brought up to date first (see upgrade_schema), and the standings and scores are rebuilt from the rounds afterwards"
+
+	def add_arguments(self, parser):
+		parser.add_argument('path', help="The SQLite database")
+
+	def handle(self, *args, **options):
+		if not os.path.isfile(options['path']):
+			raise CommandError("No SQLite database at %s" % options['path'])
+		models = [model for model in apps.get_models() if not set([model._meta.label, model._meta.label_lower, model._meta.app_label]) & set(excluded)]
+		filled = [model._meta.label for model in models if model.objects.using(DEFAULT_DB_ALIAS).exists()]
+		if filled:
+			raise CommandError("The database already has %s: create the tables of an empty database with `migrate --run-syncdb`" % ", ".join(filled))
+
+		tmpdir = tempfile.mkdtemp()
+		try:
+			# a database of older models lacks tables and columns: they are added to a copy
+			source = os.path.join(tmpdir, 'source.sqlite3')
+			shutil.copy(options['path'], source)
+			connections.databases[source_alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': source}
+			for model, field in schema.upgrade(source_alias):
+				self.stdout.write("Upgraded the copy, %s: %s" % (model._meta.label, model._meta.db_table if field is None else field.column))
+
+			# the content types and permissions are referred to by their natural keys: their pks differ between the databases
+			fixture = os.path.join(tmpdir, 'tournament.json')
+			call_command('dumpdata', database=source_alias, natural_foreign=True, exclude=excluded, output=fixture, verbosity=0)
+			call_command('loaddata', fixture, database=DEFAULT_DB_ALIAS, stdout=self.stdout, verbosity=options['verbosity'])
+		finally:
+			if source_alias in connections.databases:
+				connections[source_alias].close()
+				del connections.databases[source_alias]
+			shutil.rmtree(tmpdir)
+
+		# the sequences of the pks go on after the pks copied
+		sql = StringIO()
+		call_command('sqlsequencereset', *set(model._meta.app_label for model in models), database=DEFAULT_DB_ALIAS, no_color=True, stdout=sql)
+		if sql.getvalue().strip():
+			with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+				cursor.execute(sql.getvalue())
+
+		# the standings, and the scores computed from the rounds
+		schema.rebuild()
@@ -0,0 +1,27 @@
+# coding: utf8
+from django.core.management.base import BaseCommand
+
+from ipt_connect import schema
+
+
+class Command(BaseCommand):
+	help = "Bring the tables of the year apps of an existing database up to date with their models: create the missing tables, add the missing columns, and rebuild the values they store from the rounds (the apps have no migrations, syncdb never adds a column), see ipt_connect/schema.py"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--dry-run', action='store_true', help="Only tell what is missing")
+
+	def handle(self, *args, **options):
+		changes = schema.missing() if options['dry_run'] else schema.upgrade()
+		for model, field in changes:
+			if field is None:
+				self.stdout.write("%s: table %s" % (model._meta.label, model._meta.db_table))
+			else:
+				self.stdout.write("%s: column %s" % (model._meta.label, field.column))
+
+		if changes and not options['dry_run']:
+			app_labels = sorted(set(model._meta.app_label for model, field in changes) & set(schema.rebuilders))
+			schema.rebuild(app_labels)
+			if app_labels:
+				self.stdout.write("Rebuilt from the rounds: %s" % ", ".join(app_labels))
+
+		self.stdout.write("%i tables and columns %s" % (len(changes), "missing" if options['dry_run'] else "added"))
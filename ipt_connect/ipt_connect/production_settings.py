@@ -0,0 +1,66 @@
+"""
+Production settings of ipt_connect: PostgreSQL with persistent connections, possibly through a connection pooler, and a cache shared by all the workers.
+
+With SQLite, a single process writes at a time: when several rooms enter their grades together, every save waits for the others. PostgreSQL lets them write concurrently.
+
+Selected with DJANGO_SETTINGS_MODULE=ipt_connect.production_settings, and configured with environment variables:
+	IPT_SECRET_KEY: required.
+	IPT_ALLOWED_HOSTS: the host names served, separated by commas.
+	IPT_DEBUG: 1 to turn the debug mode on. Default off.
+	IPT_DB_ENGINE: default 'django.db.backends.postgresql' (psycopg2 is required, see requirements-production.txt). Another engine, e.g. 'django.db.backends.sqlite3', stands in for PostgreSQL to try the profile locally.
+	IPT_DB_NAME, IPT_DB_USER, IPT_DB_PASSWORD, IPT_DB_HOST, IPT_DB_PORT: the database. Default database ipt_connect on the local server.
+	IPT_DB_CONN_MAX_AGE: seconds a connection is kept open for the next requests of its worker. Default 600.
+	IPT_DB_POOLER: 'pgbouncer' when the database is reached through PgBouncer in transaction pooling mode. Default none.
+	IPT_CACHE_BACKEND, IPT_CACHE_LOCATION: the cache. Default a table of the database, created with `python manage.py createcachetable`.
+
+See the README for moving a tournament from SQLite (import_sqlite).
+"""
+import os
+from django.core.exceptions import ImproperlyConfigured
+from settings import *
+
+
+def env(name, default=None):
+	return os.environ.get('IPT_' + name, default)
+
+
+if not env('SECRET_KEY'):
+	raise ImproperlyConfigured("IPT_SECRET_KEY must be set in the production profile")
+SECRET_KEY = env('SECRET_KEY')
+
+DEBUG = env('DEBUG') == '1'
+
+ALLOWED_HOSTS = [host.strip() for host in env('ALLOWED_HOSTS', '127.0.0.1').split(',') if host.strip()]
+
+
+DATABASES = {
+	'default': {
+		'ENGINE': env('DB_ENGINE', 'django.db.backends.postgresql'),
+		'NAME': env('DB_NAME', 'ipt_connect'),
+		'USER': env('DB_USER', ''),
+		'PASSWORD': env('DB_PASSWORD', ''),
+		'HOST': env('DB_HOST', ''),
+		'PORT': env('DB_PORT', ''),
+		# every worker, thread of the task pool included, keeps its connection instead of opening one per request
+		'CONN_MAX_AGE': int(env('DB_CONN_MAX_AGE', '600')),
+	}
+}
+
+if env('DB_POOLER') == 'pgbouncer':
+	# in transaction pooling, the cursors of a server-side iteration could end up on another server connection.
+	# The time zone of the connections is not set by Django either if the database one is UTC: set it with ALTER ROLE ... SET timezone TO 'UTC'.
+	DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+elif env('DB_POOLER'):
+	raise ImproperlyConfigured("Unknown IPT_DB_POOLER %s, the only one supported is pgbouncer" % env('DB_POOLER'))
+
+
+# the file-based cache of the default settings is only shared by the workers of a machine, the database is shared by all of them
+CACHES = {
+	'default': {
+		'BACKEND': env('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+		'LOCATION': env('CACHE_LOCATION', 'ipt_cache'),
+		'OPTIONS': {
+			'MAX_ENTRIES': 10000,
+		},
+	}
+}
@@ -0,0 +1,69 @@
+# coding: utf8
+"""
+Schema of the year apps on a database created before their latest models.
+
+The apps have no migrations: syncdb (`migrate --run-syncdb`) only creates the tables which do not exist, never the columns a table lacks. upgrade() creates the missing tables and adds the missing columns, with their default values. The values stored in the new columns and tables are then rebuilt from the rounds, see rebuild.
+"""
+from importlib import import_module
+from django.apps import apps
+from django.db import connections, DEFAULT_DB_ALIAS
+from ipt_connect.yearapps import year_apps
+
+
+# the tables rebuilt from the rounds, or transient: they are not copied from a database to another, see import_sqlite
+derived_models = ['FPT2017.FightStanding', 'IPT2018.FightStanding', 'IPT2018.Task']
+
+# the functions rebuilding the aggregates and the derived tables of an app from its rounds
+rebuilders = {
+	'FPT2017': ('FPT2017.models', 'update_all'),
+	'IPT2018': ('IPT2018.propagation', 'bulk_recompute'),
+}
+
+
+def missing(alias=DEFAULT_DB_ALIAS):
+	"""
+	:param alias: the database
+	:return: list of (model, None) for the missing tables, and (model, field) for the missing columns of the existing ones
+	"""
+	connection = connections[alias]
+	res = []
+	with connection.cursor() as cursor:
+		tables = set(connection.introspection.table_names(cursor))
+		for app_label in year_apps:
+			for model in apps.get_app_config(app_label).get_models():
+				if model._meta.db_table not in tables:
+					res.append((model, None))
+					continue
+				columns = set(column.name for column in connection.introspection.get_table_description(cursor, model._meta.db_table))
+				res += [(model, field) for field in model._meta.local_concrete_fields if field.column not in columns]
+	return res
+
+
+def upgrade(alias=DEFAULT_DB_ALIAS):
+	"""
+	Create the missing tables and add the missing columns.
+
+	:param alias: the database
+	:return: the changes made, see missing
+	"""
+	changes = missing(alias)
+	if changes:
+		with connections[alias].schema_editor() as editor:
+			for model, field in changes:
+				if field is None:
+					editor.create_model(model)
+				else:
+					editor.add_field(model, field)
+	return changes
+
+
+def rebuild(app_labels=None):
+	"""
+	Rebuild the aggregates and the derived tables of some year apps from their rounds, in the default database.
+
+	:param app_labels: the year apps, all those with something to rebuild by default
+	"""
+	for app_label in sorted(rebuilders) if app_labels is None else app_labels:
+		if app_label in rebuilders:
+			module, function = rebuilders[app_label]
+			getattr(import_module(module), function)()
@@ -0,0 +1,177 @@
+# coding: utf8
+"""
+Scoring of the jury grades, shared by all the tournaments.
+
+In a round, every jury member grades the Reporter, the Opponent and the Reviewer: the grades of a round form a (jurors x roles) matrix. The score of a role is the mean of its column, once some of the lowest and highest grades are discarded.
+
+How many grades are discarded changes from one tournament to another, and is described by a rejection rule. A rule is a dictionary with either:
+
+* "drops": a list of (minimum number of grades, number of lowest grades discarded, number of highest grades discarded), the last matching entry is used;
+* "nreject": a table {number of grades: number of discarded grades} for the special cases, and "fraction": the fraction of the grades discarded otherwise (rounded, X.5 being rounded up). The discarded grades are split between the lowest and the highest ones, with the extra one taken from the lowest.
+"""
+import math
+import numpy as np
+
+
+# IPT rule: divide the number of jury by 4, round the result, and reject as many lowest and highest grades
+# Example : 7 jury members --> /4 = 1.75 --> round = 2 --> reject 1 highest and 1 lowest marks
+IPT_RULE = {"nreject": {5: 1, 6: 1, 7: 2, 8: 2}, "fraction": 0.25}
+
+# FPT rule: remove the lowest grade, and the highest one too if there are 7 or more jury members
+FPT_RULE = {"drops": [(0, 1, 0), (7, 1, 1)]}
+
+
+def discarded(rule, ngrades):
+	"""
+	:param rule: a rejection rule
+	:param ngrades: number of grades given to a role
+	:return: a tuple (number of lowest grades discarded, number of highest grades discarded)
+	"""
+	if "drops" in rule:
+		nlow, nhigh = 0, 0
+		for minimum, low, high in rule["drops"]:
+			if ngrades >= minimum:
+				nlow, nhigh = low, high
+		return nlow, nhigh
+
+	if ngrades in rule["nreject"]:
+		nreject = rule["nreject"][ngrades]
+	else:
+		nreject = int(math.floor(ngrades * rule["fraction"] + 0.5))
+	return (nreject + 1) // 2, nreject // 2
+
+
+def _trimmed_means(grades, rule):
+	"""
+	:param grades: numpy array (rounds x jurors x roles), all the rounds having the same number of jurors
+	:param rule: a rejection rule
+	:return: numpy array (rounds x roles) of the means of the remaining grades, 0 if none remains
+	"""
+	nrounds, ngrades, nroles = grades.shape
+	nlow, nhigh = discarded(rule, ngrades)
+	if nlow + nhigh >= ngrades:
+		return np.zeros((nrounds, nroles))
+	kept = np.sort(grades, axis=1)[:, nlow:ngrades-nhigh, :]
+	return kept.mean(axis=1)
+
+
+def trimmed_means(grades, rule=IPT_RULE):
+	"""
+	Score one round.
+
+	:param grades: the grades of the round, one (reporter, opponent, reviewer) row per jury member
+	:param rule: the rejection rule of the tournament
+	:return: a tuple with the scores of the reporter, the opponent and the reviewer
+	"""
+	grades = np.asarray(grades, dtype=float)
+	if grades.size == 0:
+		return (0.0, 0.0, 0.0)
+	return tuple(float(score) for score in _trimmed_means(grades[np.newaxis], rule)[0])
+
+
+def trimmed_mean(grades, rule=IPT_RULE):
+	"""
+	Score one role in one round.
+
+	:param grades: list of the grades given to the role
+	:param rule: the rejection rule of the tournament
+	:return: the mean of the remaining grades
+	"""
+	if len(grades) == 0:
+		return 0.0
+	return trimmed_means([[grade] for grade in grades], rule)[0]
+
+
+def score_rounds(roundgrades, rule=IPT_RULE):
+	"""
+	Score many rounds at once. The rounds are grouped by number of jury members, and every group is scored with a single sort.
+
+	:param roundgrades: dictionary {round: grades of the round, one (reporter, opponent, reviewer) row per jury member}
+	:param rule: the rejection rule of the tournament
+	:return: dictionary {round: (score_reporter, score_opponent, score_reviewer)}
+	"""
+	groups = {}
+	for key, grades in roundgrades.items():
+		groups.setdefault(len(grades), []).append(key)
+
+	scores = {}
+	for ngrades, keys in groups.items():
+		if ngrades == 0:
+			for key in keys:
+				scores[key] = (0.0, 0.0, 0.0)
+			continue
+		means = _trimmed_means(np.array([roundgrades[key] for key in keys], dtype=float), rule)
+		for key, row in zip(keys, means):
+			scores[key] = tuple(float(score) for score in row)
+	return scores
+
+
+# bonus points of the first, second and third teams of a physics fight
+BONUS_BY_RANK = (2.0, 1.0, 0.0)
+
+
+def fight_ranks(points, bonus_by_rank=BONUS_BY_RANK, precision=6):
+	"""
+	Rank the teams of a physics fight, and share the bonus points.
+
+	Ex-aequo teams get the same rank, and share equally the bonus points of the places they take: with (2, 1, 0), two teams first ex-aequo get 1.5 each, two teams second ex-aequo 0.5 each and three teams ex-aequo 1 each. The places after the last of bonus_by_rank give no bonus point.
+
+	:param points: dictionary {team: points gathered in the fight}
+	:param bonus_by_rank: bonus points of the first, second... places
+	:param precision: number of decimals kept when comparing the points, so that rounding errors do not split ex-aequos
+	:return: dictionary {team: (rank, bonus points)}
+	"""
+	bonus_by_rank = list(bonus_by_rank) + [0.0] * max(0, len(points) - len(bonus_by_rank))
+	rounded = dict((team, round(value, precision)) for team, value in points.items())
+
+	res = {}
+	for team, value in rounded.items():
+		rank = 1 + len([other for other in rounded.values() if other > value])
+		nexaequo = len([other for other in rounded.values() if other == value])
+		res[team] = (rank, sum(bonus_by_rank[rank-1:rank-1+nexaequo]) / float(nexaequo))
+	return res
+
+
+# bonus rules: the bonus points by rank of a fight, from its number of teams, once all its rounds are played
+def podium_bonus(nteams):
+	"""
+	FPT rule: the podium of every fight gets bonus points.
+	"""
+	return BONUS_BY_RANK
+
+
+def three_team_bonus(nteams):
+	"""
+	IPT rule: only the three-team fights give bonus points, those of the four-team fights are attributed by hand.
+	"""
+	return BONUS_BY_RANK if nteams == 3 else ()
+
+
+# values of a round the fight standings depend on
+standing_values = ['pf_number', 'room', 'reporter_team', 'opponent_team', 'reviewer_team', 'points_reporter', 'points_opponent', 'points_reviewer']
+
+
+def fight_standings(rounds, bonus_rule=three_team_bonus):
+	"""
+	Compute the points, ranks and bonus points of the teams in some Physics Fights. A fight is complete when it has as many rounds as teams, every team reporting once, and gives no bonus point before.
+
+	:param rounds: the rounds of the fights, as dictionaries with the standing_values
+	:param bonus_rule: function giving the bonus points by rank of a complete fight from its number of teams
+	:return: list of dictionaries with the fields of a FightStanding: team_id, pf_number, room_id, points, rank, bonus_points and complete
+	"""
+	fights = {}
+	for round in rounds:
+		fight = fights.setdefault((round['pf_number'], round['room']), {'nrounds': 0, 'points': {}})
+		fight['nrounds'] += 1
+		for role in ('reporter', 'opponent', 'reviewer'):
+			team = round[role+'_team']
+			if team is not None:
+				fight['points'][team] = fight['points'].get(team, 0.0) + round['points_'+role]
+
+	standings = []
+	for (pf, room), fight in sorted(fights.items()):
+		complete = fight['nrounds'] == len(fight['points'])
+		bonus_by_rank = bonus_rule(len(fight['points'])) if complete else ()
+		for team, (rank, bonus) in sorted(fight_ranks(fight['points'], bonus_by_rank).items()):
+			standings.append({'team_id': team, 'pf_number': pf, 'room_id': room, 'points': fight['points'][team], 'rank': rank, 'bonus_points': bonus, 'complete': complete})
+	return standings
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -43,6 +44,7 @@ INSTALLED_APPS = (
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'ipt_connect',
     'IPT2016',
 	'FPT2017',
 	'IPT2017',
@@ -111,6 +113,10 @@ DATABASES = {
     }
 }
 
+# Write-ahead log, busy timeout, page cache and memory-mapped I/O for the SQLite database, so that the pages
+# are not kept waiting while the grades are saved (see ipt_connect/sqlitetuning.py)
+IPT_SQLITE_TUNING = False
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -134,8 +140,24 @@ STATIC_ROOT = os.path.join('', 'static')
 MEDIA_ROOT = os.path.join(os.getcwd(), 'media/')
 MEDIA_URL = '/media/'
 
+# The cache must be shared by all the worker processes: the tournament pages are cached until the data
+# changes (see IPT2018/rendercache.py), and a change seen by one worker must reach all the others.
+# A database cache works as well: 'django.core.cache.backends.db.DatabaseCache' (run createcachetable first)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
+
+# The tests never use the cache of the project, which a tournament would then serve. They override CACHES too,
+# but the cache_page decorators take their cache when the views are imported, before any override.
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
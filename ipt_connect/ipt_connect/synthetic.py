@@ -0,0 +1,260 @@
+# coding: utf8
+"""
+Synthetic tournaments, for the benchmarks and the load tests.
+
+A tournament is generated for any of the year apps (IPT2016, FPT2017, IPT2017, IPT2018): the teams and their participants, the rooms, the jurors, the schedule of every Physics Fight, the problems presented (following the rules of Round.unavailable_problems), the tactical and eternal rejections and the jury grades. Everything is drawn from a seeded random generator, so that the same parameters always give the same tournament, and inserted in bulk.
+
+The qualifying fights (the first four) gather all the teams, three or four per room. The IPT2018 semi-final (its fifth fight) gathers six teams in two rooms, and the final three teams.
+"""
+import os
+import random
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from ipt_connect import api
+from ipt_connect.yearapps import fields
+
+
+# order in which the tournament data can be deleted
+tournament_models = ['JuryGrade', 'TacticalRejection', 'EternalRejection', 'Round', 'Jury', 'Participant', 'Team', 'Room', 'Problem']
+
+
+def build(model, rnd, **values):
+	"""
+	Build an instance of a model from the values of the fields it has, the other values being dropped. The required fields left empty are filled with a random choice, or a placeholder.
+
+	:param model: a model class
+	:param rnd: random generator
+	:return: the instance, not saved
+	"""
+	values = dict((key, value) for key, value in values.items() if key in fields(model))
+	for field in model._meta.concrete_fields:
+		if field.name in values or field.primary_key or field.null or field.blank or field.has_default():
+			continue
+		if field.choices:
+			values[field.name] = rnd.choice(field.choices)[0]
+		elif isinstance(field, models.EmailField):
+			values[field.name] = 'synthetic@example.org'
+		elif isinstance(field, models.CharField):
+			values[field.name] = 'XXX'
+	return model(**values)
+
+
+def choose_problem(problems, presented_this_pf, bans):
+	"""
+	Choose the problem challenged by the Opponent.
+
+	:param problems: list of all the problems
+	:param presented_this_pf: problems already presented in this fight, in this room
+	:param bans: list of the sets of problems a), b), c) and d) of Round.unavailable_problems. If no problem is left, the bans d), c), b), a) are successively removed, in that order.
+	:return: list of the problems the Opponent may challenge
+	"""
+	bans = list(bans)
+	while True:
+		banned = set(presented_this_pf).union(*bans)
+		available = [problem for problem in problems if problem not in banned]
+		if available or not bans:
+			return available or list(problems)
+		bans.pop()
+
+
+def schedule(teams, nrooms, rnd):
+	"""
+	Spread the teams in the rooms of a fight.
+
+	:return: list of the lists of teams of every room, three or four teams per room
+	"""
+	teams = rnd.sample(teams, len(teams))
+	sizes = [3] * nrooms
+	for ind in range(len(teams) - 3*nrooms):
+		sizes[ind] += 1
+	res = []
+	for size in sizes:
+		res.append(teams[:size])
+		teams = teams[size:]
+	return res
+
+
+def write_photo(path, color):
+	"""
+	Write a small placeholder ID photo, unless it already exists.
+
+	:param path: path of the photo, relative to MEDIA_ROOT
+	:param color: (red, green, blue) color of the photo
+	"""
+	from PIL import Image
+
+	path = os.path.join(settings.MEDIA_ROOT, path)
+	if os.path.exists(path):
+		return
+	if not os.path.isdir(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
+	Image.new('RGB', (60, 80), color).save(path, 'JPEG')
+
+
+def flush(app_label):
+	"""
+	Delete all the tournament data of a year app.
+	"""
+	with transaction.atomic():
+		for name in tournament_models:
+			apps.get_model(app_label, name).objects.all().delete()
+
+
+def score(app_label, verbose=False):
+	"""
+	Compute the scores of the rounds, teams, participants and problems of a tournament inserted in bulk, as the update_all view of the app does.
+	"""
+	module = apps.get_app_config(app_label).module
+	Round = apps.get_model(app_label, 'Round')
+
+	if app_label == 'IPT2018':
+		from IPT2018 import propagation
+		propagation.bulk_recompute(verbose=verbose)
+		return
+
+	if 'score_reporter' not in fields(Round):
+		# the scores are computed on the fly
+		return
+
+	# the scores of the rounds are computed when they are saved, and those of the teams by their signals
+	for round in Round.objects.order_by('pf_number', 'round_number', 'pk'):
+		round.save()
+
+	# the bonus points are added as update_all adds them, update_all itself would delete the grades of the fights it does not know as phantom ones
+	models_module = __import__('%s.models' % module.__name__, fromlist=['models'])
+	if hasattr(models_module, 'bonuspoints'):
+		bonus = models_module.bonuspoints()
+		for team in apps.get_model(app_label, 'Team').objects.all():
+			team.total_points += bonus.get(team, 0.0)
+			team.save()
+
+
+def generate(app_label, nteams=30, nparticipants=200, njurys=60, nproblems=17, jury_size=(5, 8), availability=0.85, seed=2018, photos=True, verbose=False):
+	"""
+	Generate a tournament for a year app. Its database tables must be empty, see flush.
+
+	:param app_label: the year app, e.g. 'IPT2018'
+	:param nteams: number of teams, at least 6
+	:param nparticipants: number of participants, Team Leaders included, at least three per team
+	:param njurys: number of jurors
+	:param nproblems: number of problems
+	:param jury_size: (minimum, maximum) number of jurors in a room
+	:param availability: probability that a juror is available for a fight
+	:param seed: seed of the random generator
+	:param photos: write a placeholder ID photo for every participant in MEDIA_ROOT (the paths are set anyway)
+	:param verbose: verbosity flag
+	:return: dictionary {model name: number of instances created}
+	"""
+	if nteams < 6:
+		raise ValueError("At least 6 teams are needed for the semi-finals and the final")
+	if nparticipants < 3 * nteams:
+		raise ValueError("At least three participants per team are needed: a Team Captain, a Team Leader and a Team Member")
+
+	rnd = random.Random(seed)
+	module = __import__('%s.models' % apps.get_app_config(app_label).module.__name__, fromlist=['models'])
+	Team, Participant, Jury, Room, Problem, Round, JuryGrade, TacticalRejection, EternalRejection = [apps.get_model(app_label, name) for name in ['Team', 'Participant', 'Jury', 'Room', 'Problem', 'Round', 'JuryGrade', 'TacticalRejection', 'EternalRejection']]
+
+	npf = getattr(module, 'npf', 4)
+	with_final_pf = getattr(module, 'with_final_pf', True)
+	nreject_max = getattr(module, 'npfreject_max', 3)
+	max_round_number = max(key for key, label in Round._meta.get_field('round_number').choices)
+	nrooms = nteams // 3
+	if nteams > nrooms * max_round_number:
+		raise ValueError("%s has at most %i rounds per fight, the teams cannot fit in %i rooms" % (app_label, max_round_number, nrooms))
+
+	with transaction.atomic():
+		# teams, participants, jurors, rooms and problems
+		Team.objects.bulk_create([build(Team, rnd, name='Team %02i' % (ind+1), pool='AB'[ind % 2]) for ind in range(nteams)])
+		teams = list(Team.objects.order_by('pk'))
+
+		photo_dir = Participant._meta.get_field('photo').upload_to.sub_path if 'photo' in fields(Participant) else None
+		participants = []
+		for ind in range(nparticipants):
+			team = teams[ind % nteams]
+			role = {0: 'TC', 1: 'TL'}.get(ind // nteams, 'TM')
+			photo = os.path.join(photo_dir, 'synthetic_%i.jpg' % ind) if photo_dir else None
+			if photo and photos:
+				write_photo(photo, (37*ind % 256, 101*ind % 256, 173*ind % 256))
+			participants.append(build(Participant, rnd, name='Participant %i' % ind, surname=team.name, team=team, role=role, email='participant%i@example.org' % ind, photo=photo))
+		Participant.objects.bulk_create(participants)
+
+		pf_fields = ['pf%i' % pf for pf in range(1, npf+1)] + ['final']
+		Jury.objects.bulk_create([build(Jury, rnd, name='Juror %i' % ind, surname='Surname %i' % ind, **dict((field, rnd.random() < availability) for field in pf_fields)) for ind in range(njurys)])
+		Room.objects.bulk_create([build(Room, rnd, name='Room %02i' % (ind+1)) for ind in range(nrooms)])
+		Problem.objects.bulk_create([build(Problem, rnd, name='Problem %i' % (ind+1), description='Synthetic problem %i' % (ind+1)) for ind in range(nproblems)])
+
+		students = {}
+		for participant in Participant.objects.exclude(role='TL').order_by('pk'):
+			students.setdefault(participant.team_id, []).append(participant)
+		jurys = list(Jury.objects.order_by('pk'))
+		rooms = list(Room.objects.order_by('pk'))
+		problems = list(Problem.objects.order_by('pk'))
+
+		# strength of the teams and harshness of the jurors, for the grades to look like real ones
+		strength = dict((team.pk, rnd.gauss(6.0, 1.0)) for team in teams)
+		harshness = dict((jury.pk, rnd.gauss(0.0, 0.7)) for jury in jurys)
+
+		fights = [(pf, teams) for pf in range(1, min(npf, 4)+1)]
+		if npf > 4:
+			semiteams = rnd.sample(teams, 6)
+			fights += [(pf, semiteams) for pf in range(5, npf+1)]
+			if 'is_in_semi' in fields(Team):
+				Team.objects.filter(pk__in=[team.pk for team in semiteams]).update(is_in_semi=True)
+		if with_final_pf:
+			fights.append((npf+1, rnd.sample(teams, 3)))
+
+		# the schedule, and the problems presented and rejected
+		eternal, presented, opposed = [dict((team.pk, set()) for team in teams) for ind in range(3)]
+		rounds, panels, rejections = [], [], []
+		for pf, fightteams in fights:
+			pfrooms = schedule(fightteams, len(fightteams) // 3, rnd)
+			available_jurys = [jury for jury in jurys if getattr(jury, 'pf%i' % pf, getattr(jury, 'final', True))]
+			rnd.shuffle(available_jurys)
+			for room, roomteams in zip(rooms, pfrooms):
+				size = rnd.randint(*jury_size)
+				panel, available_jurys = available_jurys[:size], available_jurys[size:]
+				if len(panel) < jury_size[0]:
+					panel = rnd.sample(jurys, jury_size[0])
+				presented_this_pf = set()
+				for rn in range(len(roomteams)):
+					reporter, opponent, reviewer = [roomteams[(rn+shift) % len(roomteams)] for shift in range(3)]
+					challenged = choose_problem(problems, presented_this_pf, [eternal[reporter.pk], presented[reporter.pk], opposed[opponent.pk], presented[opponent.pk]])
+					rnd.shuffle(challenged)
+					nrejected = min(rnd.choice([0, 0, 0, 1, 1, 2, nreject_max+1]), len(challenged)-1)
+					tactical, problem = challenged[:nrejected], challenged[nrejected]
+					etern = [challenged[nrejected+1]] if rnd.random() < 0.05 and len(challenged) > nrejected+1 else []
+
+					presented_this_pf.add(problem)
+					presented[reporter.pk].add(problem)
+					opposed[opponent.pk].add(problem)
+					eternal[reporter.pk].update(etern)
+
+					rounds.append(build(Round, rnd, pf_number=pf, round_number=rn+1, room=room, problem_presented=problem,
+						reporter_team=reporter, opponent_team=opponent, reviewer_team=reviewer,
+						reporter=rnd.choice(students[reporter.pk]), opponent=rnd.choice(students[opponent.pk]), reviewer=rnd.choice(students[reviewer.pk])))
+					panels.append(panel)
+					rejections.append((tactical, etern))
+		Round.objects.bulk_create(rounds)
+		rounds = list(Round.objects.order_by('pk'))
+
+		# the jury grades
+		def grade(team, jury, offset):
+			return max(1, min(10, int(round(strength[team.pk] + offset + harshness[jury.pk] + rnd.gauss(0.0, 1.0)))))
+
+		grades, tacticals, eternals = [], [], []
+		for rd, panel, (tactical, etern) in zip(rounds, panels, rejections):
+			for jury in panel:
+				grades.append(JuryGrade(round=rd, jury=jury, grade_reporter=grade(rd.reporter_team, jury, 0.5), grade_opponent=grade(rd.opponent_team, jury, 0.0), grade_reviewer=grade(rd.reviewer_team, jury, -0.5)))
+			tacticals.extend(TacticalRejection(round=rd, problem=problem) for problem in tactical)
+			eternals.extend(EternalRejection(round=rd, problem=problem) for problem in etern)
+		JuryGrade.objects.bulk_create(grades)
+		TacticalRejection.objects.bulk_create(tacticals)
+		EternalRejection.objects.bulk_create(eternals)
+
+		score(app_label, verbose=verbose)
+
+		# the bulk inserts do not send any signal: the pages and coefficients cached before are left behind
+		transaction.on_commit(lambda: api.bump_version(app_label))
+
+	return dict((name, apps.get_model(app_label, name).objects.count()) for name in reversed(tournament_models))
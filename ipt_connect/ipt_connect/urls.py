@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.views.generic import TemplateView
 from ipt_connect.views import home
 from IPT2018.views import tournament_overview
+from ipt_connect import api
 
 urlpatterns = [
     # Examples:
@@ -18,6 +19,9 @@ urlpatterns = [
     url(r'^FPT2017/', include('FPT2017.urls', namespace='FPT2017')),
 	url(r'^IPT2017/', include('IPT2017.urls', namespace='IPT2017')),
 	url(r'^IPT2018/', include('IPT2018.urls', namespace='IPT2018')),
+	url(r'^api/v1/$', api.index, name='api_index'),
+	url(r'^api/v1/(?P<app_label>%s)/$' % '|'.join(api.year_apps), api.tournament, name='api_tournament'),
+	url(r'^api/v1/(?P<app_label>%s)/(?P<resource>%s)$' % ('|'.join(api.year_apps), '|'.join(api.resources)), api.resource, name='api_resource'),
 ]
 
 
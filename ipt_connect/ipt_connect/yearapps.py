@@ -0,0 +1,15 @@
+# coding: utf8
+"""
+The year apps, one per tournament, and what the code shared by all of them needs to know about their models.
+"""
+
+
+# the year apps, in chronological order
+year_apps = ['IPT2016', 'FPT2017', 'IPT2017', 'IPT2018']
+
+
+def fields(model):
+	"""
+	:return: the names of the concrete fields of a model
+	"""
+	return set(field.name for field in model._meta.concrete_fields)